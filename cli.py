@@ -0,0 +1,196 @@
+"""
+cli.py — processamento sem interface (servidor, cron, agendador de tarefas).
+Execute: python cli.py ingest <arquivos ou pastas> [--workers N] [--out PASTA]
+
+Mesmo caminho do botão "Selecionar XMLs" + "Sincronizar Tudo": abre uma
+sessão, roda o pipeline (core/pipeline.py — extratores em paralelo, dedup e
+gravação no merge), publica no histórico principal e atualiza os Excels.
+Nada de tkinter/customtkinter é importado.
+
+Códigos de saída:
+  0  tudo processado e sincronizado
+  1  falha (sessão, pipeline ou sincronização)
+  2  uso inválido / nenhum XML encontrado
+  3  processado e sincronizado, mas algum XML deu erro de leitura
+  4  outra sessão ativa (use --forcar)
+  130 interrompido (Ctrl+C)
+"""
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+OK, FALHA, USO, ERROS_XML, SESSAO_ATIVA, INTERROMPIDO = 0, 1, 2, 3, 4, 130
+
+# Linha de progresso no terminal/log do cron a cada INTERVALO_PROGRESSO segundos
+INTERVALO_PROGRESSO = 5.0
+
+
+def _argumentos(argv):
+    p = argparse.ArgumentParser(prog="cli.py", description="Leitor NF-e / NFS-e sem interface.")
+    sub = p.add_subparsers(dest="comando", required=True)
+    i = sub.add_parser("ingest", help="processa XMLs e sincroniza com o histórico principal")
+    i.add_argument("caminhos", nargs="+", help="arquivos .xml ou pastas (varridas recursivamente)")
+    i.add_argument("--workers", type=int, default=None,
+                   help="processos extratores (padrão: WORKERS_EXTRACAO em settings.py)")
+    i.add_argument("--out", default=None,
+                   help="pasta do histórico/Excel principal (padrão: pasta do projeto)")
+    i.add_argument("--sem-excel", action="store_true", help="não regera os Excels do principal")
+    i.add_argument("--forcar", action="store_true", help="processa mesmo com outra sessão ativa")
+    i.add_argument("-v", "--detalhado", action="store_true", help="uma linha por arquivo")
+    a = p.parse_args(argv)
+    if a.workers is not None and a.workers < 1:
+        p.error("--workers precisa ser >= 1")
+    return a
+
+def _listar_xmls(caminhos):
+    """Arquivos na ordem dada; pastas em ordem alfabética. (arquivos, caminhos inexistentes)"""
+    arquivos, faltando = [], []
+    for c in caminhos:
+        if os.path.isfile(c):
+            arquivos.append(os.path.abspath(c))
+        elif os.path.isdir(c):
+            for raiz, dirs, nomes in os.walk(c):
+                dirs.sort()
+                arquivos += [os.path.abspath(os.path.join(raiz, n))
+                             for n in sorted(nomes) if n.lower().endswith(".xml")]
+        else:
+            faltando.append(c)
+    return list(dict.fromkeys(arquivos)), faltando
+
+def _tamanho(arquivos):
+    total = 0
+    for a in arquivos:
+        try: total += os.path.getsize(a)
+        except OSError: pass
+    return total
+
+
+def ingest(a):
+    arquivos, faltando = _listar_xmls(a.caminhos)
+    for c in faltando:
+        print(f"Caminho não encontrado: {c}", file=sys.stderr)
+    if faltando or not arquivos:
+        if not arquivos: print("Nenhum XML encontrado.", file=sys.stderr)
+        return USO
+
+    # A pasta precisa estar no ambiente antes de config.settings ser importado
+    # (e é herdada pelos processos do pipeline)
+    if a.out:
+        os.makedirs(a.out, exist_ok=True)
+        os.environ["LEITOR_XML_PASTA"] = os.path.abspath(a.out)
+
+    try:
+        import multiprocessing as mp
+        import config.settings as cfg
+        from core.pipeline import iniciar_processamento
+        from transform import carregar_chaves_existentes
+        from load import (
+            inicializar_sessao, verificar_locks_ativos, carregar_chaves_nfse, total_registros,
+            sincronizar_com_principal, sincronizar_nfse_com_principal,
+            atualizar_excel_principal, atualizar_excel_nfse_principal,
+        )
+    except ImportError as e:
+        print(f"Dependência ausente: {e}", file=sys.stderr)
+        print("Instale com:  pip install pandas openpyxl", file=sys.stderr)
+        return FALHA
+
+    locks = verificar_locks_ativos()
+    if locks and not a.forcar:
+        print(f"{len(locks)} sessão(ões) ativa(s) em {cfg.TEMP_DIR} — use --forcar para continuar.",
+              file=sys.stderr)
+        return SESSAO_ATIVA
+    if not inicializar_sessao():
+        print("Não foi possível inicializar sessão!", file=sys.stderr)
+        return FALHA
+
+    total, mb = len(arquivos), _tamanho(arquivos) / 1e6
+    print(f"Arquivos: {total}  ({mb:.1f} MB)   Pasta: {cfg.PASTA_BASE}")
+
+    chaves = (carregar_chaves_existentes(cfg.CSV_TEMP).compartilhar(), carregar_chaves_nfse().compartilhar())
+    fila = mp.Queue()
+    inicio = time.monotonic()
+    proc, extratores = iniciar_processamento(
+        arquivos, cfg.CSV_TEMP, cfg.CSV_NFSE_TEMP, cfg.CABECALHO_CSV, cfg.CABECALHO_NFSE,
+        chaves[0], chaves[1], fila, workers=a.workers,
+    )
+    print(f"Extratores paralelos: {len(extratores)}")
+
+    fim = None; mostrado = inicio
+    try:
+        while fim is None:
+            try:
+                evento = fila.get(timeout=0.5)
+            except Exception:
+                if not proc.is_alive():
+                    break   # merge morreu sem mandar "fim"
+                continue
+            if evento[0] == "resumo":
+                _, linhas, i, tot, cnt_nfe, cnt_nfse = evento
+                for nivel, msg in linhas:
+                    if nivel == "err":
+                        print(msg.strip(), file=sys.stderr)
+                    elif a.detalhado:
+                        print(msg)
+                agora = time.monotonic()
+                if not a.detalhado and agora - mostrado >= INTERVALO_PROGRESSO:
+                    print(f"  {i}/{tot}  ({i / tot * 100:.0f}%)  NF-e: {cnt_nfe}  NFS-e: {cnt_nfse}"
+                          f"  {i / (agora - inicio):.0f} arq/s", flush=True)
+                    mostrado = agora
+            elif evento[0] == "fim":
+                fim = evento[1:]
+        proc.join()
+        for p in extratores:
+            p.join()
+    except KeyboardInterrupt:
+        for p in [proc] + extratores:
+            if p.is_alive():
+                p.terminate(); p.join(timeout=2)
+        print("Interrompido — sessão descartada.", file=sys.stderr)
+        return INTERROMPIDO
+    finally:
+        for c in chaves:
+            c.liberar()
+
+    if fim is None:
+        print(f"Pipeline encerrado sem concluir (código {proc.exitcode}).", file=sys.stderr)
+        return FALHA
+    cnt_nfe, cnt_nfse, add_nfe, add_nfse, err_nfe, err_nfse = fim
+    seg = max(time.monotonic() - inicio, 1e-9)
+
+    print(f"Arquivos: {total}  (NF-e: {cnt_nfe}  NFS-e: {cnt_nfse})")
+    if err_nfe or err_nfse:
+        print(f"Erros: NF-e={err_nfe}  NFS-e={err_nfse}", file=sys.stderr)
+    print(f"NF-e adicionados  : {add_nfe} produtos  (total sessão: {total_registros(cfg.CSV_TEMP)})")
+    print(f"NFS-e adicionadas : {add_nfse} notas    (total sessão: {total_registros(cfg.CSV_NFSE_TEMP)})")
+    print(f"Tempo: {seg:.1f}s  →  {total / seg:.1f} arq/s   {(add_nfe + add_nfse) / seg:.0f} registros/s"
+          f"   {mb / seg:.1f} MB/s")
+
+    # Sincronizar Tudo: temp → principal (+ Excel do principal)
+    codigo = ERROS_XML if err_nfe or err_nfse else OK
+    for nome, sincronizar, excel in (("NF-e ", sincronizar_com_principal, atualizar_excel_principal),
+                                     ("NFS-e", sincronizar_nfse_com_principal, atualizar_excel_nfse_principal)):
+        ok, msg = sincronizar()
+        print(f"Sinc {nome} : {msg}", file=sys.stdout if ok else sys.stderr)
+        if not ok:
+            codigo = FALHA; continue
+        if not a.sem_excel:
+            ok, msg = excel()
+            print(f"Excel {nome}: {msg}", file=sys.stdout if ok else sys.stderr)
+            if not ok: codigo = FALHA
+
+    # Compactação disparada pela sincronização roda em thread daemon: espera
+    # terminar antes de sair (o processo acabaria no meio dela)
+    import threading
+    for t in threading.enumerate():
+        if t.name == "compactacao":
+            t.join()
+    return codigo
+
+
+def main(argv=None):
+    a = _argumentos(argv)
+    return ingest(a) if a.comando == "ingest" else USO
+
+
+if __name__ == "__main__":
+    sys.exit(main())
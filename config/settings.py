@@ -4,8 +4,9 @@ from datetime import datetime
 CTK_APPEARANCE = "light"
 CTK_COLOR_THEME = "blue"
 
-# Usa o diretório onde o projeto está instalado — funciona independente de acento ou usuário
-PASTA_BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Usa o diretório onde o projeto está instalado — funciona independente de acento ou usuário.
+# LEITOR_XML_PASTA troca a pasta dos arquivos principais (cli.py --out).
+PASTA_BASE = os.environ.get("LEITOR_XML_PASTA") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 os.makedirs(PASTA_BASE, exist_ok=True)
 
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "leitor_xml_multiusuario")
@@ -90,6 +91,52 @@ CABECALHO_NFSE = [
 # "substituir" → cada sessão começa do zero; o Excel/CSV principal é sobrescrito
 MODO_SESSAO = "substituir"
 
+# ── Parser XML ────────────────────────────────────────────────────────────────
+# "auto"   → lxml quando instalado (mais rápido), senão xml.etree (stdlib)
+# "lxml" / "stdlib" → força o backend ("lxml" sem lxml instalado cai no stdlib)
+BACKEND_XML = "auto"
+
+# Processos extratores em paralelo (0 = automático: nº de núcleos - 1)
+WORKERS_EXTRACAO = 0
+
+# ── Armazenamento do histórico principal ──────────────────────────────────────
+# "csv"    → produtos_nfe.csv / servicos_nfse.csv na PASTA_BASE (padrão)
+# "sqlite" → base_fiscal.db (modo WAL) na PASTA_BASE; os temporários da sessão
+#            continuam em CSV. WAL exige disco local — em pasta de rede use "csv".
+ARMAZENAMENTO = "csv"
+
+# Com "csv", cada sincronização publica as linhas da sessão como um segmento
+# imutável em PASTA_SEGMENTOS; o histórico = CSV principal (base) + segmentos.
+# Ao passar de SEGMENTOS_COMPACTAR segmentos, uma thread em segundo plano
+# junta tudo de volta no CSV principal.
+PASTA_SEGMENTOS     = os.path.join(PASTA_BASE, "segmentos")
+SEGMENTOS_COMPACTAR = 8
+
+# Compressão dos arquivos do histórico CSV (base e segmentos): "gzip" (.csv.gz),
+# "lzma" (.csv.xz, menor e mais lento) ou "" (CSV simples). Arquivos em outro
+# formato continuam legíveis; a base muda de formato na próxima compactação.
+COMPRESSAO_HISTORICO = "gzip"
+
+# A base compactada fica particionada por ano-mês de Data_Emissao
+# (historico/<nome>/AAAA-MM.*.csv.gz + particoes.json). Dashboard e Excel do
+# histórico leem só as partições de PERIODO_HISTORICO — ex.: ("2025-01", "2025-03")
+# ou ("2025-03-01", None); None = tudo.
+PASTA_HISTORICO   = os.path.join(PASTA_BASE, "historico")
+PERIODO_HISTORICO = None
+
+# Backups do histórico em TEMP_DIR/backups: a cada sincronização um delta
+# comprimido (linhas que entraram / chaves que saíram); a cada
+# BACKUP_COMPLETO_A_CADA pontos, um snapshot completo.
+PASTA_BACKUP           = os.path.join(TEMP_DIR, "backups")
+BACKUP_COMPLETO_A_CADA = 20
+BACKUP_RETENCAO_DIAS   = 7
+
+# Log de processamento: a tela guarda só as últimas LOG_LINHAS_TELA linhas,
+# desenhadas em lotes a cada LOG_INTERVALO_MS; o log completo vai para LOG_TEMP
+# ("Salvar Log" copia dele).
+LOG_LINHAS_TELA  = 5000
+LOG_INTERVALO_MS = 200
+
 LOCK_TTL_SECONDS = 300
 TEMP_TTL_SECONDS = 3600
 
@@ -98,3 +145,6 @@ CSV_NFSE_TEMP        = CSV_TEMP.replace("temp_produtos_", "temp_nfse_")
 EXCEL_NFSE_TEMP      = EXCEL_TEMP.replace("temp_excel_", "temp_excel_nfse_")
 CSV_NFSE_PRINCIPAL   = os.path.join(PASTA_BASE, "servicos_nfse.csv")
 EXCEL_NFSE_PRINCIPAL = os.path.join(PASTA_BASE, "servicos_nfse.xlsx")
+
+# Histórico em SQLite (ARMAZENAMENTO = "sqlite")
+DB_PRINCIPAL = os.path.join(PASTA_BASE, "base_fiscal.db")
@@ -0,0 +1,170 @@
+"""
+core/cubo.py
+Cubo de agregados do dashboard (<arquivo>.csv.cubo): somas e contagens das
+colunas de valor por mês × CNPJ × dimensões fiscais — CFOP/NCM na NF-e;
+Formato, tpRetISSQN, cTribNac e Cod_Servico_Mun na NFS-e. O dashboard lê o
+cubo (algumas centenas/milhares de células) em vez do histórico inteiro.
+
+Mantido por quem escreve: cada append soma as linhas novas às células, e o
+cubo é regravado com a assinatura do arquivo depois do append. Assinatura
+diferente da atual (arquivo mexido por fora, processo morto no meio) = cubo
+velho, remontado do zero na próxima leitura (load/storage.py).
+
+Sem pandas: roda também no merge do pipeline.
+"""
+
+import csv, json, math, os, threading
+
+from transform.indice import estado_csv
+
+VERSAO  = 1
+SEM_MES = "????-??"
+QTD     = "_qtd"
+
+DIMENSOES_NFE  = ("Mes", "CNPJ_Emitente", "CFOP", "NCM")
+MEDIDAS_NFE    = ("vProd", "ICMS_vICMS", "IPI_vIPI", "PIS_vPIS", "COFINS_vCOFINS")
+# Nome/UF do prestador acompanham o CNPJ (não multiplicam células) e são o
+# que os gráficos mostram
+DIMENSOES_NFSE = ("Mes", "CNPJ_Prestador", "Nome_Prestador", "UF_Prestador",
+                  "Formato", "tpRetISSQN", "cTribNac", "Cod_Servico_Mun")
+MEDIDAS_NFSE   = ("Valor_Bruto", "Valor_Liquido", "Valor_ISS", "Valor_PIS",
+                  "Valor_COFINS", "Valor_IRRF", "Valor_INSS")
+
+def esquema(cabecalho):
+    """(dimensões, medidas) do cubo para o tipo de CSV desse cabeçalho."""
+    if "Valor_Bruto" in cabecalho:
+        return DIMENSOES_NFSE, MEDIDAS_NFSE
+    return DIMENSOES_NFE, MEDIDAS_NFE
+
+def colunas_origem(cabecalho):
+    """Colunas do CSV que o cubo lê (Data_Emissao no lugar de Mes)."""
+    dims, meds = esquema(cabecalho)
+    return ("Data_Emissao",) + dims[1:] + meds
+
+def caminho_cubo(caminho_csv):
+    return caminho_csv + ".cubo"
+
+def mes(data):
+    """Data ISO → "AAAA-MM" (SEM_MES quando vazia) — igual a transform/agregados.mes."""
+    s = str(data if data is not None else "").strip()
+    return s[:7] if s and s != "nan" else SEM_MES
+
+def numero(valor):
+    """Texto → float (vazio/inválido = 0) — mesma regra de transform/agregados.numerico:
+    o separador mais à direita é o decimal."""
+    s = str(valor if valor is not None else "").strip()
+    if "," in s:
+        s = s.replace(".", "").replace(",", ".") if s.rfind(",") > s.rfind(".") else s.replace(",", "")
+    try:
+        x = float(s)
+    except ValueError:
+        return 0.0
+    return x if math.isfinite(x) else 0.0
+
+class Cubo:
+
+    def __init__(self, cabecalho):
+        self.dimensoes, self.medidas = esquema(cabecalho)
+        self.celulas = {}   # (dimensões...) → [medidas..., qtd]
+
+    def __len__(self):
+        return len(self.celulas)
+
+    def adicionar(self, linhas):
+        dims, meds = self.dimensoes[1:], self.medidas
+        vazia = [0.0] * len(meds) + [0]
+        for row in linhas:
+            chave = (mes(row.get("Data_Emissao")),) + tuple(
+                str(row.get(d) or "").strip() for d in dims)
+            cel = self.celulas.get(chave)
+            if cel is None:
+                cel = self.celulas[chave] = list(vazia)
+            for k, m in enumerate(meds):
+                cel[k] += numero(row.get(m))
+            cel[-1] += 1
+
+    def gravar(self, caminho_csv, assinatura):
+        """Grava via .tmp + rename; a 1ª linha (# JSON) guarda versão e assinatura."""
+        destino = caminho_cubo(caminho_csv)
+        # .tmp próprio: o dashboard pode remontar o cubo numa thread enquanto outra grava
+        tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                f.write("#" + json.dumps({"versao": VERSAO, "assinatura": assinatura}) + "\n")
+                w = csv.writer(f)
+                w.writerow(self.dimensoes + self.medidas + (QTD,))
+                w.writerows(list(k) + v for k, v in self.celulas.items())
+            os.replace(tmp, destino)
+        except OSError:
+            try: os.remove(tmp)
+            except OSError: pass
+
+    @classmethod
+    def carregar(cls, caminho_csv, cabecalho):
+        """(cubo, assinatura gravada) — (None, None) se não há cubo legível."""
+        cubo = cls(cabecalho)
+        try:
+            with open(caminho_cubo(caminho_csv), "r", newline="", encoding="utf-8") as f:
+                meta = json.loads(f.readline()[1:])
+                if meta.get("versao") != VERSAO:
+                    return None, None
+                leitor = csv.reader(f)
+                if tuple(next(leitor, ())) != cubo.dimensoes + cubo.medidas + (QTD,):
+                    return None, None
+                n = len(cubo.dimensoes)
+                for r in leitor:
+                    cubo.celulas[tuple(r[:n])] = [float(v) for v in r[n:-1]] + [int(r[-1])]
+        except (OSError, ValueError, IndexError):
+            return None, None
+        return cubo, meta.get("assinatura")
+
+def assinatura_csv(caminho_csv):
+    est = estado_csv(caminho_csv)
+    return list(est) if est else None
+
+def ler_meta(caminho_csv):
+    """Só o cabeçalho JSON do cubo (versão/assinatura) — {} se não há."""
+    try:
+        with open(caminho_cubo(caminho_csv), "r", encoding="utf-8") as f:
+            meta = json.loads(f.readline()[1:])
+        return meta if meta.get("versao") == VERSAO else {}
+    except (OSError, ValueError):
+        return {}
+
+def criar(caminho_csv, cabecalho):
+    """Cubo vazio para um CSV recém-criado (só cabeçalho)."""
+    Cubo(cabecalho).gravar(caminho_csv, assinatura_csv(caminho_csv))
+
+class Acompanhamento:
+    """Cubo de um CSV mantido em memória ao longo de vários appends (merge do
+    pipeline): carregado no 1º append, gravado uma vez no fim."""
+
+    def __init__(self, caminho_csv, cabecalho):
+        self.caminho, self.cabecalho = caminho_csv, cabecalho
+        self._cubo, self._carregado = None, False
+
+    def registrar(self, linhas, antes):
+        """Depois de um append: `antes` é o estado_csv de antes dele."""
+        if not self._carregado:
+            self._carregado = True
+            if antes is None or antes[0] == 0:
+                self._cubo = Cubo(self.cabecalho)           # arquivo novo
+            else:
+                cubo, assinatura = Cubo.carregar(self.caminho, self.cabecalho)
+                self._cubo = cubo if assinatura == list(antes) else None
+        if self._cubo is not None:
+            self._cubo.adicionar(linhas)
+
+    def gravar(self):
+        if self._cubo is not None:
+            self._cubo.gravar(self.caminho, assinatura_csv(self.caminho))
+
+def registrar_append(caminho_csv, cabecalho, linhas, antes):
+    """Soma as linhas recém-acrescentadas ao cubo do CSV (se ele estava em dia)."""
+    a = Acompanhamento(caminho_csv, cabecalho)
+    a.registrar(linhas, antes)
+    a.gravar()
+
+def remover(caminho_csv):
+    try: os.remove(caminho_cubo(caminho_csv))
+    except OSError: pass
@@ -0,0 +1,135 @@
+"""
+core/manifesto.py
+Manifesto de cada CSV (<arquivo>.csv.manifesto, JSON): nº de registros,
+tamanho, impressão digital do conteúdo (CRC32 do arquivo inteiro), versão do
+schema (CRC32 da linha de cabeçalho), mtime e nº de chaves no índice.
+
+Atualizado por quem escreve o CSV (load/storage.py e o merge do pipeline):
+num append só os bytes novos são lidos — o CRC32 continua de onde parou.
+Quem só precisa de contagem/tamanho lê o manifesto em vez do CSV; se o
+tamanho/mtime não baterem (CSV mexido por fora), ele é reconstruído.
+Em CSV comprimido (.gz/.xz) registros/CRC32/schema são do conteúdo
+descomprimido; bytes/mtime, do arquivo em disco.
+
+A mesma varredura monta o índice de posições das linhas (core/posicoes.py).
+"""
+
+import json, os, zlib
+
+from transform.indice import abrir, comprimido, contar_chaves, estado_csv
+from . import posicoes
+
+VERSAO  = 2   # 2: registros contados por linha de CSV (aspas respeitadas)
+_BLOCO  = 1024 * 1024
+
+def caminho_manifesto(caminho_csv):
+    return caminho_csv + ".manifesto"
+
+def _gravar(caminho_csv, m):
+    tmp = caminho_manifesto(caminho_csv) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(m, f)
+    os.replace(tmp, caminho_manifesto(caminho_csv))
+
+def _ler_bruto(caminho_csv):
+    try:
+        with open(caminho_manifesto(caminho_csv), "r", encoding="utf-8") as f:
+            m = json.load(f)
+        return m if m.get("versao") == VERSAO else None
+    except (OSError, ValueError):
+        return None
+
+def _varrer(f, crc, varredura):
+    """CRC32 do restante do arquivo; os mesmos blocos passam pela varredura
+    que acha o início de cada linha."""
+    while True:
+        bloco = f.read(_BLOCO)
+        if not bloco:
+            return crc
+        crc = zlib.crc32(bloco, crc)
+        varredura.bloco(bloco)
+
+def _schema(primeira_linha):
+    colunas = primeira_linha.rstrip(b"\r\n").lstrip(b"\xef\xbb\xbf")
+    return f"{zlib.crc32(colunas):08x}"
+
+def reconstruir(caminho_csv):
+    """Varre o CSV inteiro (uma vez) e regrava o manifesto."""
+    est = estado_csv(caminho_csv)
+    if est is None:
+        return None
+    varredura = posicoes.Varredura()
+    with abrir(caminho_csv, "rb") as f:
+        primeira = f.readline()
+        varredura.bloco(primeira)
+        crc = _varrer(f, zlib.crc32(primeira), varredura)
+    linhas = varredura.resultado(pular_primeira=True)
+    posicoes.gravar(caminho_csv, linhas)   # comprimido: não grava (sem acesso aleatório)
+    m = {
+        "versao":    VERSAO,
+        "registros": len(linhas),   # linhas de dados (quebra dentro de aspas não conta)
+        "bytes":     est[0],
+        "mtime_ns":  est[1],
+        "crc32":     f"{crc:08x}",
+        "schema":    _schema(primeira),
+        "chaves":    contar_chaves(caminho_csv),
+    }
+    try:
+        _gravar(caminho_csv, m)
+    except OSError:
+        pass
+    return m
+
+def ler(caminho_csv):
+    """Manifesto em dia com o CSV (reconstruído se preciso) — ou None se o CSV não existe."""
+    est = estado_csv(caminho_csv)
+    if est is None:
+        return None
+    m = _ler_bruto(caminho_csv)
+    if m is not None and [m["bytes"], m["mtime_ns"]] == list(est):
+        return m
+    return reconstruir(caminho_csv)
+
+def registrar_append(caminho_csv, antes):
+    """Chamado logo após um append. antes = estado_csv() tirado antes dele;
+    se o manifesto correspondia a esse estado, lê só os bytes novos."""
+    m = _ler_bruto(caminho_csv)
+    if m is None or antes is None or [m["bytes"], m["mtime_ns"]] != list(antes) \
+            or comprimido(caminho_csv):
+        return reconstruir(caminho_csv)
+    try:
+        varredura = posicoes.Varredura(antes[0])
+        with open(caminho_csv, "rb") as f:
+            if antes[0] == 0:
+                primeira = f.readline()
+                varredura.bloco(primeira)
+                m["schema"] = _schema(primeira)
+                crc = _varrer(f, zlib.crc32(primeira), varredura)
+            else:
+                f.seek(antes[0])
+                crc = _varrer(f, int(m["crc32"], 16), varredura)
+        if antes[0] == 0:
+            novas, registros = varredura.resultado(pular_primeira=True), 0
+            posicoes.gravar(caminho_csv, novas)
+        else:
+            novas, registros = varredura.resultado(), m["registros"]
+            if not posicoes.acrescentar(caminho_csv, antes, novas):
+                return reconstruir(caminho_csv)
+        est = estado_csv(caminho_csv)
+        m.update(registros=registros + len(novas), bytes=est[0], mtime_ns=est[1],
+                 crc32=f"{crc:08x}", chaves=contar_chaves(caminho_csv))
+        _gravar(caminho_csv, m)
+        return m
+    except OSError:
+        return reconstruir(caminho_csv)
+
+def registros(caminho_csv):
+    m = ler(caminho_csv)
+    return m["registros"] if m else 0
+
+def remover(caminho_csv):
+    try:
+        os.remove(caminho_manifesto(caminho_csv))
+    except OSError:
+        pass
+    posicoes.remover(caminho_csv)
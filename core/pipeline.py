@@ -0,0 +1,238 @@
+"""
+core/pipeline.py
+Pipeline de processamento dos XMLs — sem dependência de UI (tkinter/pandas).
+
+  arquivos ──► lotes por tamanho ──► N × _worker_extrair ──► _worker_processar ──► fila (UI)
+                 (fila de tarefas)       (processos)          (merge único)
+
+Os extratores só leem XML. Toda a deduplicação e a escrita dos CSVs ficam no
+merge, que reordena os resultados na ordem de seleção: saída, log e
+deduplicação são idênticos aos de um único processo.
+"""
+
+import csv, math, os, queue, threading, time
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+from config.settings import WORKERS_EXTRACAO
+
+LOTE_MAX = 500   # registros acumulados antes de cada append no CSV
+
+# O merge junta linhas de log e progresso e manda um só evento "resumo" para
+# a UI a cada INTERVALO_EVENTOS segundos (não um por arquivo)
+INTERVALO_EVENTOS = 0.1
+
+# Agendamento: janelas de arquivos consecutivos; dentro de cada janela os
+# maiores saem primeiro (não ficam para o fim de um worker) e os pequenos
+# são agrupados em lotes. A janela limita quanto o merge precisa segurar
+# enquanto espera o próximo índice. Em seleções pequenas o lote cai para
+# ceil(arquivos / extratores), para todos os extratores pedidos terem trabalho.
+JANELA_ARQUIVOS = 2000
+LOTE_BYTES      = 4 * 1024 * 1024
+LOTE_ARQUIVOS   = 64
+
+
+def detectar_tipo(caminho):
+    try:
+        with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
+            t = f.read(600)
+        return "nfse" if any(x in t for x in ["CompNFe","<NFSe","infNFSe","nNFSe"]) else "nfe"
+    except Exception:
+        return "nfe"
+
+def planejar_lotes(arquivos, n_extratores=1):
+    """[(índice, caminho), ...] agrupados por tamanho, janela a janela."""
+    max_arquivos = max(1, min(LOTE_ARQUIVOS, math.ceil(len(arquivos) / n_extratores)))
+    lotes = []
+    for ini in range(0, len(arquivos), JANELA_ARQUIVOS):
+        itens = []
+        for i, arq in enumerate(arquivos[ini:ini + JANELA_ARQUIVOS], ini + 1):
+            try:
+                tam = os.path.getsize(arq)
+            except OSError:
+                tam = 0
+            itens.append((tam, i, arq))
+        itens.sort(key=lambda x: -x[0])
+
+        atual, soma = [], 0
+        for tam, i, arq in itens:
+            if atual and (soma + tam > LOTE_BYTES or len(atual) >= max_arquivos):
+                lotes.append(atual); atual, soma = [], 0
+            atual.append((i, arq)); soma += tam
+        if atual:
+            lotes.append(atual)
+    return lotes
+
+def n_workers(n_lotes, pedidos=None):
+    n = pedidos or WORKERS_EXTRACAO or max(1, (os.cpu_count() or 2) - 1)
+    return max(1, min(n, n_lotes))
+
+
+# ─── Processos (funções de módulo — obrigatório para multiprocessing) ─────────
+
+def _worker_extrair(tarefas, resultados, k):
+    """Extrai lotes da fila de tarefas até receber None."""
+    from extract import extrair_produtos, extrair_servicos
+    try:
+        while True:
+            lote = tarefas.get()
+            if lote is None:
+                break
+            saida = []
+            for i, arq in lote:
+                tipo = detectar_tipo(arq)
+                regs, msg = (extrair_servicos if tipo == "nfse" else extrair_produtos)(arq)
+                saida.append((i, tipo, regs, msg))
+            resultados.put(saida)
+    finally:
+        resultados.put(k)   # avisa o merge que o extrator k terminou
+
+
+def _worker_processar(arquivos, csv_temp, csv_nfse_temp, cabecalho_csv, cabecalho_nfse,
+                      chaves_nfe, chaves_nfse, resultados, n_extratores, fila):
+    """Estágio único de merge: deduplica e grava na ordem original dos arquivos.
+    Envia à fila, no máximo a cada INTERVALO_EVENTOS, um evento
+    ("resumo", [(nivel, msg), ...], i, total, cnt_nfe, cnt_nfse) para a UI. Os cubos do dashboard
+    (core/cubo.py) ficam em memória e são gravados uma vez no fim."""
+    from core import cubo, manifesto
+    from transform import (
+        chave_nfse, chave_para, chave_produto, estado_csv, filtrar_novos, registrar_chaves,
+    )
+
+    def _salvar(regs, caminho, cabecalho):
+        if not regs: return
+        antes  = estado_csv(caminho)
+        existe = antes is not None and antes[0] > 0
+        with open(caminho, "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
+            if not existe: w.writeheader()
+            for r in regs:
+                w.writerow({k: r.get(k, "") for k in cabecalho})
+        registrar_chaves(caminho, regs, chave_para(cabecalho), antes)
+        manifesto.registrar_append(caminho, antes)
+        cubos[caminho].registrar(regs, antes)
+
+    cubos = {csv_temp:      cubo.Acompanhamento(csv_temp, cabecalho_csv),
+             csv_nfse_temp: cubo.Acompanhamento(csv_nfse_temp, cabecalho_nfse)}
+    total = len(arquivos)
+    lote_nfe = []; lote_nfse = []
+    cnt_nfe = cnt_nfse = add_nfe = add_nfse = err_nfe = err_nfse = 0
+    linhas_log = []; feitos = 0; enviado = (0, 0.0)   # (feitos, instante) do último resumo
+
+    def _avisar(forcar=False):
+        nonlocal linhas_log, enviado
+        agora = time.monotonic()
+        if (feitos, bool(linhas_log)) == (enviado[0], False):
+            return
+        if not forcar and agora - enviado[1] < INTERVALO_EVENTOS:
+            return
+        fila.put(("resumo", linhas_log, feitos, total, cnt_nfe, cnt_nfse))
+        linhas_log = []; enviado = (feitos, agora)
+
+    def _mesclar(i, tipo, regs, msg):
+        nonlocal lote_nfe, lote_nfse, cnt_nfe, cnt_nfse, add_nfe, add_nfse, err_nfe, err_nfse, feitos
+        nome = os.path.basename(arquivos[i - 1])
+
+        if tipo == "nfse":
+            cnt_nfse += 1
+            if msg.startswith("ERRO"):
+                err_nfse += 1
+                linhas_log.append(("err", f"  [{i:>4}/{total}] [NFS-e] ⚠  {nome[:48]}  →  {msg[:50]}"))
+            else:
+                novos = [r for r in regs if chave_nfse(r) not in chaves_nfse]
+                for r in novos:
+                    chaves_nfse.add(chave_nfse(r))
+                lote_nfse.extend(novos); add_nfse += len(novos)
+                linhas_log.append(("nfse", f"  [{i:>4}/{total}] [NFS-e] {nome[:48]:<50}  {len(novos):>3} novo(s)  [{msg[:30]}]"))
+        else:
+            cnt_nfe += 1
+            if msg.startswith("ERRO"):
+                err_nfe += 1
+                linhas_log.append(("err", f"  [{i:>4}/{total}] [NF-e]  ⚠  {nome[:48]}  →  {msg[:50]}"))
+            else:
+                novos, _ = filtrar_novos(regs, chaves_nfe)
+                for r in novos:
+                    chaves_nfe.add(chave_produto(r))
+                lote_nfe.extend(novos); add_nfe += len(novos)
+                linhas_log.append(("nfe", f"  [{i:>4}/{total}] [NF-e]  {nome[:48]:<50}  {len(novos):>3} novo(s)  {len(regs)} itens"))
+
+        # Salva lotes
+        if len(lote_nfe)  >= LOTE_MAX:
+            _salvar(lote_nfe, csv_temp, cabecalho_csv); lote_nfe = []
+        if len(lote_nfse) >= LOTE_MAX:
+            _salvar(lote_nfse, csv_nfse_temp, cabecalho_nfse); lote_nfse = []
+
+        feitos = i
+        _avisar()
+
+    # Resultados chegam fora de ordem; só mescla quando o próximo índice chega.
+    # Fim de extrator = seu índice na fila (dele mesmo ou de _vigiar, se morreu)
+    pendentes   = {}
+    proximo     = 1
+    encerrados  = set()
+    while len(encerrados) < n_extratores:
+        try:
+            lote = resultados.get(timeout=INTERVALO_EVENTOS)
+        except queue.Empty:
+            _avisar()   # extratores ocupados: manda o que já acumulou
+            continue
+        if isinstance(lote, int):
+            encerrados.add(lote); continue
+        for i, tipo, regs, msg in lote:
+            pendentes[i] = (tipo, regs, msg)
+        while proximo in pendentes:
+            _mesclar(proximo, *pendentes.pop(proximo)); proximo += 1
+
+    # Extrator que caiu no meio de um lote (ou lotes que ninguém pegou):
+    # registra os arquivos perdidos
+    for i in range(proximo, total + 1):
+        if i in pendentes:
+            _mesclar(i, *pendentes.pop(i))
+        else:
+            tipo = detectar_tipo(arquivos[i - 1])
+            _mesclar(i, tipo, [], "ERRO: extrator encerrado antes de processar o arquivo")
+
+    # Salva restos
+    _salvar(lote_nfe,  csv_temp,      cabecalho_csv)
+    _salvar(lote_nfse, csv_nfse_temp, cabecalho_nfse)
+    for a in cubos.values():
+        a.gravar()
+    _avisar(forcar=True)
+    fila.put(("fim", cnt_nfe, cnt_nfse, add_nfe, add_nfse, err_nfe, err_nfse))
+
+
+def _vigiar(extratores, resultados):
+    """Thread de quem sobe o pipeline: manda ao merge o índice de cada extrator
+    que sai — também o morto por OOM/segfault, que não chega ao finally.
+    Espera pelo sentinel (não faz join), então quem chamou ainda pode dar join."""
+    sentinelas = {p.sentinel: k for k, p in enumerate(extratores)}
+    while sentinelas:
+        for s in wait(list(sentinelas)):
+            resultados.put(sentinelas.pop(s))
+
+def iniciar_processamento(arquivos, csv_temp, csv_nfse_temp, cabecalho_csv, cabecalho_nfse,
+                          chaves_nfe, chaves_nfse, fila, workers=None):
+    """Sobe os extratores e o merge (todos daemon, filhos de quem chamou).
+    workers sobrepõe WORKERS_EXTRACAO. Retorna (processo_merge, [processos_extratores])."""
+    lotes = planejar_lotes(arquivos, n_workers(len(arquivos), workers))
+    n     = n_workers(len(lotes), workers)
+
+    tarefas, resultados = mp.Queue(), mp.Queue()
+    for lote in lotes:
+        tarefas.put(lote)
+    for _ in range(n):
+        tarefas.put(None)
+
+    extratores = [mp.Process(target=_worker_extrair, args=(tarefas, resultados, k), daemon=True)
+                  for k in range(n)]
+    merge = mp.Process(
+        target=_worker_processar,
+        args=(arquivos, csv_temp, csv_nfse_temp, cabecalho_csv, cabecalho_nfse,
+              chaves_nfe, chaves_nfse, resultados, n, fila),
+        daemon=True,
+    )
+    for p in extratores:
+        p.start()
+    merge.start()
+    threading.Thread(target=_vigiar, args=(extratores, resultados), name="extratores", daemon=True).start()
+    return merge, extratores
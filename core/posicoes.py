@@ -0,0 +1,234 @@
+"""
+core/posicoes.py
+Índice de posições de cada CSV (<arquivo>.csv.posicoes): o byte onde começa
+cada linha de dados. Com ele, Linhas lê as linhas [i, j) ou a linha de uma
+chave direto do arquivo mapeado em memória (mmap), sem passar pelo pandas —
+base para paginar o histórico e exportar fatias maiores que a RAM.
+
+Formato igual ao .chaves: cabeçalho de 32 bytes (magic, tamanho e mtime do
+CSV, nº de linhas) + um uint64 por linha. É montado na mesma varredura em
+blocos que o manifesto faz a cada escrita (core/manifesto.py), num append só
+sobre os bytes novos. Aspas contam: quebra de linha dentro de campo entre
+aspas não abre linha nova. CSV comprimido (.gz/.xz) não tem acesso aleatório
+— não ganha índice e Linhas lê em streaming.
+"""
+
+import csv, io, mmap, os, struct
+from itertools import islice
+
+import numpy as np
+
+from transform.indice import abrir, carregar_indice, comprimido, digest, estado_csv
+
+_MAGIC     = b"XPPOS1\0\0"
+_CABECALHO = struct.Struct("<8sQQQ")   # magic, csv_bytes, csv_mtime_ns, n_linhas
+_QUEBRA, _ASPAS = ord("\n"), ord('"')
+
+def caminho_posicoes(caminho_csv):
+    return caminho_csv + ".posicoes"
+
+class Varredura:
+    """Recebe os blocos de um CSV a partir de um início de linha e junta os
+    offsets onde começam as linhas seguintes (a de `inicio` incluída)."""
+
+    def __init__(self, inicio=0):
+        self.inicios = [np.array([inicio], dtype=np.uint64)]
+        self._pos    = inicio
+        self._aspas  = 0        # paridade de aspas na linha corrente
+
+    def bloco(self, dados):
+        b  = np.frombuffer(dados, dtype=np.uint8)
+        qs = np.flatnonzero(b == _ASPAS)
+        nl = np.flatnonzero(b == _QUEBRA)
+        if len(nl):
+            # aspas antes de cada \n; fim de linha só onde o total é par
+            par = (np.searchsorted(qs, nl) + self._aspas) % 2 == 0
+            self.inicios.append((nl[par] + 1 + self._pos).astype(np.uint64))
+        self._aspas = (self._aspas + len(qs)) % 2
+        self._pos  += len(dados)
+
+    def resultado(self, pular_primeira=False):
+        """Offsets das linhas que começam antes do fim (a última quebra não abre linha)."""
+        todos = np.concatenate(self.inicios)
+        todos = todos[todos < self._pos]
+        return todos[1:] if pular_primeira else todos
+
+# ── Arquivo de índice ──────────────────────────────────────────────────────────
+
+def _ler_cabecalho(f):
+    bruto = f.read(_CABECALHO.size)
+    if len(bruto) < _CABECALHO.size:
+        return None
+    magic, tam, mtime, n = _CABECALHO.unpack(bruto)
+    return (tam, mtime, n) if magic == _MAGIC else None
+
+def gravar(caminho_csv, offsets):
+    """Índice inteiro de um CSV cujo conteúdo foi todo varrido (a 1ª linha,
+    cabeçalho, já fora de `offsets`)."""
+    est = estado_csv(caminho_csv)
+    if est is None or comprimido(caminho_csv):
+        remover(caminho_csv)
+        return
+    tmp = caminho_posicoes(caminho_csv) + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_CABECALHO.pack(_MAGIC, est[0], est[1], len(offsets)))
+            f.write(offsets.astype("<u8").tobytes())
+        os.replace(tmp, caminho_posicoes(caminho_csv))
+    except OSError:
+        pass
+
+def acrescentar(caminho_csv, antes, offsets):
+    """Acrescenta os offsets das linhas novas de um append. False se o índice
+    não correspondia a `antes` (quem chama varre o arquivo inteiro)."""
+    if comprimido(caminho_csv):
+        return False
+    try:
+        with open(caminho_posicoes(caminho_csv), "r+b") as f:
+            cab = _ler_cabecalho(f)
+            if cab is None or antes is None or cab[:2] != tuple(antes):
+                return False
+            f.seek(_CABECALHO.size + cab[2] * 8)
+            f.write(offsets.astype("<u8").tobytes())
+            f.truncate()
+            est = estado_csv(caminho_csv)
+            f.seek(0)
+            f.write(_CABECALHO.pack(_MAGIC, est[0], est[1], cab[2] + len(offsets)))
+            return True
+    except OSError:
+        return False
+
+def carregar(caminho_csv):
+    """Offsets das linhas se o índice estiver em dia com o CSV; senão None.
+    (8 bytes por linha: lido inteiro, sem prender o arquivo do índice.)"""
+    est = estado_csv(caminho_csv)
+    try:
+        with open(caminho_posicoes(caminho_csv), "rb") as f:
+            cab = _ler_cabecalho(f)
+            if cab is None or est is None or cab[:2] != est:
+                return None
+            pos = np.fromfile(f, dtype="<u8", count=cab[2]).astype(np.uint64)
+        return pos if len(pos) == cab[2] else None
+    except (OSError, ValueError):
+        return None
+
+def indexar(caminho_csv):
+    """Varre o CSV (não comprimido) e grava o índice — para CSV escrito sem
+    passar pelo manifesto. Retorna os offsets."""
+    varredura = Varredura()
+    with open(caminho_csv, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            varredura.bloco(bloco)
+    offsets = varredura.resultado(pular_primeira=True)
+    gravar(caminho_csv, offsets)
+    return offsets
+
+def remover(caminho_csv):
+    try:
+        os.remove(caminho_posicoes(caminho_csv))
+    except OSError:
+        pass
+
+# ── Leitura ────────────────────────────────────────────────────────────────────
+
+def _decodificar(dados):
+    try:
+        return dados.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return dados.decode("latin-1")
+
+class Linhas:
+    """Linhas de um CSV por número, sem ler o arquivo inteiro:
+
+        with Linhas(caminho) as ls:
+            len(ls); ls.valores(1000, 1050); ls.linha_da_chave(chave, chave_produto)
+
+    Acesso direto via mmap; índice velho ou ausente é refeito na abertura.
+    CSV comprimido não tem índice: lê em streaming."""
+
+    def __init__(self, caminho_csv):
+        self.caminho = caminho_csv
+        self._pos    = None
+        if not comprimido(caminho_csv):
+            self._pos = carregar(caminho_csv)
+            if self._pos is None:
+                self._pos = indexar(caminho_csv)
+        self._mm     = None
+        self._ordem  = None
+        if self._pos is not None and os.path.getsize(caminho_csv):
+            with open(caminho_csv, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm is not None:
+            fim = int(self._pos[0]) if len(self._pos) else len(self._mm)
+            self.colunas = next(csv.reader(io.StringIO(_decodificar(self._mm[:fim]))), [])
+        else:
+            with abrir(caminho_csv, "rb") as f:
+                self.colunas = next(csv.reader(io.StringIO(_decodificar(f.readline()))), [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    @property
+    def indexado(self):
+        return self._pos is not None
+
+    def __len__(self):
+        if self._pos is not None:
+            return len(self._pos)
+        with abrir(self.caminho, "rt", encoding="utf-8", errors="replace", newline="") as f:
+            return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+    def valores(self, i, j):
+        """Linhas [i, j) como listas de valores (na ordem de self.colunas)."""
+        if self._pos is None:
+            with abrir(self.caminho, "rt", encoding="utf-8", errors="replace", newline="") as f:
+                return list(islice(csv.reader(f), i + 1, j + 1))
+        n = len(self._pos)
+        i, j = max(0, i), min(j, n)
+        if i >= j or self._mm is None:
+            return []
+        fim = int(self._pos[j]) if j < n else len(self._mm)
+        texto = _decodificar(self._mm[int(self._pos[i]):fim])
+        return list(csv.reader(io.StringIO(texto, newline="")))
+
+    def linhas(self, i, j):
+        """Linhas [i, j) como dicts, como o csv.DictReader."""
+        return [dict(zip(self.colunas, v)) for v in self.valores(i, j)]
+
+    def posicao(self, chave, chave_fn):
+        """Nº da linha com essa chave de deduplicação — ou None. Usa o .chaves
+        (mesma ordem das linhas): a ordenação dos digests é feita uma vez por
+        leitor e cada busca depois é uma bisseção."""
+        if self._ordem is None:
+            ds = np.frombuffer(carregar_indice(self.caminho, chave_fn), dtype=np.uint64)
+            if self._pos is not None and len(ds) != len(self._pos):
+                return self._procurar(chave, chave_fn)
+            self._ordem = (ds, np.argsort(ds, kind="stable"))
+        ds, ordem = self._ordem
+        d = np.uint64(digest(chave))
+        k = int(np.searchsorted(ds, d, sorter=ordem))
+        while k < len(ordem) and ds[ordem[k]] == d:
+            linha = int(ordem[k])
+            if chave_fn(self.linhas(linha, linha + 1)[0]) == chave:   # colisão de digest
+                return linha
+            k += 1
+        return None
+
+    def _procurar(self, chave, chave_fn):
+        with abrir(self.caminho, "rt", encoding="utf-8", errors="replace", newline="") as f:
+            for n, row in enumerate(csv.DictReader(f)):
+                if chave_fn(row) == chave:
+                    return n
+        return None
+
+    def linha_da_chave(self, chave, chave_fn):
+        n = self.posicao(chave, chave_fn)
+        return None if n is None else self.linhas(n, n + 1)[0]
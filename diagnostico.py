@@ -30,16 +30,16 @@ for rel in esperados:
     # Verifica conteúdo chave independente de hash
     conteudo = open(caminho, encoding='utf-8', errors='ignore').read()
     if rel == 'extract/xml_reader.py':
-        tem_ipi   = '_extrair_ipi' in conteudo
-        tem_ibscbs= '_extrair_ibscbs' in conteudo
+        tem_ipi   = '"IPI_":' in conteudo
+        tem_ibscbs= '"IBS_vIBS":' in conteudo
         ok = tem_ipi and tem_ibscbs
         detalhe = f"IPI={'OK' if tem_ipi else 'FALTA'}  IBS/CBS={'OK' if tem_ibscbs else 'FALTA'}"
     elif rel == 'ui/main_window.py':
-        ok = '_ler_csv' in conteudo and 'BarChart' in conteudo
-        detalhe = f"leitura CSV={'OK' if '_ler_csv' in conteudo else 'FALTA'}  gráficos={'OK' if 'BarChart' in conteudo else 'FALTA'}"
+        ok = '_ler_cubo' in conteudo and 'BarChart' in conteudo
+        detalhe = f"cubo dashboard={'OK' if '_ler_cubo' in conteudo else 'FALTA'}  gráficos={'OK' if 'BarChart' in conteudo else 'FALTA'}"
     elif rel == 'load/storage.py':
-        ok = 'salvar_nfse_csv' in conteudo and '_aplicar_formatacao_excel' in conteudo
-        detalhe = f"NFS-e={'OK' if 'salvar_nfse_csv' in conteudo else 'FALTA'}  formatação={'OK' if '_aplicar_formatacao_excel' in conteudo else 'FALTA'}"
+        ok = 'salvar_nfse_csv' in conteudo and '_registrar_estilos' in conteudo
+        detalhe = f"NFS-e={'OK' if 'salvar_nfse_csv' in conteudo else 'FALTA'}  formatação={'OK' if '_registrar_estilos' in conteudo else 'FALTA'}"
     else:
         ok = True
         detalhe = f"{tam:,} bytes"
@@ -87,12 +87,22 @@ try:
         from config.settings import CSV_PRINCIPAL, CSV_NFSE_PRINCIPAL
         for nome, caminho in [("CSV NF-e PRINCIPAL", CSV_PRINCIPAL),
                                ("CSV NFS-e PRINCIPAL", CSV_NFSE_PRINCIPAL)]:
-            if os.path.exists(caminho):
-                tam = os.path.getsize(caminho)
-                linhas = sum(1 for _ in open(caminho, encoding='utf-8', errors='ignore')) - 1
-                print(f"   ✓ {nome}: {linhas} linhas  ({tam:,} bytes)")
+            from load.segmentos import arquivos, base_legada, contar, ler_particoes, listar
+            from transform.indice import abrir
+            if ler_particoes(caminho):
+                parts = ler_particoes(caminho)
+                tam = sum(os.path.getsize(c) for c in arquivos(caminho, []))
+                print(f"   ✓ {nome}: {sum(p['registros'] for p in parts.values())} linhas em "
+                      f"{len(parts)} partição(ões) {min(parts)}…{max(parts)}  ({tam:,} bytes)")
+            elif base_legada(caminho):
+                tam = os.path.getsize(base_legada(caminho))
+                with abrir(base_legada(caminho), 'rt', encoding='utf-8', errors='ignore') as f:
+                    linhas = sum(1 for _ in f) - 1
+                print(f"   ✓ {nome}: {linhas} linhas  ({tam:,} bytes em {os.path.basename(base_legada(caminho))})")
             else:
                 print(f"   ○ {nome}: ainda não criado (normal na 1ª sessão)")
+            if listar(caminho):
+                print(f"   ✓ {nome}: {len(listar(caminho))} segmento(s) a compactar — histórico com {contar(caminho)} registros")
 
 except Exception as e:
     print(f"   ERRO: {e}")
@@ -105,6 +115,11 @@ for lib in ['pandas','openpyxl','customtkinter']:
         print(f"   ✓ {lib} {getattr(m,'__version__','?')}")
     except ImportError:
         print(f"   ✗ {lib} NÃO INSTALADO — pip install {lib}")
+try:
+    import lxml
+    print(f"   ✓ lxml {getattr(lxml,'__version__','?')} (opcional — parser XML acelerado)")
+except ImportError:
+    print(f"   ○ lxml não instalado (opcional — usa xml.etree) — pip install lxml")
 
 # 4. Teste de extração com XMLs da pasta base
 print("\n4. TESTE DE EXTRAÇÃO:")
@@ -134,7 +149,52 @@ except Exception as e:
     print(f"   ERRO: {e}")
     traceback.print_exc()
 
-# 5. Instrução final
+# 5. Paridade entre backends XML (lxml × stdlib) — mesmos campos nos dois
+print("\n5. PARIDADE DE BACKENDS XML:")
+try:
+    from extract.xml_parser import BACKEND, backends_disponiveis
+    print(f"   Backend em uso: {BACKEND}  (disponíveis: {', '.join(backends_disponiveis())})")
+    if len(backends_disponiveis()) < 2:
+        print("   lxml ausente — nada a comparar.")
+    else:
+        from config.settings import PASTA_BASE
+        from extract.xml_reader import extrair_produtos
+        from extract.nfse_reader import extrair_servicos
+        arqs = glob.glob(os.path.join(PASTA_BASE, '*.xml'))
+        # Amostra fixa: NFS-e que declara UTF-8 mas traz bytes latin-1 — o
+        # lxml acusa erro de leitura e os dois backends têm de cair no fallback
+        import tempfile
+        amostra = os.path.join(tempfile.gettempdir(), "diagnostico_nfse_bytes_invalidos.xml")
+        with open(amostra, "wb") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>'
+                    '<CompNFe xmlns="http://www.abrasf.org.br/nfse.xsd"><NFe>'
+                    '<NumeroNFe>55</NumeroNFe><CodigoVerificador>ABCD</CodigoVerificador>'
+                    '<DataEmissaoNFe>2024-01-10</DataEmissaoNFe><ValorNFe>500,00</ValorNFe>'
+                    '<Discriminacao>Manutenção elétrica</Discriminacao>'
+                    '<Prestador><CnpjCpf>77888999000100</CnpjCpf>'
+                    '<RazaoSocialNome>Prestador Município</RazaoSocialNome></Prestador>'
+                    '</NFe></CompNFe>'.encode("latin-1"))
+        divergentes = []
+        for arq in arqs + [amostra]:
+            with open(arq,'r',encoding='utf-8',errors='ignore') as f: txt = f.read(300)
+            fn = extrair_servicos if any(x in txt for x in ['CompNFe','infNFSe','nNFSe']) else extrair_produtos
+            stdlib, lxml_ = fn(arq, backend="stdlib"), fn(arq, backend="lxml")
+            if stdlib[0] != lxml_[0] or (arq == amostra and not lxml_[0]):
+                divergentes.append(os.path.basename(arq))
+        try: os.remove(amostra)
+        except OSError: pass
+        if not arqs:
+            print("   Nenhum XML na pasta base — só a amostra com bytes inválidos comparada.")
+        if divergentes:
+            print(f"   ✗ {len(divergentes)} de {len(arqs) + 1} XMLs com campos diferentes:")
+            for n in divergentes[:10]:
+                print(f"     - {n}")
+        else:
+            print(f"   ✓ {len(arqs)} XMLs + amostra com bytes inválidos — campos idênticos nos dois backends")
+except Exception as e:
+    print(f"   ERRO: {e}")
+
+# 6. Instrução final
 print("\n" + "=" * 65)
 print("PRÓXIMOS PASSOS:")
 print("  1. Substitua os arquivos marcados com ✗ pelos do Claude")
@@ -6,30 +6,15 @@ Suporta:
 Corrigido: prestador lido de infNFSe/emit, tomador de DPS/toma.
 """
 
-import os, re
-import xml.etree.ElementTree as ET
+import os
+
+from .xml_parser import ErroXML, parsear
 
 def _t(el, tag, default=""):
     if el is None: return default
     e = el.find(tag)
     return e.text.strip() if e is not None and e.text else default
 
-def _remover_ns(c):
-    c = re.sub(r'xmlns(:[^=]+)?="[^"]+"', "", c)
-    c = re.sub(r"<\?xml[^?>]*\?>", "", c)
-    return c
-
-def _parsear(caminho):
-    with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
-        c = f.read()
-    s = _remover_ns(c)
-    try:
-        return ET.fromstring(s)
-    except ET.ParseError:
-        s = re.sub(r"<\?xml-stylesheet[^?>]*\?>", "", s)
-        return ET.fromstring(s)
-
-
 # ── NFSe Nacional ─────────────────────────────────────────────────────────────
 
 def _extrair_nfse_nacional(root, arquivo):
@@ -305,9 +290,9 @@ def _extrair_compnfe(root, arquivo):
 
 # ── Função pública ─────────────────────────────────────────────────────────────
 
-def extrair_servicos(caminho_xml):
+def extrair_servicos(caminho_xml, backend=None):
     try:
-        root = _parsear(caminho_xml)
+        root = parsear(caminho_xml, backend)
         tag  = root.tag.split("}")[-1] if "}" in root.tag else root.tag
 
         if tag == "CompNFe" or root.find(".//CompNFe") is not None:
@@ -321,7 +306,7 @@ def extrair_servicos(caminho_xml):
             return [], msg
         return [dados], msg
 
-    except ET.ParseError as e:
+    except ErroXML as e:
         return [], f"ERRO XML: {str(e)[:80]}"
     except Exception as e:
         return [], f"ERRO: {str(e)[:80]}"
@@ -0,0 +1,125 @@
+"""
+extract/xml_parser.py
+Front-end de parsing compartilhado por xml_reader (NF-e) e nfse_reader (NFS-e).
+O arquivo é entregue ao parser como bytes — o encoding declarado no XML é
+respeitado — e '{ns}tag' vira o nome local por uma tabela de nomes, sem
+regex sobre o texto e sem cópias do conteúdo inteiro.
+
+Backends:
+  - "lxml"   → libxml2 (C), usado automaticamente quando lxml está instalado
+  - "stdlib" → xml.etree.ElementTree (expat), sempre disponível
+Os dois entregam árvores equivalentes (tags locais, sem comentários/PIs),
+então os leitores produzem exatamente os mesmos campos em ambos.
+"""
+
+import io
+import xml.etree.ElementTree as ET
+
+from config.settings import BACKEND_XML
+
+try:
+    from lxml import etree as _lxml
+except ImportError:         # lxml é opcional — o stdlib cobre tudo
+    _lxml = None
+
+# Exceções de XML malformado de qualquer backend
+ErroXML = (ET.ParseError,) if _lxml is None else (ET.ParseError, _lxml.XMLSyntaxError)
+
+# Bytes inválidos para o encoding declarado: o lxml acusa erro de leitura
+# (OSError), não de sintaxe — os dois caem no fallback tolerante. Arquivo
+# inexistente continua dando OSError (o fallback também não consegue abrir).
+_ERRO_LEITURA = ErroXML + (OSError,)
+
+_OPCOES_LXML = dict(remove_comments=True, remove_pis=True,
+                    resolve_entities=False, no_network=True, huge_tree=True)
+
+def backends_disponiveis():
+    return ("lxml", "stdlib") if _lxml is not None else ("stdlib",)
+
+def _escolher_backend(nome):
+    """'auto' (ou lxml ausente) cai no melhor backend instalado."""
+    if nome == "stdlib" or _lxml is None:
+        return "stdlib"
+    return "lxml"
+
+BACKEND = _escolher_backend(BACKEND_XML)
+
+_NOMES = {}   # '{ns}tag' → 'tag' (cresce sob demanda, uma entrada por tag distinta)
+
+def nome_local(tag):
+    """'{http://www.portalfiscal.inf.br/nfe}det' → 'det'."""
+    try:
+        return _NOMES[tag]
+    except KeyError:
+        nome = _NOMES[tag] = tag.rpartition("}")[2]
+        return nome
+
+def _texto_tolerante(caminho):
+    """Fallback para arquivos com bytes inválidos para o encoding declarado:
+    decodifica como UTF-8 ignorando erros (comportamento da versão anterior).
+    Sempre lido pelo stdlib — o lxml não aceita str com declaração de encoding."""
+    with open(caminho, "rb") as f:
+        return f.read().decode("utf-8", errors="ignore")
+
+def localizar(root):
+    """Reduz as tags da subárvore ao nome local (in-place) e a devolve."""
+    for el in root.iter():
+        el.tag = nome_local(el.tag)
+    return root
+
+def parsear(caminho, backend=None):
+    """Árvore completa com tags já reduzidas ao nome local."""
+    backend = _escolher_backend(backend or BACKEND)
+    try:
+        if backend == "lxml":
+            root = _lxml.parse(caminho, _lxml.XMLParser(**_OPCOES_LXML)).getroot()
+        else:
+            root = ET.parse(caminho).getroot()
+    except _ERRO_LEITURA:
+        root = ET.fromstring(_texto_tolerante(caminho))
+    return localizar(root)
+
+def iterparse(caminho, tags, tolerante=False, backend=None, soltar=()):
+    """Streaming: (nome_local, elemento) no 'end' de cada elemento cujo nome
+    local está em tags. As tags NÃO são reescritas — quem consome usa
+    nome_local()/localizar() só no que precisar. No lxml o filtro roda em C.
+    soltar = tags cujo elemento, depois de consumido (quando o gerador
+    retoma), é esvaziado e tirado do pai — a árvore não acumula um elemento
+    por item. No lxml sai o irmão anterior já consumido (o nó atual ainda é
+    referência do libxml2), então fica no máximo um vazio.
+    tolerante=True relê o arquivo pelo fallback UTF-8 (ver _texto_tolerante)."""
+    soltar = frozenset(soltar)
+    if not tolerante and _escolher_backend(backend or BACKEND) == "lxml":
+        for _, el in _lxml.iterparse(caminho, events=("end",),
+                                     tag=[f"{{*}}{t}" for t in tags], **_OPCOES_LXML):
+            tag = nome_local(el.tag)
+            yield tag, el
+            if tag in soltar:
+                el.clear(keep_tail=True)
+                anterior = el.getprevious()
+                while anterior is not None and nome_local(anterior.tag) in soltar:
+                    el.getparent().remove(anterior)
+                    anterior = el.getprevious()
+        return
+
+    fonte = io.StringIO(_texto_tolerante(caminho)) if tolerante else caminho
+    tags = frozenset(tags)
+    if not soltar:
+        for _, el in ET.iterparse(fonte):
+            tag = nome_local(el.tag)
+            if tag in tags:
+                yield tag, el
+        return
+
+    pilha = []   # elementos abertos: pilha[-1] é o pai do que acabou de fechar
+    for evento, el in ET.iterparse(fonte, events=("start", "end")):
+        if evento == "start":
+            pilha.append(el); continue
+        pilha.pop()
+        tag = nome_local(el.tag)
+        if tag in tags:
+            yield tag, el
+            if tag in soltar:
+                el.clear()
+                if pilha:
+                    pilha[-1].remove(el)
@@ -1,274 +1,206 @@
 """
 extract/xml_reader.py
 Extrai NF-e (modelo 55/65) — ICMS, IPI, PIS, COFINS, IBS/CBS completos.
+Leitura em streaming (iterparse): cada det vira uma linha assim que fecha
+e a subárvore é liberada em seguida — memória não cresce com o nº de itens.
+Os campos do det saem de um plano compilado do CABECALHO_NFE, preenchido
+numa única passada pela subárvore do item.
 """
 
-import os, re
-import xml.etree.ElementTree as ET
+import os
+
+from config.settings import CABECALHO_NFE
+from .xml_parser import ErroXML, iterparse, localizar, nome_local
 
 def _t(el, tag, default=""):
     if el is None: return default
     e = el.find(tag)
     return e.text.strip() if e is not None and e.text else default
 
-def _remover_ns(c):
-    c = re.sub(r'xmlns(:[^=]+)?="[^"]+"', "", c)
-    c = re.sub(r"<\?xml[^?>]*\?>", "", c)
-    return c
-
-def _parsear_xml(caminho):
-    with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
-        c = f.read()
-    s = _remover_ns(c)
-    try:
-        return ET.fromstring(s)
-    except ET.ParseError:
-        s = re.sub(r"<\?xml-stylesheet[^?>]*\?>", "", s)
-        return ET.fromstring(s)
-
 _ICMS_TAGS = (
     "ICMS00","ICMS10","ICMS20","ICMS30","ICMS40","ICMS41",
     "ICMS50","ICMS51","ICMS60","ICMS70","ICMS90",
     "ICMSSN101","ICMSSN102","ICMSSN201","ICMSSN202","ICMSSN500","ICMSSN900",
 )
+_IPI_TAGS    = ("IPITrib","IPINT")
 _PIS_TAGS    = ("PISAliq","PISQtde","PISNT","PISOutr","PISSN")
 _COFINS_TAGS = ("COFINSAliq","COFINSQtde","COFINSNT","COFINSOutr","COFINSSN")
 
-def _extrair_icms(imposto):
-    r = {k:"" for k in [
-        "ICMS_orig","ICMS_CST","ICMS_modBC","ICMS_vBC","ICMS_pICMS","ICMS_vICMS",
-        "ICMS_vBCSTRet","ICMS_pST","ICMS_vICMSSubstituto","ICMS_vICMSSTRet",
-        "ICMS_pRedBCEfet","ICMS_vBCEfet","ICMS_pICMSEfet","ICMS_vICMSEfet",
-    ]}
-    icms = imposto.find(".//ICMS")
-    if icms is None: return r
-    for filho in icms:
-        if any(x in filho.tag for x in _ICMS_TAGS):
-            r.update({
-                "ICMS_orig":            _t(filho,"orig"),
-                "ICMS_CST":             _t(filho,"CST"),
-                "ICMS_modBC":           _t(filho,"modBC"),
-                "ICMS_vBC":             _t(filho,"vBC"),
-                "ICMS_pICMS":           _t(filho,"pICMS"),
-                "ICMS_vICMS":           _t(filho,"vICMS"),
-                "ICMS_vBCSTRet":        _t(filho,"vBCSTRet"),
-                "ICMS_pST":             _t(filho,"pST"),
-                "ICMS_vICMSSubstituto": _t(filho,"vICMSSubstituto"),
-                "ICMS_vICMSSTRet":      _t(filho,"vICMSSTRet"),
-                "ICMS_pRedBCEfet":      _t(filho,"pRedBCEfet"),
-                "ICMS_vBCEfet":         _t(filho,"vBCEfet"),
-                "ICMS_pICMSEfet":       _t(filho,"pICMSEfet"),
-                "ICMS_vICMSEfet":       _t(filho,"vICMSEfet"),
-            })
-            break
-    return r
-
-def _extrair_ipi(imposto):
-    r = {"IPI_cEnq":"","IPI_CST":"","IPI_vBC":"","IPI_pIPI":"","IPI_vIPI":""}
-    ipi = imposto.find(".//IPI")
-    if ipi is None: return r
-    r["IPI_cEnq"] = _t(ipi,"cEnq")
-    # pode estar em IPITrib ou IPINT
-    for sub in ("IPITrib","IPINT"):
-        el = ipi.find(sub)
-        if el is not None:
-            r["IPI_CST"]  = _t(el,"CST")
-            r["IPI_vBC"]  = _t(el,"vBC")
-            r["IPI_pIPI"] = _t(el,"pIPI")
-            r["IPI_vIPI"] = _t(el,"vIPI")
-            break
-    return r
-
-def _extrair_pis(imposto):
-    r = {"PIS_CST":"","PIS_vBC":"","PIS_pPIS":"","PIS_vPIS":""}
-    pis = imposto.find(".//PIS")
-    if pis is None: return r
-    for filho in pis:
-        if any(x in filho.tag for x in _PIS_TAGS):
-            r.update({
-                "PIS_CST":  _t(filho,"CST"),
-                "PIS_vBC":  _t(filho,"vBC"),
-                "PIS_pPIS": _t(filho,"pPIS"),
-                "PIS_vPIS": _t(filho,"vPIS"),
-            })
-            break
-    return r
-
-def _extrair_cofins(imposto):
-    r = {"COFINS_CST":"","COFINS_vBC":"","COFINS_pCOFINS":"","COFINS_vCOFINS":""}
-    cofins = imposto.find(".//COFINS")
-    if cofins is None: return r
-    for filho in cofins:
-        if any(x in filho.tag for x in _COFINS_TAGS):
-            r.update({
-                "COFINS_CST":     _t(filho,"CST"),
-                "COFINS_vBC":     _t(filho,"vBC"),
-                "COFINS_pCOFINS": _t(filho,"pCOFINS"),
-                "COFINS_vCOFINS": _t(filho,"vCOFINS"),
-            })
-            break
-    return r
-
-def _extrair_ibscbs(imposto, det):
-    r = {k:"" for k in [
-        "IBS_CST","cClassTrib","IBS_vBC",
-        "pIBSUF","vIBSUF","pIBSMun","vIBSMun",
-        "IBS_vIBS","pCBS","CBS_vCBS",
-    ]}
-    ibscbs = imposto.find(".//IBSCBS") or imposto.find(".//IBS")
-    if ibscbs is None:
-        vcbs = imposto.find(".//vCBS") or det.find(".//vCBS")
-        if vcbs is not None and vcbs.text:
-            r["CBS_vCBS"] = vcbs.text.strip()
-        return r
-
-    r["IBS_CST"]    = _t(ibscbs,"CST")
-    r["cClassTrib"] = _t(ibscbs,"cClassTrib")
-
-    g    = ibscbs.find(".//gIBSCBS")
-    base = g if g is not None else ibscbs
-
-    vbc = base.find(".//vBC")
-    r["IBS_vBC"] = vbc.text.strip() if vbc is not None and vbc.text else _t(base,"vBC")
-
-    guf = base.find(".//gIBSUF")
-    if guf is not None:
-        r["pIBSUF"] = _t(guf,"pIBSUF")
-        r["vIBSUF"] = _t(guf,"vIBSUF")
-
-    gmun = base.find(".//gIBSMun")
-    if gmun is not None:
-        r["pIBSMun"] = _t(gmun,"pIBSMun")
-        r["vIBSMun"] = _t(gmun,"vIBSMun")
-
-    vibs = base.find(".//vIBS")
-    r["IBS_vIBS"] = vibs.text.strip() if vibs is not None and vibs.text else _t(base,"vIBS")
-
-    gcbs = base.find(".//gCBS")
-    if gcbs is not None:
-        r["pCBS"]     = _t(gcbs,"pCBS")
-        r["CBS_vCBS"] = _t(gcbs,"vCBS")
-    else:
-        vcbs = base.find(".//vCBS") or det.find(".//vCBS")
-        if vcbs is not None and vcbs.text:
-            r["CBS_vCBS"] = vcbs.text.strip()
-
-    return r
-
-
-def extrair_produtos(caminho_xml):
-    produtos = []
+# ── Plano de extração do det ──────────────────────────────────────────────────
+# Cada coluna do CABECALHO_NFE aponta para um caminho relativo ao <det>.
+# Grupos com variantes (ICMS00/ICMSSN102…, IPITrib/IPINT, PISAliq/PISNT…) são
+# normalizados para "*" antes da consulta, então um único caminho cobre todas.
+
+_VARIANTES = dict.fromkeys(_ICMS_TAGS + _IPI_TAGS + _PIS_TAGS + _COFINS_TAGS, "*")
+_VARIANTES["IBS"] = "IBSCBS"
+
+# prefixo da coluna → grupo do imposto
+_GRUPOS_IMPOSTO = {
+    "ICMS_":   "imposto/ICMS/*",
+    "IPI_":    "imposto/IPI/*",
+    "PIS_":    "imposto/PIS/*",
+    "COFINS_": "imposto/COFINS/*",
+}
+
+# Colunas com caminho próprio — (caminho, prioridade); menor prioridade vence,
+# as demais são alternativas para XMLs sem o subgrupo gIBSCBS/gCBS.
+_CAMINHOS_FIXOS = {
+    "IPI_cEnq":   [("imposto/IPI/cEnq", 0)],
+    "IBS_CST":    [("imposto/IBSCBS/CST", 0)],
+    "cClassTrib": [("imposto/IBSCBS/cClassTrib", 0)],
+    "IBS_vBC":    [("imposto/IBSCBS/gIBSCBS/vBC", 0), ("imposto/IBSCBS/vBC", 1)],
+    "pIBSUF":     [("imposto/IBSCBS/gIBSCBS/gIBSUF/pIBSUF", 0), ("imposto/IBSCBS/gIBSUF/pIBSUF", 1)],
+    "vIBSUF":     [("imposto/IBSCBS/gIBSCBS/gIBSUF/vIBSUF", 0), ("imposto/IBSCBS/gIBSUF/vIBSUF", 1)],
+    "pIBSMun":    [("imposto/IBSCBS/gIBSCBS/gIBSMun/pIBSMun", 0), ("imposto/IBSCBS/gIBSMun/pIBSMun", 1)],
+    "vIBSMun":    [("imposto/IBSCBS/gIBSCBS/gIBSMun/vIBSMun", 0), ("imposto/IBSCBS/gIBSMun/vIBSMun", 1)],
+    "IBS_vIBS":   [("imposto/IBSCBS/gIBSCBS/vIBS", 0), ("imposto/IBSCBS/vIBS", 1)],
+    "pCBS":       [("imposto/IBSCBS/gIBSCBS/gCBS/pCBS", 0), ("imposto/IBSCBS/gCBS/pCBS", 1)],
+    "CBS_vCBS":   [("imposto/IBSCBS/gIBSCBS/gCBS/vCBS", 0), ("imposto/IBSCBS/gCBS/vCBS", 1),
+                   ("imposto/IBSCBS/gIBSCBS/vCBS", 2), ("imposto/IBSCBS/vCBS", 2),
+                   ("imposto/vCBS", 2)],
+}
+
+def _compilar_plano(cabecalho):
+    """Compila o cabeçalho numa árvore de despacho indexada pelo caminho:
+    {"imposto": {"ICMS": {"*": {"orig": ("ICMS_orig", 0), ...}}}, ...}."""
+    ini, fim = cabecalho.index("cProd"), cabecalho.index("Arquivo_Origem")
+    plano = {}
+    for col in cabecalho[ini:fim]:
+        if col in _CAMINHOS_FIXOS:
+            caminhos = _CAMINHOS_FIXOS[col]
+        else:
+            grupo = next((g for p, g in _GRUPOS_IMPOSTO.items() if col.startswith(p)), None)
+            if grupo:
+                caminhos = [(f"{grupo}/{col.split('_', 1)[1]}", 0)]
+            else:
+                caminhos = [(f"prod/{col}", 0)]
+        for caminho, prio in caminhos:
+            *grupos, folha = caminho.split("/")
+            no = plano
+            for g in grupos:
+                no = no.setdefault(g, {})
+            no[folha] = (col, prio)
+    return plano
+
+_PLANO = _compilar_plano(CABECALHO_NFE)
+_LINHA_VAZIA = dict.fromkeys(CABECALHO_NFE, "")
+
+_TOKENS = {}   # tag crua ('{ns}ICMS00') → token do plano ('*'), memoizado
+
+def _token(tag):
+    local = nome_local(tag)
+    t = _TOKENS[tag] = _VARIANTES.get(local, local)
+    return t
+
+def _percorrer(el, no, d, prio):
+    """Uma única passada pela subárvore: só desce nos grupos do plano."""
+    for filho in el:
+        tag = filho.tag
+        try:
+            alvo = no.get(_TOKENS[tag])
+        except KeyError:
+            alvo = no.get(_token(tag))
+        if alvo is None:
+            continue
+        if type(alvo) is dict:
+            _percorrer(filho, alvo, d, prio)
+            continue
+        col, p = alvo
+        if p < prio.get(col, 99):
+            prio[col] = p
+            d[col] = filho.text.strip() if filho.text else ""
+
+def _cabecalho_nota(inf, ide, emit, dest, endemit, enddest):
+    """Campos da nota (ide/emit/dest) — repetidos em todas as linhas de produto."""
+    return {
+        "Tipo_Nota":         "NF-e",
+        "Chave_NFe":         inf.get("Id","").replace("NFe",""),
+        "Numero_NFe":        _t(ide,"nNF"),
+        "Serie_NFe":         _t(ide,"serie"),
+        "Mod_NFe":           _t(ide,"mod"),
+        "NatOp":             _t(ide,"natOp"),
+        "Tp_NF":             _t(ide,"tpNF"),
+        "Data_Emissao":      _t(ide,"dhEmi"),
+        "CNPJ_Emitente":     _t(emit,"CNPJ"),
+        "Nome_Emitente":     _t(emit,"xNome"),
+        "NomeFantasia_Emit": _t(emit,"xFant"),
+        "IE_Emitente":       _t(emit,"IE"),
+        "UF_Emitente":       _t(endemit,"UF") if endemit is not None else _t(emit,"UF"),
+        "Mun_Emitente":      _t(endemit,"xMun") if endemit is not None else "",
+        "CNPJ_Destinatario": _t(dest,"CNPJ")  if dest is not None else "",
+        "CPF_Destinatario":  _t(dest,"CPF")   if dest is not None else "",
+        "Nome_Destinatario": _t(dest,"xNome") if dest is not None else "",
+        "IE_Destinatario":   _t(dest,"IE")    if dest is not None else "",
+        "UF_Destinatario":   _t(enddest,"UF")   if enddest is not None else "",
+        "Mun_Destinatario":  _t(enddest,"xMun") if enddest is not None else "",
+    }
+
+def _linha_produto(det, arquivo):
+    """Colunas do item; as da nota ficam vazias até o infNFe fechar."""
+    if det.find("{*}prod") is None: return None
+    d = dict(_LINHA_VAZIA)
+    d["Item"]           = det.get("nItem","")
+    d["Arquivo_Origem"] = arquivo
+    _percorrer(det, _PLANO, d, {})
+    return d
+
+# Grupos do cabeçalho capturados uma única vez (primeira ocorrência)
+_GRUPOS_NOTA = ("ide", "emit", "dest", "enderEmit", "enderDest")
+_TAGS_NFE    = ("NFe", "infNFe", "det") + _GRUPOS_NOTA
+_SOLTAR      = ("det",)   # cada det sai da árvore depois de virar linha
+
+
+def _ler_nfe(eventos, arquivo):
+    """Consome os (tag, elemento) de _TAGS_NFE: uma linha por det, montada
+    quando o det fecha; o iterparse (soltar=_SOLTAR) esvazia o det e o tira
+    do infNFe em seguida. Os campos da nota (chave vem do Id do infNFe) são
+    preenchidos quando o infNFe fecha."""
+    produtos  = []
+    achou_nfe = False
+    inf       = None        # infNFe da primeira NFe
+    grupos    = {}
+    achou_det = False
+
+    for tag, el in eventos:
+        if tag == "NFe":
+            achou_nfe = True
+        elif inf is not None:
+            continue        # demais NFe do arquivo são ignoradas (como antes)
+        elif tag == "det":
+            achou_det = True
+            d = _linha_produto(el, arquivo)
+            if d is not None:
+                produtos.append(d)
+        elif tag in _GRUPOS_NOTA:
+            if tag not in grupos:
+                grupos[tag] = localizar(el)   # _t() busca pelo nome local
+        elif tag == "infNFe":
+            inf = el
+            cab = _cabecalho_nota(inf, *(grupos.get(g) for g in _GRUPOS_NOTA))
+            for d in produtos:
+                d.update(cab)
+
+    if not achou_nfe:
+        return [], "ERRO: Tag NFe nao encontrada"
+    if inf is None:
+        return [], "ERRO: Tag infNFe nao encontrada"
+    if not achou_det:
+        return [], "AVISO: Nenhum produto (det) encontrado"
+
+    msg = f"Encontrados {len(produtos)} produto(s)"
+    return (produtos, msg) if produtos else ([], "Nenhum produto encontrado")
+
+
+def extrair_produtos(caminho_xml, backend=None):
+    """Lê a NF-e em streaming — memória não cresce com o nº de itens.
+    backend: None usa o padrão de xml_parser ("lxml" se instalado)."""
+    arquivo = os.path.basename(caminho_xml)
     try:
-        root = _parsear_xml(caminho_xml)
-        nfe  = root.find(".//NFe")
-        if nfe is None:
-            nfe = root if "NFe" in root.tag else None
-        if nfe is None:
-            return [], "ERRO: Tag NFe nao encontrada"
-
-        inf = nfe.find(".//infNFe")
-        if inf is None:
-            return [], "ERRO: Tag infNFe nao encontrada"
-
-        ide     = inf.find(".//ide")
-        emit    = inf.find(".//emit")
-        dest    = inf.find(".//dest")
-        endemit = inf.find(".//enderEmit")
-        enddest = inf.find(".//enderDest")
-
-        chave    = inf.get("Id","").replace("NFe","")
-        num_nfe  = _t(ide,"nNF")
-        serie    = _t(ide,"serie")
-        dh_emi   = _t(ide,"dhEmi")
-        nat_op   = _t(ide,"natOp")
-        mod      = _t(ide,"mod")
-        tp_nf    = _t(ide,"tpNF")
-
-        cnpj_emit = _t(emit,"CNPJ")
-        nome_emit = _t(emit,"xNome")
-        fant_emit = _t(emit,"xFant")
-        ie_emit   = _t(emit,"IE")
-        uf_emit   = _t(endemit,"UF") if endemit is not None else _t(emit,"UF")
-        mun_emit  = _t(endemit,"xMun") if endemit is not None else ""
-
-        cnpj_dest = _t(dest,"CNPJ") if dest is not None else ""
-        cpf_dest  = _t(dest,"CPF")  if dest is not None else ""
-        nome_dest = _t(dest,"xNome") if dest is not None else ""
-        ie_dest   = _t(dest,"IE")    if dest is not None else ""
-        uf_dest   = _t(enddest,"UF")   if enddest is not None else ""
-        mun_dest  = _t(enddest,"xMun") if enddest is not None else ""
-
-        lista_det = inf.findall(".//det")
-        if not lista_det:
-            return [], "AVISO: Nenhum produto (det) encontrado"
-
-        for det in lista_det:
-            prod    = det.find(".//prod")
-            if prod is None: continue
-            imposto = det.find(".//imposto")
-
-            d = {
-                "Tipo_Nota":         "NF-e",
-                "Chave_NFe":         chave,
-                "Numero_NFe":        num_nfe,
-                "Serie_NFe":         serie,
-                "Mod_NFe":           mod,
-                "NatOp":             nat_op,
-                "Tp_NF":             tp_nf,
-                "Data_Emissao":      dh_emi,
-                "CNPJ_Emitente":     cnpj_emit,
-                "Nome_Emitente":     nome_emit,
-                "NomeFantasia_Emit": fant_emit,
-                "IE_Emitente":       ie_emit,
-                "UF_Emitente":       uf_emit,
-                "Mun_Emitente":      mun_emit,
-                "CNPJ_Destinatario": cnpj_dest,
-                "CPF_Destinatario":  cpf_dest,
-                "Nome_Destinatario": nome_dest,
-                "IE_Destinatario":   ie_dest,
-                "UF_Destinatario":   uf_dest,
-                "Mun_Destinatario":  mun_dest,
-                "Item":              det.get("nItem",""),
-                "cProd":             _t(prod,"cProd"),
-                "cEAN":              _t(prod,"cEAN"),
-                "xProd":             _t(prod,"xProd"),
-                "NCM":               _t(prod,"NCM"),
-                "CEST":              _t(prod,"CEST"),
-                "CFOP":              _t(prod,"CFOP"),
-                "uCom":              _t(prod,"uCom"),
-                "qCom":              _t(prod,"qCom"),
-                "vUnCom":            _t(prod,"vUnCom"),
-                "vProd":             _t(prod,"vProd"),
-                "indEscala":         _t(prod,"indEscala"),
-                "nFCI":              _t(prod,"nFCI"),
-                # impostos zerados por padrão
-                "ICMS_orig":"","ICMS_CST":"","ICMS_modBC":"",
-                "ICMS_vBC":"","ICMS_pICMS":"","ICMS_vICMS":"",
-                "ICMS_vBCSTRet":"","ICMS_pST":"","ICMS_vICMSSubstituto":"",
-                "ICMS_vICMSSTRet":"","ICMS_pRedBCEfet":"","ICMS_vBCEfet":"",
-                "ICMS_pICMSEfet":"","ICMS_vICMSEfet":"",
-                "IPI_cEnq":"","IPI_CST":"","IPI_vBC":"","IPI_pIPI":"","IPI_vIPI":"",
-                "PIS_CST":"","PIS_vBC":"","PIS_pPIS":"","PIS_vPIS":"",
-                "COFINS_CST":"","COFINS_vBC":"","COFINS_pCOFINS":"","COFINS_vCOFINS":"",
-                "IBS_CST":"","cClassTrib":"","IBS_vBC":"",
-                "pIBSUF":"","vIBSUF":"","pIBSMun":"","vIBSMun":"",
-                "IBS_vIBS":"","pCBS":"","CBS_vCBS":"",
-                "Arquivo_Origem":    os.path.basename(caminho_xml),
-            }
-
-            if imposto is not None:
-                d.update(_extrair_icms(imposto))
-                d.update(_extrair_ipi(imposto))
-                d.update(_extrair_pis(imposto))
-                d.update(_extrair_cofins(imposto))
-                d.update(_extrair_ibscbs(imposto, det))
-
-            produtos.append(d)
-
-        msg = f"Encontrados {len(produtos)} produto(s)"
-        return (produtos, msg) if produtos else ([], "Nenhum produto encontrado")
-
-    except ET.ParseError as e:
+        try:
+            return _ler_nfe(iterparse(caminho_xml, _TAGS_NFE, backend=backend, soltar=_SOLTAR), arquivo)
+        except ErroXML:
+            return _ler_nfe(iterparse(caminho_xml, _TAGS_NFE, tolerante=True, soltar=_SOLTAR), arquivo)
+    except ErroXML as e:
         return [], f"ERRO XML: {str(e)[:80]}"
     except Exception as e:
         return [], f"ERRO: {str(e)[:80]}"
@@ -1244,21 +1244,32 @@ class AplicacaoLeitorXML:
     
     def visualizar_excel(self):
         try:
-            if not os.path.exists(EXCEL_TEMP):
-                messagebox.showwarning("Aviso", "Arquivo Excel local não encontrado!\nExecute algum processamento primeiro.")
+            if not os.path.exists(CSV_TEMP):
+                messagebox.showwarning("Aviso", "Nenhum dado processado nesta sessão!\nExecute algum processamento primeiro.")
                 return
             
             if sincronizar_excel_temp():
                 self.log("Excel local sincronizado antes da visualização", "success")
             
-            df = pd.read_excel(EXCEL_TEMP, dtype=str)
+            # Grade virtual: lê do CSV da sessão só as linhas/colunas visíveis
+            # (índice de posições), em vez de carregar o Excel inteiro no Treeview
+            from load.paginas import PaginasCSV
+            from ui.grade import GradeVirtual
+            
+            colunas_principais = ['Chave_NFe', 'Item', 'cProd', 'xProd', 'NCM', 'CFOP', 
+                                 'ICMS_CST', 'ICMS_vICMS', 
+                                 'PIS_CST', 'PIS_vPIS', 
+                                 'COFINS_CST', 'COFINS_vCOFINS', 
+                                 'cClassTrib', 'IBS_vBC', 'IBS_vIBS', 'CBS_vCBS']
+            fonte = PaginasCSV(CSV_TEMP, colunas_principais)
             
-            if df.empty or len(df) == 0:
-                messagebox.showinfo("Informação", "O Excel está vazio!")
+            if len(fonte) == 0:
+                fonte.fechar()
+                messagebox.showinfo("Informação", "Nenhum produto nesta sessão!")
                 return
             
             janela_excel = ctk.CTkToplevel(self.janela)
-            janela_excel.title(f"Visualizar Dados - {len(df)} produtos (Sessão: {SESSAO_ID[:10]}...)")
+            janela_excel.title(f"Visualizar Dados - {len(fonte)} produtos (Sessão: {SESSAO_ID[:10]}...)")
             janela_excel.geometry("1400x800")
             janela_excel.transient(self.janela)
             janela_excel.grab_set()
@@ -1272,7 +1283,7 @@ class AplicacaoLeitorXML:
             
             ctk.CTkLabel(
                 header_frame,
-                text=f"Visualização de Dados - {len(df)} produtos (Sessão Local)",
+                text=f"Visualização de Dados - {len(fonte)} produtos (Sessão Local)",
                 font=ctk.CTkFont(size=18, weight="bold")
             ).grid(row=0, column=0, pady=10, sticky="w")
             
@@ -1299,23 +1310,8 @@ class AplicacaoLeitorXML:
             style.map("Treeview.Heading",
                 background=[('active', '#3484F0')])
             
-            tree = ttk.Treeview(tree_frame, style="Treeview")
-            
-            scroll_y = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-            scroll_x = ttk.Scrollbar(tree_frame, orient="horizontal", command=tree.xview)
-            tree.configure(yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set)
-            
-            colunas_principais = ['#', 'Chave_NFe', 'Item', 'cProd', 'xProd', 'NCM', 'CFOP', 
-                                 'ICMS_CST', 'ICMS_vICMS', 
-                                 'PIS_CST', 'PIS_vPIS', 
-                                 'COFINS_CST', 'COFINS_vCOFINS', 
-                                 'cClassTrib', 'IBS_vBC', 'IBS_vIBS', 'CBS_vCBS']
-            
-            tree['columns'] = colunas_principais
-            tree['show'] = 'headings'
-            
             larguras = {
-                '#': 50, 'Chave_NFe': 150, 'Item': 60, 'cProd': 100, 'xProd': 200, 
+                'Chave_NFe': 150, 'Item': 60, 'cProd': 100, 'xProd': 200, 
                 'NCM': 80, 'CFOP': 80,
                 'ICMS_CST': 80, 'ICMS_vICMS': 100,
                 'PIS_CST': 80, 'PIS_vPIS': 100,
@@ -1323,35 +1319,10 @@ class AplicacaoLeitorXML:
                 'cClassTrib': 100, 'IBS_vBC': 100, 'IBS_vIBS': 100, 'CBS_vCBS': 100
             }
             
-            for col in colunas_principais:
-                tree.heading(col, text=col)
-                tree.column(col, width=larguras.get(col, 100), anchor=tk.W)
-            
-            for i, (_, row) in enumerate(df.iterrows(), 1):
-                valores = [
-                    str(i),
-                    row.get('Chave_NFe', '')[:20],
-                    row.get('Item', ''),
-                    row.get('cProd', ''),
-                    str(row.get('xProd', ''))[:30],
-                    row.get('NCM', ''),
-                    row.get('CFOP', ''),
-                    row.get('ICMS_CST', ''),
-                    row.get('ICMS_vICMS', ''),
-                    row.get('PIS_CST', ''),
-                    row.get('PIS_vPIS', ''),
-                    row.get('COFINS_CST', ''),
-                    row.get('COFINS_vCOFINS', ''),
-                    row.get('cClassTrib', ''),
-                    row.get('IBS_vBC', ''),
-                    row.get('IBS_vIBS', ''),
-                    row.get('CBS_vCBS', '')
-                ]
-                tree.insert("", tk.END, values=valores)
-            
-            tree.grid(row=0, column=0, sticky="nsew")
-            scroll_y.grid(row=0, column=1, sticky="ns")
-            scroll_x.grid(row=1, column=0, sticky="ew")
+            grade = GradeVirtual(tree_frame, fonte, larguras, largura_padrao=100, bg="#2a2d2e")
+            grade.tree.tag_configure("par", background="#2f3335")
+            grade.tree.tag_configure("impar", background="#2a2d2e")
+            grade.grid(row=0, column=0, sticky="nsew")
             
             btn_frame = ctk.CTkFrame(janela_excel, fg_color="transparent")
             btn_frame.grid(row=2, column=0, padx=20, pady=(0, 20), sticky="ew")
@@ -1359,7 +1330,7 @@ class AplicacaoLeitorXML:
             ctk.CTkButton(
                 btn_frame,
                 text="Copiar Seleção",
-                command=lambda: self.copiar_selecao(tree),
+                command=lambda: self.copiar_selecao(grade),
                 width=150,
                 height=35,
                 font=ctk.CTkFont(size=12),
@@ -1390,21 +1361,20 @@ class AplicacaoLeitorXML:
                 hover_color="#c0392b"
             ).pack(side="left", padx=5)
             
-            self.log(f"Visualizando dados: {len(df)} produtos", "info")
+            self.log(f"Visualizando dados: {len(fonte)} produtos", "info")
             
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao visualizar dados:\n{str(e)}")
     
-    def copiar_selecao(self, tree):
+    def copiar_selecao(self, grade):
         try:
-            selecionados = tree.selection()
+            selecionados = grade.linhas_selecionadas()
             if not selecionados:
                 messagebox.showinfo("Informação", "Nenhum item selecionado!")
                 return
             
             textos = []
-            for item in selecionados:
-                valores = tree.item(item, 'values')
+            for valores in selecionados:
                 textos.append("\t".join(str(v) for v in valores))
             
             self.janela.clipboard_clear()
@@ -0,0 +1,255 @@
+"""
+load/backup.py
+Backups incrementais do histórico principal (CSV base + segmentos, ou SQLite).
+
+Cada ponto de backup guarda só a diferença para o ponto anterior — linhas que
+entraram (<momento>_delta.csv.gz) e digests das chaves que saíram
+(<momento>_delta.removidas.gz) — e a cada BACKUP_COMPLETO_A_CADA pontos um
+snapshot completo (<momento>_completo.csv.gz). A diferença sai dos digests de
+8 bytes dos índices de chaves (estado.chaves = digests do último ponto), então
+só as linhas novas são lidas do histórico.
+
+restaurar() remonta qualquer ponto: snapshot + deltas até ele.
+
+Uma cadeia por histórico: a pasta leva o nome do principal + hash do caminho
+absoluto (duas PASTA_BASE com o mesmo produtos_nfe não se misturam), e o
+origem.json dentro dela guarda o caminho, conferido na restauração.
+"""
+
+import csv, gzip, hashlib, json, os
+from datetime import datetime, timedelta
+from itertools import islice
+
+import numpy as np
+
+from config.settings import BACKUP_COMPLETO_A_CADA, BACKUP_RETENCAO_DIAS, PASTA_BACKUP
+from transform.indice import carregar_indice, digest
+from . import banco, segmentos
+from .banco import tabela_de
+
+_FMT       = "%Y%m%d_%H%M%S_%f"
+_COMPLETO  = "_completo.csv.gz"
+_DELTA     = "_delta.csv.gz"
+_REMOVIDAS = "_delta.removidas.gz"
+_ESTADO    = "estado.chaves"
+_LOCK      = "backup.lock"
+_ORIGEM    = "origem.json"
+_TAM_PONTO = 32   # cabeçalho do estado.chaves: nome do ponto a que ele corresponde
+
+def _absoluto(caminho_principal):
+    return os.path.normcase(os.path.abspath(caminho_principal))
+
+def pasta(caminho_principal):
+    nome = os.path.splitext(os.path.basename(caminho_principal))[0]
+    h = hashlib.sha1(_absoluto(caminho_principal).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(PASTA_BACKUP, f"{nome}_{h}")
+
+def origem(caminho_principal):
+    """Caminho do histórico gravado na cadeia (None se não há cadeia)."""
+    try:
+        with open(os.path.join(pasta(caminho_principal), _ORIGEM), "r", encoding="utf-8") as f:
+            return json.load(f).get("principal")
+    except (OSError, ValueError):
+        return None
+
+def _gravar_origem(caminho_principal):
+    destino = os.path.join(pasta(caminho_principal), _ORIGEM)
+    if origem(caminho_principal) == _absoluto(caminho_principal):
+        return
+    with open(destino + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"principal": _absoluto(caminho_principal)}, f, ensure_ascii=False)
+    os.replace(destino + ".tmp", destino)
+
+def pontos(caminho_principal):
+    """[(momento, "completo" | "delta", prefixo)] em ordem cronológica."""
+    try:
+        nomes = sorted(os.listdir(pasta(caminho_principal)))
+    except OSError:
+        return []
+    achados = []
+    for n in nomes:
+        for sufixo, tipo in ((_COMPLETO, "completo"), (_DELTA, "delta")):
+            if n.endswith(sufixo):
+                ponto = n[:-len(sufixo)]
+                achados.append((datetime.strptime(ponto, _FMT), tipo,
+                                os.path.join(pasta(caminho_principal), ponto)))
+    return achados
+
+# ── Histórico atual ────────────────────────────────────────────────────────────
+
+def _np(digests):
+    return np.frombuffer(digests, dtype=np.uint64)
+
+def _digests_atuais(caminho_principal, chave_fn):
+    if tabela_de(caminho_principal):
+        d = np.fromiter((digest(k) for k in banco.chaves(caminho_principal)), dtype=np.uint64)
+    else:
+        d = _np(segmentos.digests(caminho_principal, chave_fn))
+    return np.unique(d)
+
+def _todas_linhas(caminho_principal, chave_fn):
+    if tabela_de(caminho_principal):
+        return banco.linhas(caminho_principal)
+    return segmentos.linhas(caminho_principal, chave_fn)
+
+def _linhas_de(caminho_principal, chave_fn, procurados):
+    """Linhas do histórico cujos digests estão em `procurados`. No CSV só
+    abre os arquivos cujo índice tem algum deles (em geral o último segmento)."""
+    faltam = set(procurados.tolist())
+    if tabela_de(caminho_principal):
+        selecao = [k for k in banco.chaves(caminho_principal) if digest(k) in faltam]
+        yield from banco.linhas(caminho_principal, selecao)
+        return
+    for c in segmentos.arquivos(caminho_principal):
+        if not faltam:
+            return
+        if not np.isin(_np(carregar_indice(c, chave_fn)), procurados).any():
+            continue
+        for row in segmentos._linhas(c):
+            d = digest(chave_fn(row))
+            if d in faltam:
+                faltam.discard(d)
+                yield row
+
+# ── Arquivos do backup ─────────────────────────────────────────────────────────
+
+def _gravar_linhas(destino, cabecalho, linhas):
+    tmp = destino + ".tmp"
+    with gzip.open(tmp, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
+        writer.writeheader()
+        for row in linhas:
+            writer.writerow({c: row.get(c,"") for c in cabecalho})
+    os.replace(tmp, destino)
+
+def _gravar_removidas(destino, digests):
+    tmp = destino + ".tmp"
+    with gzip.open(tmp, "wb") as f:
+        f.write(digests.astype("<u8").tobytes())
+    os.replace(tmp, destino)
+
+def _ler_removidas(prefixo):
+    try:
+        with gzip.open(prefixo + _REMOVIDAS, "rb") as f:
+            return np.frombuffer(f.read(), dtype="<u8").astype(np.uint64)
+    except OSError:
+        return np.empty(0, dtype=np.uint64)
+
+def _gravar_estado(caminho_principal, ponto, digests):
+    destino = os.path.join(pasta(caminho_principal), _ESTADO)
+    with open(destino + ".tmp", "wb") as f:
+        f.write(ponto.encode("ascii").ljust(_TAM_PONTO))
+        f.write(digests.astype("<u8").tobytes())
+    os.replace(destino + ".tmp", destino)
+
+def _ler_estado(caminho_principal, ponto):
+    """Digests do último ponto — None se o estado não é desse ponto (queda
+    entre gravar o ponto e o estado): aí o próximo ponto é completo."""
+    try:
+        with open(os.path.join(pasta(caminho_principal), _ESTADO), "rb") as f:
+            if f.read(_TAM_PONTO).rstrip() != ponto.encode("ascii"):
+                return None
+            return np.frombuffer(f.read(), dtype="<u8").astype(np.uint64)
+    except OSError:
+        return None
+
+# ── Gravação ───────────────────────────────────────────────────────────────────
+
+def registrar(caminho_principal, cabecalho, chave_fn):
+    """Grava um ponto de backup com o estado atual do histórico.
+    Retorna (tipo, nº de linhas gravadas) — ou None se nada mudou desde o
+    último ponto (ou outro processo está gravando backup agora)."""
+    os.makedirs(pasta(caminho_principal), exist_ok=True)
+    lock = segmentos._tomar_lock(os.path.join(pasta(caminho_principal), _LOCK), ttl=3600)
+    if lock is None:
+        return None
+    try:
+        _gravar_origem(caminho_principal)
+        atual = _digests_atuais(caminho_principal, chave_fn)
+        ps    = pontos(caminho_principal)
+        anterior = _ler_estado(caminho_principal, os.path.basename(ps[-1][2])) if ps else None
+        if anterior is None and not len(atual):
+            return None
+        tipos  = [p[1] for p in ps]
+        deltas = tipos[::-1].index("completo") if "completo" in tipos else None   # desde o último snapshot
+
+        ponto   = datetime.now().strftime(_FMT)
+        prefixo = os.path.join(pasta(caminho_principal), ponto)
+        if anterior is None or deltas is None or deltas + 1 >= BACKUP_COMPLETO_A_CADA:
+            _gravar_linhas(prefixo + _COMPLETO, cabecalho, _todas_linhas(caminho_principal, chave_fn))
+            resultado = ("completo", len(atual))
+        else:
+            novas = np.setdiff1d(atual, anterior, assume_unique=True)
+            saiu  = np.setdiff1d(anterior, atual, assume_unique=True)
+            if not len(novas) and not len(saiu):
+                return None
+            # removidas antes: o ponto só "existe" quando o .csv.gz aparece
+            _gravar_removidas(prefixo + _REMOVIDAS, saiu)
+            _gravar_linhas(prefixo + _DELTA, cabecalho, _linhas_de(caminho_principal, chave_fn, novas))
+            resultado = ("delta", len(novas))
+        _gravar_estado(caminho_principal, ponto, atual)
+        _podar(caminho_principal)
+        return resultado
+    finally:
+        try: os.remove(lock)
+        except OSError: pass
+
+def _podar(caminho_principal):
+    """Apaga cadeias (snapshot + seus deltas) cujo ponto mais novo passou de
+    BACKUP_RETENCAO_DIAS. A cadeia mais recente nunca é apagada."""
+    limite = datetime.now() - timedelta(days=BACKUP_RETENCAO_DIAS)
+    cadeias = []
+    for p in pontos(caminho_principal):
+        if p[1] == "completo" or not cadeias:
+            cadeias.append([])
+        cadeias[-1].append(p)
+    for cadeia in cadeias[:-1]:
+        if cadeia[-1][0] >= limite:
+            continue
+        for _, _, prefixo in cadeia:
+            for sufixo in (_COMPLETO, _DELTA, _REMOVIDAS):
+                try: os.remove(prefixo + sufixo)
+                except OSError: pass
+
+# ── Restauração ────────────────────────────────────────────────────────────────
+
+def restaurar(caminho_principal, cabecalho, chave_fn, momento=None, destino=None):
+    """Remonta o histórico como estava no último ponto até `momento`
+    (datetime; None = o mais recente). Com `destino` grava um CSV; sem ele o
+    ponto volta a ser o histórico (segmento _substituir / transação no SQLite).
+    Retorna o nº de registros restaurados."""
+    if origem(caminho_principal) != _absoluto(caminho_principal):
+        raise ValueError(f"backups em {pasta(caminho_principal)} não são de {caminho_principal}")
+    ps = [p for p in pontos(caminho_principal) if momento is None or p[0] <= momento]
+    completos = [i for i, p in enumerate(ps) if p[1] == "completo"]
+    if not completos:
+        raise ValueError("nenhum ponto de backup restaurável até esse momento")
+    cadeia    = ps[completos[-1]:]
+    removidas = [_ler_removidas(p[2]) for p in cadeia]
+
+    def _linhas():
+        for i, (_, tipo, prefixo) in enumerate(cadeia):
+            # linha de um ponto some se a chave saiu num ponto posterior
+            depois = np.unique(np.concatenate([np.empty(0, dtype=np.uint64)] + removidas[i + 1:]))
+            with gzip.open(prefixo + (_COMPLETO if tipo == "completo" else _DELTA),
+                           "rt", newline="", encoding="utf-8") as f:
+                leitor = csv.DictReader(f)
+                for bloco in iter(lambda: list(islice(leitor, 5000)), []):
+                    if not len(depois):
+                        yield from bloco
+                        continue
+                    ds = np.fromiter((digest(chave_fn(r)) for r in bloco), dtype=np.uint64, count=len(bloco))
+                    yield from (r for r, fora in zip(bloco, np.isin(ds, depois)) if not fora)
+
+    if destino:
+        n = 0
+        with open(destino, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
+            writer.writeheader()
+            for row in _linhas():
+                writer.writerow({c: row.get(c,"") for c in cabecalho})
+                n += 1
+        return n
+    if tabela_de(caminho_principal):
+        return banco.substituir(caminho_principal, _linhas())
+    return segmentos.publicar(caminho_principal, _linhas(), cabecalho, chave_fn, substituir=True)
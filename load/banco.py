@@ -0,0 +1,164 @@
+"""
+load/banco.py
+Histórico principal em SQLite (modo WAL) — alternativa aos CSVs principais,
+ativada com ARMAZENAMENTO = "sqlite" em settings.py.
+
+Uma tabela por tipo (nfe / nfse) com a chave de deduplicação como PRIMARY KEY:
+append e sincronização viram INSERT OR IGNORE numa transação, contagem é
+COUNT(*) e o SQLite cuida do lock entre usuários da mesma PASTA_BASE.
+Os CSVs temporários da sessão continuam sendo CSV (são privados da sessão).
+Os caminhos CSV_PRINCIPAL / CSV_NFSE_PRINCIPAL continuam sendo a "identidade"
+do histórico na API de load/storage.py — só o armazenamento muda.
+"""
+
+import csv, sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from config.settings import (
+    ARMAZENAMENTO, CABECALHO_CSV, CABECALHO_NFSE,
+    CSV_PRINCIPAL, CSV_NFSE_PRINCIPAL, DB_PRINCIPAL,
+)
+from transform.validator import chave_nfse, chave_produto
+
+# caminho "lógico" → (tabela, cabeçalho, chave, colunas indexadas)
+_TABELAS = {
+    CSV_PRINCIPAL:      ("nfe",  CABECALHO_CSV,  chave_produto, ("CNPJ_Emitente", "Data_Emissao", "NCM")),
+    CSV_NFSE_PRINCIPAL: ("nfse", CABECALHO_NFSE, chave_nfse,    ("CNPJ_Prestador", "Data_Emissao")),
+}
+
+def tabela_de(caminho):
+    """Tabela que guarda esse histórico — ou None se ele é um CSV comum."""
+    return _TABELAS.get(caminho) if ARMAZENAMENTO == "sqlite" else None
+
+def _q(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+def _criar_tabela(con, nome, cabecalho, indices):
+    """Cria a tabela/índices se faltarem e adiciona colunas novas do cabeçalho
+    (equivalente ao _migrar_csv dos CSVs)."""
+    con.execute(f"CREATE TABLE IF NOT EXISTS {nome} (chave TEXT PRIMARY KEY, "
+                + ", ".join(f"{_q(c)} TEXT" for c in cabecalho) + ")")
+    existentes = {r[1] for r in con.execute(f"PRAGMA table_info({nome})")}
+    for c in cabecalho:
+        if c not in existentes:
+            con.execute(f"ALTER TABLE {nome} ADD COLUMN {_q(c)} TEXT")
+    for c in indices:
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{nome}_{c.lower()} ON {nome} ({_q(c)})")
+
+def conectar():
+    con = sqlite3.connect(DB_PRINCIPAL, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    with con:
+        for nome, cab, _, indices in _TABELAS.values():
+            _criar_tabela(con, nome, cab, indices)
+    return con
+
+def _inserir(con, nome, cabecalho, chave_fn, linhas):
+    sql = (f"INSERT OR IGNORE INTO {nome} (chave, " + ", ".join(_q(c) for c in cabecalho)
+           + ") VALUES (" + ", ".join("?" * (len(cabecalho) + 1)) + ")")
+    antes = con.total_changes
+    con.executemany(sql, ([chave_fn(r)] + [r.get(c, "") or "" for c in cabecalho] for r in linhas))
+    return con.total_changes - antes
+
+def inserir(caminho, linhas):
+    """Append deduplicado numa única transação. Retorna quantas linhas entraram."""
+    nome, cab, chave_fn, _ = _TABELAS[caminho]
+    with closing(conectar()) as con, con:
+        return _inserir(con, nome, cab, chave_fn, linhas)
+
+def substituir(caminho, linhas):
+    """Troca todo o conteúdo do histórico numa única transação."""
+    nome, cab, chave_fn, _ = _TABELAS[caminho]
+    with closing(conectar()) as con, con:
+        con.execute(f"DELETE FROM {nome}")
+        return _inserir(con, nome, cab, chave_fn, linhas)
+
+def _onde(colunas, filtro):
+    """filtro = (texto, coluna ou None = qualquer uma de `colunas`) → WHERE e parâmetros."""
+    if not filtro or not filtro[0]:
+        return "", []
+    texto, coluna = filtro
+    alvo = [coluna] if coluna else list(colunas)
+    return (" WHERE " + " OR ".join(f"instr(lower({_q(c)}), ?) > 0" for c in alvo),
+            [str(texto).lower()] * len(alvo))
+
+def contar(caminho, filtro=None):
+    nome, cab, _, _ = _TABELAS[caminho]
+    where, params = _onde(cab, filtro)
+    with closing(conectar()) as con:
+        return con.execute(f"SELECT COUNT(*) FROM {nome}{where}", params).fetchone()[0]
+
+def versao(caminho):
+    """(nº de linhas, maior rowid) — muda a cada inserção ou substituição."""
+    nome = _TABELAS[caminho][0]
+    with closing(conectar()) as con:
+        return tuple(con.execute(f"SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM {nome}").fetchone())
+
+def pagina(caminho, colunas, inicio, n, ordem=None, numerica=False, decrescente=False, filtro=None):
+    """Linhas [inicio, inicio+n) do histórico como listas de `colunas` — ordenação
+    e filtro feitos pelo SQLite (ordem = coluna; numerica = compara como número)."""
+    nome, cab, _, _ = _TABELAS[caminho]
+    where, params = _onde(cab, filtro)
+    chave = f"CAST({_q(ordem)} AS REAL)" if ordem and numerica else (_q(ordem) if ordem else "rowid")
+    sentido = " DESC" if decrescente else ""
+    sql = (f"SELECT {', '.join(_q(c) for c in colunas)} FROM {nome}{where} "
+           f"ORDER BY {chave}{sentido}, rowid{sentido} LIMIT ? OFFSET ?")
+    with closing(conectar()) as con:
+        return [["" if v is None else v for v in r]
+                for r in con.execute(sql, params + [int(n), int(inicio)])]
+
+def ler_df(caminho, cabecalho, periodo=None):
+    """periodo = (inicio, fim) em texto ISO, inclusivo — usa o índice de Data_Emissao."""
+    nome = _TABELAS[caminho][0]
+    where, params = "", []
+    if periodo is not None:
+        ini, fim = periodo
+        where  = ' WHERE "Data_Emissao" >= ? AND "Data_Emissao" < ?'
+        params = [str(ini) if ini else "0000", (str(fim) if fim else "9999") + "\uffff"]
+    with closing(conectar()) as con:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(_q(c) for c in cabecalho)} FROM {nome}{where} ORDER BY rowid",
+            con, params=params, dtype=str)
+    return df.fillna("")
+
+def exportar_csv(caminho, destino):
+    """Grava o histórico num CSV (usado para montar o temp no modo acumular)."""
+    nome, cab, _, _ = _TABELAS[caminho]
+    with closing(conectar()) as con, open(destino, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(cab)
+        cur = con.execute(f"SELECT {', '.join(_q(c) for c in cab)} FROM {nome} ORDER BY rowid")
+        while True:
+            bloco = cur.fetchmany(5000)
+            if not bloco: break
+            w.writerows([["" if v is None else v for v in r] for r in bloco])
+
+def chaves(caminho):
+    """Chaves de deduplicação do histórico, em blocos (sem montar lista)."""
+    nome = _TABELAS[caminho][0]
+    with closing(conectar()) as con:
+        cur = con.execute(f"SELECT chave FROM {nome} ORDER BY rowid")
+        while True:
+            bloco = cur.fetchmany(5000)
+            if not bloco: break
+            yield from (r[0] for r in bloco)
+
+def linhas(caminho, selecao=None):
+    """Registros do histórico como dicts — todos, ou só os de `selecao` (chaves)."""
+    nome, cab, _, _ = _TABELAS[caminho]
+    sql = f"SELECT {', '.join(_q(c) for c in cab)} FROM {nome}"
+    with closing(conectar()) as con:
+        if selecao is None:
+            cur = con.execute(sql + " ORDER BY rowid")
+            blocos = iter(lambda: cur.fetchmany(5000), [])
+        else:
+            selecao = list(selecao)
+            blocos = (con.execute(sql + f" WHERE chave IN ({', '.join('?' * len(parte))}) ORDER BY rowid",
+                                  parte).fetchall()
+                      for parte in (selecao[i:i + 500] for i in range(0, len(selecao), 500)))
+        for bloco in blocos:
+            for r in bloco:
+                yield {c: "" if v is None else v for c, v in zip(cab, r)}
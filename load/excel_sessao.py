@@ -0,0 +1,152 @@
+"""
+load/excel_sessao.py
+Atualização incremental dos Excels da sessão: só as linhas acrescentadas ao
+CSV desde a última exportação são convertidas e anexadas à planilha.
+
+Ao lado de cada .xlsx fica um <arquivo>.xlsx.meta (JSON) com o nº de linhas,
+até onde o CSV já foi exportado (bytes + assinatura dos últimos 4 KB) e o
+tamanho/mtime do próprio .xlsx. Se qualquer um não bater — CSV zerado ou
+reescrito, Excel salvo por fora, cabeçalho diferente — quem chama refaz o
+Excel inteiro com _df_para_excel.
+"""
+
+import csv, hashlib, io, json, os, re, zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+
+_PLANILHA   = "xl/worksheets/sheet1.xml"   # única aba gravada por _df_para_excel
+_FIM_DADOS  = b"</sheetData>"
+_BLOCO      = 1024 * 1024
+_ASSINATURA = 4096
+
+# ── Metadados ──────────────────────────────────────────────────────────────────
+
+def caminho_meta(caminho_xlsx):
+    return caminho_xlsx + ".meta"
+
+def ler_meta(caminho_xlsx):
+    try:
+        with open(caminho_meta(caminho_xlsx), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _estado(caminho):
+    st = os.stat(caminho)
+    return [st.st_size, st.st_mtime_ns]
+
+def _assinatura(caminho_csv, ate):
+    with open(caminho_csv, "rb") as f:
+        f.seek(max(0, ate - _ASSINATURA))
+        return hashlib.sha1(f.read(ate - max(0, ate - _ASSINATURA))).hexdigest()
+
+def gravar_meta(caminho_xlsx, caminho_csv, csv_bytes, linhas, cabecalho, estilos):
+    meta = {
+        "linhas":         linhas,
+        "csv_bytes":      csv_bytes,
+        "csv_assinatura": _assinatura(caminho_csv, csv_bytes),
+        "colunas":        list(cabecalho),
+        "estilos":        estilos,
+        "xlsx":           _estado(caminho_xlsx),
+    }
+    with open(caminho_meta(caminho_xlsx), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def remover_meta(caminho_xlsx):
+    try:
+        os.remove(caminho_meta(caminho_xlsx))
+    except OSError:
+        pass
+
+def estilos_da_planilha(caminho_xlsx):
+    """Índices de estilo das faixas (linha 3 = ímpar, linha 4 = par) lidos
+    do início da planilha recém-gravada. None se ainda não há duas linhas."""
+    with zipfile.ZipFile(caminho_xlsx) as z, z.open(_PLANILHA) as f:
+        ini = f.read(256 * 1024)
+    achados = dict(re.findall(rb'<row r="([34])"[^>]*><c [^>]*?s="(\d+)"', ini))
+    if b"3" not in achados or b"4" not in achados:
+        return None
+    return {"impar": int(achados[b"3"]), "par": int(achados[b"4"])}
+
+def meta_valida(meta, caminho_xlsx, caminho_csv, cabecalho):
+    """True se o Excel ainda é exatamente o que foi exportado e o CSV só cresceu."""
+    try:
+        if not meta or meta["colunas"] != list(cabecalho) or not meta["estilos"]:
+            return False
+        if _estado(caminho_xlsx) != meta["xlsx"]:
+            return False
+        if os.path.getsize(caminho_csv) < meta["csv_bytes"]:
+            return False
+        return _assinatura(caminho_csv, meta["csv_bytes"]) == meta["csv_assinatura"]
+    except (OSError, KeyError, TypeError):
+        return False
+
+# ── Linhas novas ───────────────────────────────────────────────────────────────
+
+def ler_linhas_novas(caminho_csv, desde, cabecalho):
+    """Linhas do CSV a partir do byte `desde` → (linhas, novo_fim).
+    Mesma regra do pandas com on_bad_lines="skip": linha com campos demais é
+    descartada, com campos de menos é completada com vazio."""
+    with open(caminho_csv, "rb") as f:
+        if next(csv.reader(io.StringIO(f.readline().decode("utf-8-sig")))) != list(cabecalho):
+            raise ValueError("cabeçalho do CSV mudou")
+        f.seek(desde)
+        bruto = f.read()
+    n = len(cabecalho)
+    linhas = []
+    for row in csv.reader(io.StringIO(bruto.decode("utf-8"), newline="")):
+        if not row or len(row) > n:
+            continue
+        linhas.append(row + [""] * (n - len(row)))
+    return linhas, desde + len(bruto)
+
+def _celula(ref, estilo, v):
+    if not v:
+        return f'<c r="{ref}" s="{estilo}" t="n"></c>'
+    if v[0] == "=" or ILLEGAL_CHARACTERS_RE.search(v):
+        raise ValueError("valor exige o caminho completo do openpyxl")
+    espaco = ' xml:space="preserve"' if v != v.strip() else ""
+    return f'<c r="{ref}" s="{estilo}" t="inlineStr"><is><t{espaco}>{escape(v)}</t></is></c>'
+
+def _xml_linhas(linhas, primeira, estilos):
+    """Mesmo XML que o openpyxl write-only gera para as linhas de dados."""
+    letras = [get_column_letter(i) for i in range(1, len(linhas[0]) + 1)] if linhas else []
+    partes = []
+    for r, valores in enumerate(linhas, primeira):
+        estilo = estilos["par"] if r % 2 == 0 else estilos["impar"]
+        partes.append(f'<row r="{r}">')
+        partes.extend(_celula(f"{l}{r}", estilo, v) for l, v in zip(letras, valores))
+        partes.append("</row>")
+    return "".join(partes).encode("utf-8")
+
+def anexar_linhas(caminho_xlsx, linhas, primeira, estilos):
+    """Reescreve o .xlsx em streaming inserindo as linhas antes de </sheetData>.
+    As linhas antigas passam direto (descompacta/recompacta em blocos),
+    sem voltar a ser células do openpyxl."""
+    novas = _xml_linhas(linhas, primeira, estilos)
+    tmp = caminho_xlsx + ".tmp"
+    with zipfile.ZipFile(caminho_xlsx) as zin, \
+         zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            if info.filename != _PLANILHA:
+                zout.writestr(info, zin.read(info.filename))
+                continue
+            destino = zipfile.ZipInfo(_PLANILHA, date_time=info.date_time)
+            destino.compress_type = zipfile.ZIP_DEFLATED
+            with zin.open(info) as src, zout.open(destino, "w", force_zip64=True) as dst:
+                # segura o último bloco: </sheetData> está no fim do arquivo
+                anterior = b""
+                while True:
+                    bloco = src.read(_BLOCO)
+                    if not bloco: break
+                    if len(anterior) > len(_FIM_DADOS):
+                        dst.write(anterior[:-len(_FIM_DADOS)])
+                        anterior = anterior[-len(_FIM_DADOS):]
+                    anterior += bloco
+                i = anterior.rfind(_FIM_DADOS)
+                if i < 0:
+                    raise ValueError("planilha sem </sheetData>")
+                dst.write(anterior[:i]); dst.write(novas); dst.write(anterior[i:])
+    os.replace(tmp, caminho_xlsx)
@@ -0,0 +1,103 @@
+"""
+load/leitura.py
+Leitura dos CSVs (sessão, histórico, partições) para DataFrame — caminho
+único da UI e de storage.
+
+O encoding sai de um prefixo do arquivo (não de releituras inteiras); se o
+resto do arquivo desmentir o prefixo, a leitura recomeça em latin-1. Só as
+colunas pedidas são convertidas (usecols) e as de baixa cardinalidade — UF,
+CFOP, CST, Formato, Tipo_Nota — podem vir como category. blocos() itera o
+arquivo em DataFrames de tamanho fixo.
+"""
+
+import codecs
+
+import pandas as pd
+
+from transform.indice import abrir
+
+_PREFIXO = 256 * 1024
+_BLOCO   = 100_000
+
+def categorica(coluna):
+    """Colunas com poucos valores distintos: viram category (códigos de 1 byte)."""
+    return (coluna.startswith("UF_") or coluna.endswith("_CST")
+            or coluna in ("CFOP", "Formato", "Tipo_Nota"))
+
+def encoding_provavel(caminho):
+    """Encoding pelo primeiro bloco do arquivo (descomprimido, se .gz/.xz)."""
+    try:
+        with abrir(caminho, "rb") as f:
+            ini = f.read(_PREFIXO)
+    except OSError:
+        return "utf-8"
+    if ini.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: o prefixo pode cortar um caractere multibyte no meio
+        codecs.getincrementaldecoder("utf-8")().decode(ini, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def _encodings(caminho):
+    enc = encoding_provavel(caminho)
+    return (enc,) if enc == "latin-1" else (enc, "latin-1")
+
+def categorizar(df):
+    for c in df.columns:
+        if categorica(c):
+            df[c] = df[c].astype("category")
+    return df
+
+def _opcoes(cabecalho, colunas, categorias):
+    cols = list(colunas or cabecalho)
+    quer = set(cols)
+    tipos = {c: ("category" if categorias and categorica(c) else str) for c in cols}
+    return cols, dict(usecols=lambda c: c in quer, dtype=tipos, on_bad_lines="skip")
+
+def _ajustar(df, cols):
+    # CSV de cabeçalho antigo: colunas que ainda não existiam vêm vazias
+    return df if list(df.columns) == cols else df.reindex(columns=cols, fill_value="")
+
+def ler(caminho, cabecalho, colunas=None, categorias=False):
+    """CSV → DataFrame só com `colunas` (padrão: o cabeçalho inteiro), na
+    ordem pedida. Arquivo ilegível, ou sem nenhuma coluna reconhecida,
+    volta vazio."""
+    cols, kw = _opcoes(cabecalho, colunas, categorias)
+    for enc in _encodings(caminho):
+        try:
+            df = pd.read_csv(caminho, encoding=enc, **kw)
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            break
+        if df.columns.empty:
+            break
+        return _ajustar(df, cols)
+    return pd.DataFrame(columns=cols)
+
+def blocos(caminho, cabecalho, colunas=None, categorias=False, linhas=_BLOCO):
+    """Mesmo que ler(), em DataFrames de até `linhas` linhas. Se o encoding
+    do prefixo falhar no meio, relê em latin-1 a partir da primeira linha
+    ainda não entregue."""
+    cols, kw = _opcoes(cabecalho, colunas, categorias)
+    entregues = 0
+    for enc in _encodings(caminho):
+        lidas = 0
+        try:
+            with pd.read_csv(caminho, encoding=enc, chunksize=linhas, **kw) as leitor:
+                for df in leitor:
+                    if df.columns.empty:
+                        return
+                    lidas += len(df)
+                    if lidas <= entregues:
+                        continue
+                    df = df.iloc[len(df) - (lidas - entregues):]
+                    entregues = lidas
+                    yield _ajustar(df, cols)
+            return
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            return
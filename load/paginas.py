@@ -0,0 +1,217 @@
+"""
+load/paginas.py
+Fontes paginadas para a grade virtual da UI (ui/grade.py): a tela pede só
+as linhas e colunas visíveis; ordenação e filtro são feitos aqui, sem
+passar o histórico inteiro para o Treeview.
+
+Todas as fontes têm a mesma interface:
+    colunas, len(fonte), valores(i, j, colunas), ordenar(coluna, decrescente),
+    filtrar(texto, coluna)
+
+- PaginasCSV:   CSV simples — linhas lidas do disco pelo índice de posições
+                (core/posicoes.py); ordenar/filtrar leem só as colunas
+                envolvidas e guardam a permutação de linhas.
+- PaginasBanco: histórico no SQLite — ORDER BY / WHERE / LIMIT OFFSET.
+- PaginasDF:    DataFrame já carregado (histórico comprimido/particionado).
+"""
+
+import csv
+
+import numpy as np
+import pandas as pd
+
+from core.posicoes import Linhas
+from transform.indice import abrir
+from . import banco, leitura, segmentos
+from .banco import tabela_de
+from .storage import _csv_para_df
+
+def _numerica(valores):
+    """True se quase todos os valores preenchidos são números (ordena como número)."""
+    s = pd.Series(valores, dtype=object).replace("", np.nan).dropna()
+    if s.empty:
+        return False
+    return pd.to_numeric(s.head(500), errors="coerce").notna().mean() >= 0.9
+
+def _chave(valores):
+    """Chave de ordenação: número se a coluna é numérica, senão texto sem caixa."""
+    s = pd.Series(valores, dtype=object).fillna("")
+    if _numerica(s):
+        return pd.to_numeric(s, errors="coerce")
+    return s.astype(str).str.lower().replace("", np.nan)
+
+def _argsort(chave, decrescente):
+    """Permutação estável que ordena `chave`; vazios sempre no fim."""
+    vazio  = chave.isna().to_numpy()
+    cheios = np.flatnonzero(~vazio)
+    ordem  = cheios[np.argsort(chave.to_numpy()[cheios], kind="stable")]
+    if decrescente:
+        ordem = ordem[::-1]
+    return np.concatenate([ordem, np.flatnonzero(vazio)])
+
+def _contem(df, texto):
+    """Máscara das linhas em que alguma coluna de df contém `texto` (sem caixa)."""
+    texto = texto.lower()
+    mascara = np.zeros(len(df), dtype=bool)
+    for c in df.columns:
+        mascara |= df[c].astype(object).fillna("").astype(str).str.lower().str.contains(texto, regex=False, na=False).to_numpy()
+    return mascara
+
+# ── CSV ────────────────────────────────────────────────────────────────────────
+
+class PaginasCSV:
+
+    def __init__(self, caminho, cabecalho=None):
+        self.caminho  = caminho
+        self._linhas  = Linhas(caminho)
+        self.colunas  = list(cabecalho or self._linhas.colunas)
+        arquivo       = {c: k for k, c in enumerate(self._linhas.colunas)}
+        self._idx     = {c: arquivo.get(c) for c in self.colunas}
+        self._total   = len(self._linhas)
+        self._visao   = None          # nº das linhas na ordem exibida (None = todas, em ordem)
+        self._filtro  = None          # linhas que passam no filtro
+        self._ordem   = None          # (coluna, decrescente)
+        self._chave   = None          # (coluna, chave de ordenação) — inverter o sentido não relê
+
+    def fechar(self):
+        self._linhas.fechar()
+
+    def __len__(self):
+        return self._total if self._visao is None else len(self._visao)
+
+    def valores(self, i, j, colunas=None):
+        idx = [self._idx.get(c) for c in (colunas or self.colunas)]
+        if self._visao is None:
+            linhas = self._linhas.valores(i, j)
+        else:
+            linhas = [v for r in self._visao[i:j] for v in self._linhas.valores(int(r), int(r) + 1)]
+        return [[(v[k] if k is not None and k < len(v) else "") for k in idx] for v in linhas]
+
+    def _colunas_df(self, colunas):
+        """DataFrames (em blocos) só com essas colunas, alinhados às linhas do
+        índice. Se o pandas descartou alguma linha torta, lê pelo csv."""
+        blocos = list(leitura.blocos(self.caminho, self.colunas, colunas))
+        if sum(len(b) for b in blocos) == self._total:
+            return blocos
+        with abrir(self.caminho, "rt", encoding="utf-8", errors="replace", newline="") as f:
+            leitor = csv.reader(f)
+            cab = {c: k for k, c in enumerate(next(leitor, []))}
+            linhas = [[r[cab[c]] if c in cab and cab[c] < len(r) else "" for c in colunas]
+                      for r in leitor if r]
+        return [pd.DataFrame(linhas, columns=colunas, dtype=object)]
+
+    def _aplicar(self):
+        base = self._filtro
+        if self._ordem is None:
+            self._visao = base
+            return
+        coluna, decrescente = self._ordem
+        if self._chave is None or self._chave[0] != coluna:
+            valores = pd.concat(self._colunas_df([coluna]), ignore_index=True)[coluna]
+            self._chave = (coluna, _chave(valores))
+        chave = self._chave[1]
+        if base is not None:
+            self._visao = base[_argsort(chave.iloc[base].reset_index(drop=True), decrescente)]
+        else:
+            self._visao = _argsort(chave, decrescente)
+
+    def ordenar(self, coluna=None, decrescente=False):
+        self._ordem = (coluna, decrescente) if coluna else None
+        self._aplicar()
+
+    def filtrar(self, texto="", coluna=None):
+        if not texto:
+            self._filtro = None
+        else:
+            mascaras = [_contem(b, texto) for b in self._colunas_df([coluna] if coluna else self.colunas)]
+            self._filtro = np.flatnonzero(np.concatenate(mascaras)) if mascaras else np.empty(0, dtype=np.int64)
+        self._aplicar()
+
+# ── SQLite ─────────────────────────────────────────────────────────────────────
+
+class PaginasBanco:
+
+    def __init__(self, caminho, cabecalho):
+        self.caminho  = caminho
+        self.colunas  = list(cabecalho)
+        self._filtro  = None
+        self._ordem   = None          # (coluna, numerica, decrescente)
+        self._total   = banco.contar(caminho)
+
+    def fechar(self):
+        pass
+
+    def __len__(self):
+        return self._total
+
+    def valores(self, i, j, colunas=None):
+        ordem, numerica, decrescente = self._ordem or (None, False, False)
+        return banco.pagina(self.caminho, colunas or self.colunas, i, max(0, j - i),
+                            ordem, numerica, decrescente, self._filtro)
+
+    def ordenar(self, coluna=None, decrescente=False):
+        if not coluna:
+            self._ordem = None
+            return
+        amostra = [v[0] for v in banco.pagina(self.caminho, [coluna], 0, 500, filtro=self._filtro)]
+        self._ordem = (coluna, _numerica(amostra), decrescente)
+
+    def filtrar(self, texto="", coluna=None):
+        self._filtro = (texto, coluna) if texto else None
+        self._total  = banco.contar(self.caminho, self._filtro)
+
+# ── DataFrame ──────────────────────────────────────────────────────────────────
+
+class PaginasDF:
+
+    def __init__(self, df, colunas=None):
+        self._df     = df
+        self.colunas = list(colunas or df.columns)
+        self._visao  = None
+        self._filtro = None
+        self._ordem  = None
+
+    def fechar(self):
+        pass
+
+    def __len__(self):
+        return len(self._df) if self._visao is None else len(self._visao)
+
+    def valores(self, i, j, colunas=None):
+        linhas = self._df.iloc[i:j] if self._visao is None else self._df.iloc[self._visao[i:j]]
+        cols = [c for c in (colunas or self.colunas)]
+        bloco = linhas.reindex(columns=cols).astype(object)
+        return bloco.where(bloco.notna(), "").values.tolist()
+
+    def _aplicar(self):
+        base = self._filtro
+        if self._ordem is None:
+            self._visao = base
+            return
+        coluna, decrescente = self._ordem
+        valores = self._df[coluna].astype(object)
+        if base is not None:
+            self._visao = base[_argsort(_chave(valores.iloc[base].reset_index(drop=True)), decrescente)]
+        else:
+            self._visao = _argsort(_chave(valores.reset_index(drop=True)), decrescente)
+
+    def ordenar(self, coluna=None, decrescente=False):
+        self._ordem = (coluna, decrescente) if coluna else None
+        self._aplicar()
+
+    def filtrar(self, texto="", coluna=None):
+        if not texto:
+            self._filtro = None
+        else:
+            self._filtro = np.flatnonzero(_contem(self._df[[coluna] if coluna else self.colunas], texto))
+        self._aplicar()
+
+def paginar(caminho, cabecalho, periodo=None):
+    """Fonte paginada para o histórico/CSV: SQLite direto; CSV simples pelo
+    índice de posições; base comprimida/particionada carregada uma vez
+    (categorias) — é a única que vai inteira para a memória."""
+    if tabela_de(caminho):
+        return PaginasBanco(caminho, cabecalho)
+    if segmentos.composto(caminho) or periodo is not None:
+        return PaginasDF(_csv_para_df(caminho, cabecalho, periodo, categorias=True), cabecalho)
+    return PaginasCSV(caminho, cabecalho)
@@ -0,0 +1,413 @@
+"""
+load/segmentos.py
+Histórico principal em CSV como base compactada + segmentos imutáveis.
+
+Cada sincronização publica só as linhas da sessão num segmento novo em
+segmentos/<histórico>/ (grava .tmp e renomeia — ninguém lê segmento pela
+metade). Sincronizar custa O(sessão), não O(histórico), e usuários
+diferentes sincronizam ao mesmo tempo sem reescrever os dados um do outro.
+Segmento do modo "substituir" leva o sufixo _substituir: o histórico passa a
+começar nele (base e segmentos anteriores deixam de valer).
+
+A base fica particionada pelo ano-mês de Data_Emissao em historico/<histórico>/
+(AAAA-MM.<geração>.csv.gz + particoes.json). Quem lê passa um período e só
+abre as partições dele. A compactação (thread em segundo plano, um processo
+por vez via arquivo de lock) reescreve só os meses que os segmentos tocaram,
+deduplicando pelas chaves — a mesma chave é sempre da mesma nota, logo do
+mesmo mês — e apaga os segmentos incorporados.
+
+Base e segmentos são gravados comprimidos conforme COMPRESSAO_HISTORICO; a
+leitura aceita qualquer formato, e a base de arquivo único das versões
+anteriores (produtos_nfe.csv[.gz]) continua valendo até a próxima compactação.
+"""
+
+import csv, json, os, re, threading, time
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+from config.settings import (
+    COMPRESSAO_HISTORICO, PASTA_HISTORICO, PASTA_SEGMENTOS, SEGMENTOS_COMPACTAR, SESSAO_ID,
+)
+from core import manifesto, posicoes
+from transform.indice import (
+    abrir, caminho_indice, carregar_indice, detectar_encoding, digest, gravar_indice,
+)
+from transform.validator import ChavesCompactas
+
+_SUBSTITUIR = "_substituir"
+_LOCK       = "compactando.lock"
+_LOCK_TTL   = 6 * 3600   # lock de compactação abandonado (processo morto no meio)
+_EXT        = {"gzip": ".gz", "lzma": ".xz"}.get(COMPRESSAO_HISTORICO, "")
+_EXTENSOES  = ("", ".gz", ".xz")
+_PARTICOES  = "particoes.json"
+_SEM_DATA   = "sem-data"
+_MES        = re.compile(r"\d{4}-\d{2}")
+
+# ── Período ────────────────────────────────────────────────────────────────────
+# periodo = (inicio, fim), inclusivo, em texto ISO "AAAA-MM" ou "AAAA-MM-DD"
+# (ou date); qualquer ponta pode ser None. None = histórico inteiro.
+
+def mes_de(data):
+    """Partição de uma Data_Emissao ("2024-03-05T10:00:00-03:00" → "2024-03")."""
+    m = str(data or "")[:7]
+    return m if _MES.fullmatch(m) else _SEM_DATA
+
+def _pontas(periodo):
+    ini, fim = periodo
+    return (str(ini) if ini else None), (str(fim) if fim else None)
+
+def mes_no_periodo(mes, periodo):
+    if periodo is None:
+        return True
+    if mes == _SEM_DATA:
+        return False
+    ini, fim = _pontas(periodo)
+    return (ini is None or mes >= ini[:7]) and (fim is None or mes <= fim[:7])
+
+def data_no_periodo(data, periodo):
+    """Compara só até a precisão de cada ponta (mês ou dia)."""
+    if periodo is None:
+        return True
+    data = str(data or "")
+    if mes_de(data) == _SEM_DATA:
+        return False
+    ini, fim = _pontas(periodo)
+    return (ini is None or data[:len(ini)] >= ini) and (fim is None or data[:len(fim)] <= fim)
+
+# ── Leitura ────────────────────────────────────────────────────────────────────
+
+def pasta(caminho_principal):
+    nome = os.path.splitext(os.path.basename(caminho_principal))[0]
+    return os.path.join(PASTA_SEGMENTOS, nome)
+
+def pasta_particoes(caminho_principal):
+    nome = os.path.splitext(os.path.basename(caminho_principal))[0]
+    return os.path.join(PASTA_HISTORICO, nome)
+
+def _sem_ext(caminho):
+    for ext in _EXTENSOES[1:]:
+        if caminho.endswith(ext):
+            return caminho[:-len(ext)]
+    return caminho
+
+def listar(caminho_principal):
+    """Segmentos publicados, na ordem de publicação."""
+    try:
+        nomes = sorted(n for n in os.listdir(pasta(caminho_principal))
+                       if _sem_ext(n).endswith(".csv"))
+    except OSError:
+        return []
+    return [os.path.join(pasta(caminho_principal), n) for n in nomes]
+
+def ler_particoes(caminho_principal):
+    """{mês: {"arquivo", "registros"}} do particoes.json — {} se a base não é particionada."""
+    try:
+        with open(os.path.join(pasta_particoes(caminho_principal), _PARTICOES), "r", encoding="utf-8") as f:
+            return json.load(f)["particoes"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def _gravar_particoes(caminho_principal, particoes):
+    destino = os.path.join(pasta_particoes(caminho_principal), _PARTICOES)
+    with open(destino + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"versao": 1, "particoes": dict(sorted(particoes.items()))}, f, indent=1)
+    os.replace(destino + ".tmp", destino)
+
+def base_legada(caminho_principal):
+    """Base de arquivo único (o CSV ou sua versão .gz/.xz) — None se não há
+    ou se a base já foi particionada."""
+    if ler_particoes(caminho_principal):
+        return None
+    for ext in (_EXT,) + _EXTENSOES:
+        if os.path.exists(caminho_principal + ext):
+            return caminho_principal + ext
+    return None
+
+def _composicao(caminho_principal, segs=None, periodo=None):
+    """(arquivos da base, segmentos depois dela). A base não tem chave repetida."""
+    segs = listar(caminho_principal) if segs is None else segs
+    for i in range(len(segs) - 1, -1, -1):
+        if _sem_ext(segs[i]).endswith(_SUBSTITUIR + ".csv"):
+            return segs[i:i + 1], segs[i + 1:]
+    legada = base_legada(caminho_principal)
+    if legada:
+        return [legada], segs
+    base = [os.path.join(pasta_particoes(caminho_principal), p["arquivo"])
+            for mes, p in sorted(ler_particoes(caminho_principal).items())
+            if mes_no_periodo(mes, periodo)]
+    return base, segs
+
+def arquivos(caminho_principal, segs=None, periodo=None):
+    """Arquivos que compõem o histórico (só as partições do período), do mais
+    antigo ao mais novo. Para um CSV comum (temporário) é só ele mesmo."""
+    base, segs = _composicao(caminho_principal, segs, periodo)
+    return base + segs
+
+def composto(caminho_principal):
+    """True se o histórico não é simplesmente o CSV do caminho (tem segmentos,
+    partições ou base comprimida) — aí a leitura tem de passar por arquivos()."""
+    return arquivos(caminho_principal) not in ([], [caminho_principal])
+
+def contar(caminho_principal):
+    """Nº de registros pelos manifestos (duplicatas entre segmentos publicados
+    ao mesmo tempo só somem na compactação)."""
+    return sum(manifesto.registros(c) for c in arquivos(caminho_principal))
+
+def assinatura(caminho_principal):
+    """[registros, segmento _substituir em vigor] — muda a cada publicação e
+    quando a compactação descarta duplicatas (core/cubo.py)."""
+    base, _ = _composicao(caminho_principal)
+    inicio = os.path.basename(base[0]) if base and _sem_ext(base[0]).endswith(_SUBSTITUIR + ".csv") else None
+    return [contar(caminho_principal), inicio]
+
+def _digests_de(arqs, chave_fn):
+    todos = array("Q")
+    for c in arqs:
+        todos.extend(carregar_indice(c, chave_fn))
+    return todos
+
+def digests(caminho_principal, chave_fn):
+    """Digests das chaves do histórico, pelos índices da base e de cada segmento."""
+    return _digests_de(arquivos(caminho_principal), chave_fn)
+
+def carregar_chaves(caminho_principal, chave_fn):
+    return ChavesCompactas(digests(caminho_principal, chave_fn))
+
+def _linhas(caminho):
+    with abrir(caminho,"rt",encoding=detectar_encoding(caminho),newline="") as f:
+        yield from csv.DictReader(f)
+
+_FUNDIR_VISTAS = 1 << 16   # digests aceitos num set antes de entrar no array ordenado
+
+class _Vistas:
+    """Digests já aceitos numa regravação (materializar/compactar): array
+    ordenado (8 bytes/chave, busca binária) + set só das últimas aceitas,
+    fundido no array a cada _FUNDIR_VISTAS — a memória não ganha um set com
+    todas as chaves, como ganharia com ChavesCompactas.add."""
+
+    def __init__(self, digests):
+        self._ordenadas = array("Q", np.unique(np.frombuffer(digests, dtype=np.uint64)).tobytes())
+        self._recentes  = set()
+
+    def __contains__(self, d):
+        if d in self._recentes:
+            return True
+        o = self._ordenadas
+        i = bisect_left(o, d)
+        return i < len(o) and o[i] == d
+
+    def add(self, d):
+        self._recentes.add(d)
+        if len(self._recentes) >= _FUNDIR_VISTAS:
+            o     = np.frombuffer(self._ordenadas, dtype=np.uint64)
+            novas = np.fromiter(sorted(self._recentes), dtype=np.uint64, count=len(self._recentes))
+            self._ordenadas = array("Q", np.insert(o, o.searchsorted(novas), novas).tobytes())
+            self._recentes  = set()
+
+def _unicas(base, segs, chave_fn, aceitos):
+    """Linhas da base e dos segmentos sem chave repetida. `aceitos` começa
+    com os digests da base e recebe os das linhas aceitas dos segmentos."""
+    vistas = _Vistas(aceitos)
+    for c in base:
+        yield from _linhas(c)
+    for seg in segs:
+        for row in _linhas(seg):
+            d = digest(chave_fn(row))
+            if d in vistas:
+                continue
+            vistas.add(d)
+            aceitos.append(d)
+            yield row
+
+def linhas(caminho_principal, chave_fn, periodo=None):
+    """Registros do histórico (base + segmentos) sem duplicatas — só os do
+    período, abrindo só as partições dele."""
+    base, segs = _composicao(caminho_principal, periodo=periodo)
+    for row in _unicas(base, segs, chave_fn, _digests_de(base, chave_fn)):
+        if data_no_periodo(row.get("Data_Emissao"), periodo):
+            yield row
+
+def _gravar_csv(destino, cabecalho, linhas):
+    """Grava via .tmp + rename (comprimindo se destino termina em .gz/.xz).
+    Retorna False (e não cria nada) se não houve linha."""
+    tmp = _sem_ext(destino)[:-len(".csv")] + ".tmp"
+    try:
+        n = 0
+        with abrir(tmp,"wt",como=destino,newline="",encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
+            writer.writeheader()
+            for row in linhas:
+                writer.writerow({c: row.get(c,"") for c in cabecalho})
+                n += 1
+        if n == 0:
+            os.remove(tmp)
+            return False
+        os.replace(tmp, destino)
+        return True
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+# ── Publicação ─────────────────────────────────────────────────────────────────
+
+def publicar(caminho_principal, linhas, cabecalho, chave_fn, substituir=False):
+    """Publica `linhas` como um segmento novo. Retorna quantas entraram
+    (0 = nada publicado)."""
+    os.makedirs(pasta(caminho_principal), exist_ok=True)
+    nome = f"{time.time_ns():020d}_{SESSAO_ID}" + (_SUBSTITUIR if substituir else "")
+    seg  = os.path.join(pasta(caminho_principal), nome + ".csv" + _EXT)
+    novos = array("Q")
+    def _registrar():
+        for row in linhas:
+            novos.append(digest(chave_fn(row)))
+            yield row
+    if not _gravar_csv(seg, cabecalho, _registrar()):
+        return 0
+    gravar_indice(seg, novos)
+    manifesto.reconstruir(seg)
+    return len(novos)
+
+def materializar(caminho_principal, destino, cabecalho, chave_fn):
+    """Grava o histórico (base + segmentos) num CSV só, deduplicado, com
+    índice e manifesto. Retorna o nº de registros."""
+    base, segs = _composicao(caminho_principal)
+    aceitos = _digests_de(base, chave_fn)
+    if not _gravar_csv(destino, cabecalho, _unicas(base, segs, chave_fn, aceitos)):
+        with abrir(destino,"wt",newline="",encoding="utf-8") as f:
+            csv.writer(f).writerow(cabecalho)
+    gravar_indice(destino, aceitos)
+    manifesto.reconstruir(destino)
+    return len(aceitos)
+
+# ── Compactação ────────────────────────────────────────────────────────────────
+
+def _tomar_lock(lock, ttl=_LOCK_TTL):
+    """Cria o arquivo de lock (O_EXCL). None se outro processo já o tem."""
+    for _ in range(2):
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) < ttl:
+                    return None
+                os.remove(lock)
+            except OSError:
+                return None
+        except OSError:
+            return None
+    return None
+
+def _remover(arqs):
+    for arq in arqs:
+        for c in (arq, caminho_indice(arq), manifesto.caminho_manifesto(arq),
+                  posicoes.caminho_posicoes(arq)):
+            try: os.remove(c)
+            except OSError: pass
+
+class _Particao:
+    """Partição de um mês sendo regravada: começa com as linhas da partição
+    atual (se houver) e recebe as novas sem repetir chave."""
+
+    def __init__(self, destino, cabecalho, chave_fn, atual=None):
+        self.destino, self.chave_fn = destino, chave_fn
+        self.tmp     = _sem_ext(destino)[:-len(".csv")] + ".tmp"
+        self._f      = abrir(self.tmp,"wt",como=destino,newline="",encoding="utf-8")
+        self._writer = csv.DictWriter(self._f, fieldnames=cabecalho, extrasaction="ignore")
+        self._writer.writeheader()
+        self._cab    = cabecalho
+        atual = atual if atual and os.path.exists(atual) else None
+        self.digests = _digests_de([atual], chave_fn) if atual else array("Q")
+        self._vistas = _Vistas(self.digests)
+        if atual:
+            for row in _linhas(atual):
+                self._writer.writerow({c: row.get(c,"") for c in cabecalho})
+
+    def add(self, row):
+        d = digest(self.chave_fn(row))
+        if d in self._vistas:
+            return
+        self._vistas.add(d)
+        self.digests.append(d)
+        self._writer.writerow({c: row.get(c,"") for c in self._cab})
+
+    def fechar(self):
+        self._f.close()
+
+def compactar(caminho_principal, cabecalho, chave_fn):
+    """Incorpora os segmentos atuais nas partições da base. Retorna quantos
+    foram incorporados (0 se não havia nenhum ou outro processo está compactando)."""
+    lock = _tomar_lock(os.path.join(pasta(caminho_principal), _LOCK))
+    if lock is None:
+        return 0
+    try:
+        segs = listar(caminho_principal)
+        if not segs:
+            return 0
+        anteriores = ler_particoes(caminho_principal)
+        base, resto = _composicao(caminho_principal, segs)
+        if base[:1] and (base[0] in segs or base[0] == base_legada(caminho_principal)):
+            # segmento _substituir ou base de arquivo único: reparticiona do zero
+            atuais, fontes = {}, base + resto
+        else:
+            atuais, fontes = anteriores, resto
+
+        pasta_p = pasta_particoes(caminho_principal)
+        os.makedirs(pasta_p, exist_ok=True)
+        geracao = f"{time.time_ns():020d}"
+        abertas = {}
+        try:
+            for c in fontes:
+                for row in _linhas(c):
+                    mes = mes_de(row.get("Data_Emissao"))
+                    if mes not in abertas:
+                        atual = os.path.join(pasta_p, atuais[mes]["arquivo"]) if mes in atuais else None
+                        abertas[mes] = _Particao(os.path.join(pasta_p, f"{mes}.{geracao}.csv{_EXT}"),
+                                                 cabecalho, chave_fn, atual)
+                    abertas[mes].add(row)
+        except BaseException:
+            for p in abertas.values():
+                p.fechar()
+                try: os.remove(p.tmp)
+                except OSError: pass
+            raise
+        for p in abertas.values():
+            p.fechar()
+            os.replace(p.tmp, p.destino)
+            gravar_indice(p.destino, p.digests)
+            manifesto.reconstruir(p.destino)
+
+        novas = dict(atuais)
+        novas.update({mes: {"arquivo": os.path.basename(p.destino), "registros": len(p.digests)}
+                      for mes, p in abertas.items()})
+        _gravar_particoes(caminho_principal, novas)   # a troca vale a partir daqui
+
+        # Sai o que foi substituído: partições regravadas, base de arquivo
+        # único e segmentos incorporados. Segmento que sobrar (aberto por outro
+        # usuário, queda no meio) só gera duplicata, descartada na leitura e
+        # na próxima compactação.
+        velhas = [os.path.join(pasta_p, p["arquivo"]) for mes, p in anteriores.items()
+                  if novas.get(mes, {}).get("arquivo") != p["arquivo"]]
+        _remover(velhas + [caminho_principal + ext for ext in _EXTENSOES] + segs)
+        return len(segs)
+    finally:
+        try: os.remove(lock)
+        except OSError: pass
+
+def _compactar_silencioso(caminho_principal, cabecalho, chave_fn):
+    try:
+        compactar(caminho_principal, cabecalho, chave_fn)
+    except Exception as e:
+        print(f"Aviso compactação ({os.path.basename(caminho_principal)}): {e}")
+
+def compactar_em_segundo_plano(caminho_principal, cabecalho, chave_fn):
+    """Dispara a compactação numa thread daemon quando há segmentos demais."""
+    if len(listar(caminho_principal)) < SEGMENTOS_COMPACTAR:
+        return None
+    t = threading.Thread(target=_compactar_silencioso, name="compactacao",
+                         args=(caminho_principal, cabecalho, chave_fn), daemon=True)
+    t.start()
+    return t
@@ -5,10 +5,12 @@ Persistência CSV/Excel para NF-e e NFS-e, lock de sessão, sincronização.
 
 import atexit, csv, os, shutil, time
 from datetime import datetime
+from itertools import islice
 
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, Border, NamedStyle, Side
 from openpyxl.utils import get_column_letter
 
 from config.settings import (
@@ -18,8 +20,16 @@ from config.settings import (
     CSV_NFSE_TEMP, EXCEL_NFSE_TEMP,
     CSV_NFSE_PRINCIPAL, EXCEL_NFSE_PRINCIPAL,
     LOCK_FILE, LOCK_TTL_SECONDS,
-    LOG_TEMP, MODO_SESSAO, SESSAO_ID, TEMP_DIR, TEMP_TTL_SECONDS, USUARIO_ID,
+    LOG_TEMP, MODO_SESSAO, PERIODO_HISTORICO, SESSAO_ID, TEMP_DIR, TEMP_TTL_SECONDS, USUARIO_ID,
 )
+from core import cubo, manifesto, posicoes
+from transform.indice import (
+    caminho_indice, detectar_encoding, estado_csv, indexar, registrar_chaves, remover_indice,
+)
+from transform.agregados import agregar, ler_cubo
+from transform.validator import carregar_chaves, chave_nfse, chave_para, chave_produto
+from . import backup, banco, excel_sessao, leitura, segmentos
+from .banco import tabela_de
 
 # ── Lock / Sessão ──────────────────────────────────────────────────────────────
 
@@ -42,35 +52,52 @@ def verificar_locks_ativos():
     except Exception:
         return []
 
+_LOTE_LINHAS = 5000   # linhas por bloco em migração/sincronização (memória constante)
+
+def _blocos(linhas, n=_LOTE_LINHAS):
+    linhas = iter(linhas)
+    return iter(lambda: list(islice(linhas, n)), [])
+
+def _ler_colunas(caminho):
+    """Só a linha de cabeçalho do CSV."""
+    with open(caminho,"rb") as f:
+        primeira = f.readline()
+    for enc in ("utf-8-sig","latin-1"):
+        try:
+            return next(csv.reader([primeira.decode(enc)]), [])
+        except UnicodeDecodeError:
+            continue
+    return []
+
 def _migrar_csv(caminho, cabecalho):
     """Garante que o CSV tenha exatamente as colunas do cabecalho atual.
-    Se faltar colunas (versão antiga), reescreve o arquivo com as novas colunas vazias.
+    Só a linha de cabeçalho é lida para decidir; se faltar colunas (versão
+    antiga), reescreve em blocos num arquivo temporário e troca por rename
+    atômico — uma queda no meio não trunca o original.
     Retorna True se precisou migrar, False se já estava correto."""
+    if tabela_de(caminho):
+        return False   # o banco adiciona colunas novas ao conectar
     if not os.path.exists(caminho) or os.path.getsize(caminho) == 0:
         return False
+    tmp = caminho + ".migrando"
     try:
-        for enc in ("utf-8","utf-8-sig","latin-1"):
-            try:
-                with open(caminho,"r",encoding=enc) as f:
-                    rows = list(csv.DictReader(f))
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            return False
-
-        # Verificar se cabeçalho já está correto
-        if rows and set(cabecalho) == set(rows[0].keys()):
+        if set(cabecalho) == set(_ler_colunas(caminho)):
             return False  # já OK, sem migração
 
         # Migrar: reescrever com novo cabeçalho, preservando dados existentes
-        with open(caminho,"w",newline="",encoding="utf-8") as f:
+        enc = detectar_encoding(caminho)
+        with open(caminho,"r",encoding=enc,newline="") as orig, \
+             open(tmp,"w",newline="",encoding="utf-8") as f:
             writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
             writer.writeheader()
-            for row in rows:
-                writer.writerow({k: row.get(k,"") for k in cabecalho})
+            for bloco in _blocos(csv.DictReader(orig)):
+                writer.writerows({k: row.get(k,"") for k in cabecalho} for row in bloco)
+        os.replace(tmp, caminho)
+        manifesto.reconstruir(caminho)
         return True
     except Exception:
+        try: os.remove(tmp)
+        except OSError: pass
         return False
 
 def inicializar_sessao():
@@ -83,17 +110,8 @@ def inicializar_sessao():
             _criar_csv_vazio(CSV_NFSE_TEMP, CABECALHO_NFSE)
         else:
             # Modo acumular — carrega o histórico do principal para o temp
-            if os.path.exists(CSV_PRINCIPAL):
-                _migrar_csv(CSV_PRINCIPAL, CABECALHO_CSV)
-                shutil.copy2(CSV_PRINCIPAL, CSV_TEMP)
-            else:
-                _criar_csv_vazio(CSV_TEMP, CABECALHO_CSV)
-
-            if os.path.exists(CSV_NFSE_PRINCIPAL):
-                _migrar_csv(CSV_NFSE_PRINCIPAL, CABECALHO_NFSE)
-                shutil.copy2(CSV_NFSE_PRINCIPAL, CSV_NFSE_TEMP)
-            else:
-                _criar_csv_vazio(CSV_NFSE_TEMP, CABECALHO_NFSE)
+            _carregar_historico(CSV_PRINCIPAL, CSV_TEMP, CABECALHO_CSV, chave_produto)
+            _carregar_historico(CSV_NFSE_PRINCIPAL, CSV_NFSE_TEMP, CABECALHO_NFSE, chave_nfse)
 
         sincronizar_excel_temp()
 
@@ -106,23 +124,62 @@ def inicializar_sessao():
         print(f"Erro ao inicializar sessão: {e}")
         return False
 
+def _carregar_historico(csv_principal, csv_temp, cabecalho, chave_fn):
+    """Modo acumular: o temp começa com o histórico inteiro."""
+    if tabela_de(csv_principal):
+        banco.exportar_csv(csv_principal, csv_temp)
+        manifesto.reconstruir(csv_temp)
+    elif segmentos.composto(csv_principal):
+        segmentos.materializar(csv_principal, csv_temp, cabecalho, chave_fn)
+    elif os.path.exists(csv_principal):
+        _migrar_csv(csv_principal, cabecalho)
+        _copiar_csv(csv_principal, csv_temp)
+    else:
+        _criar_csv_vazio(csv_temp, cabecalho)
+        return
+    _herdar_cubo(csv_principal, csv_temp, cabecalho)
+
 # ── CSV ────────────────────────────────────────────────────────────────────────
 
 def _criar_csv_vazio(caminho, cabecalho):
     with open(caminho,"w",newline="",encoding="utf-8") as f:
         csv.writer(f).writerow(cabecalho)
+    indexar(caminho)
+    manifesto.reconstruir(caminho)
+    cubo.criar(caminho, cabecalho)
+
+def _copiar_csv(origem, destino):
+    """Copia o CSV junto com o índice de chaves, o manifesto e o índice de
+    posições (copy2 preserva o mtime, então eles continuam válidos para a cópia)."""
+    shutil.copy2(origem, destino)
+    if os.path.exists(caminho_indice(origem)):
+        shutil.copy2(caminho_indice(origem), caminho_indice(destino))
+    else:
+        remover_indice(destino)
+    if os.path.exists(manifesto.caminho_manifesto(origem)):
+        shutil.copy2(manifesto.caminho_manifesto(origem), manifesto.caminho_manifesto(destino))
+        if os.path.exists(posicoes.caminho_posicoes(origem)):
+            shutil.copy2(posicoes.caminho_posicoes(origem), posicoes.caminho_posicoes(destino))
+    else:
+        manifesto.remover(destino)
 
 def salvar_produtos_csv(produtos, caminho=CSV_TEMP, cabecalho=None):
     if not produtos: return True, "Nenhum produto para salvar"
     if cabecalho is None: cabecalho = CABECALHO_CSV
     try:
-        existe = os.path.exists(caminho) and os.path.getsize(caminho) > 0
+        if tabela_de(caminho):
+            return True, f"{banco.inserir(caminho, produtos)} registro(s) salvos"
+        antes  = estado_csv(caminho)
+        existe = antes is not None and antes[0] > 0
         with open(caminho,"a",newline="",encoding="utf-8") as f:
             writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
             if not existe:
                 writer.writeheader()
             for p in produtos:
                 writer.writerow({k: p.get(k,"") for k in cabecalho})
+        registrar_chaves(caminho, produtos, chave_para(cabecalho), antes)
+        manifesto.registrar_append(caminho, antes)
+        cubo.registrar_append(caminho, cabecalho, produtos, antes)
         return True, f"{len(produtos)} registro(s) salvos"
     except Exception as e:
         return False, f"Erro ao salvar CSV: {e}"
@@ -131,117 +188,234 @@ def salvar_nfse_csv(registros):
     return salvar_produtos_csv(registros, CSV_NFSE_TEMP, CABECALHO_NFSE)
 
 def total_registros(caminho=CSV_TEMP):
+    """Nº de registros pelo manifesto do CSV (sem varrer o arquivo)."""
     try:
-        if not os.path.exists(caminho): return 0
-        for enc in ("utf-8","utf-8-sig","latin-1"):
-            try:
-                with open(caminho,"r",encoding=enc) as f:
-                    return max(0, sum(1 for _ in f) - 1)
-            except UnicodeDecodeError:
-                continue
-        return 0
+        if tabela_de(caminho): return banco.contar(caminho)
+        if segmentos.composto(caminho): return segmentos.contar(caminho)
+        return manifesto.registros(caminho)
     except Exception:
         return 0
 
 def carregar_chaves_nfse():
-    chaves = set()
-    if not os.path.exists(CSV_NFSE_TEMP): return chaves
-    for enc in ("utf-8","utf-8-sig","latin-1"):
-        try:
-            with open(CSV_NFSE_TEMP,"r",encoding=enc) as f:
-                for row in csv.DictReader(f):
-                    chaves.add(f"{row.get('Chave_NFSe','')}_{row.get('Numero_NFSe','')}")
-            return chaves
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            break
-    return chaves
+    return carregar_chaves(CSV_NFSE_TEMP, chave_nfse)
 
 # ── Excel formatado ────────────────────────────────────────────────────────────
 
-def _aplicar_formatacao_excel(caminho, sheet_name, titulo):
-    """Aplica cabeçalho colorido, auto-largura e freeze no Excel."""
-    try:
-        wb = load_workbook(caminho)
-        ws = wb[sheet_name]
-
-        # Insere linha de título no topo
-        ws.insert_rows(1)
-        ws.merge_cells(start_row=1, start_column=1,
-                       end_row=1, end_column=ws.max_column)
-        cell_titulo = ws.cell(row=1, column=1)
-        cell_titulo.value = titulo
-        cell_titulo.font      = Font(name="Segoe UI", size=12, bold=True, color="FFFFFF")
-        cell_titulo.fill      = PatternFill("solid", fgColor="1A5276")
-        cell_titulo.alignment = Alignment(horizontal="center", vertical="center")
-        ws.row_dimensions[1].height = 28
-
-        # Formata cabeçalho (agora linha 2)
-        fill_hdr = PatternFill("solid", fgColor="1F618D")
-        font_hdr = Font(name="Segoe UI", size=9, bold=True, color="FFFFFF")
-        borda = Border(
-            bottom=Side(style="thin", color="FFFFFF"),
-            right= Side(style="thin", color="FFFFFF"),
-        )
-        for cell in ws[2]:
-            cell.fill      = fill_hdr
-            cell.font      = font_hdr
-            cell.alignment = Alignment(horizontal="center", vertical="center",
-                                       wrap_text=True)
-            cell.border    = borda
-        ws.row_dimensions[2].height = 32
-
-        # Linhas alternadas
-        fill_par  = PatternFill("solid", fgColor="EAF2FB")
-        fill_imp  = PatternFill("solid", fgColor="FFFFFF")
-        font_data = Font(name="Segoe UI", size=9)
-        for row_idx in range(3, ws.max_row + 1):
-            fill = fill_par if row_idx % 2 == 0 else fill_imp
-            for cell in ws[row_idx]:
-                cell.fill      = fill
-                cell.font      = font_data
-                cell.alignment = Alignment(vertical="center")
-
-        # Auto-largura (máx 50)
-        for col_idx in range(1, ws.max_column + 1):
-            max_len = 0
-            col_letter = get_column_letter(col_idx)
-            for row_idx in range(2, min(ws.max_row + 1, 200)):
-                val = ws.cell(row=row_idx, column=col_idx).value
-                if val:
-                    max_len = max(max_len, len(str(val)))
-            ws.column_dimensions[col_letter].width = min(max(max_len + 2, 10), 50)
-
-        # Freeze abaixo do cabeçalho
-        ws.freeze_panes = "A3"
-
-        wb.save(caminho)
-    except Exception as e:
-        print(f"Aviso formatação Excel: {e}")
+# Estilos nomeados compartilhados: cada célula referencia um xf já registrado,
+# em vez de receber fonte/preenchimento próprios.
+_ESTILO_TITULO    = "xp_titulo"
+_ESTILO_CABECALHO = "xp_cabecalho"
+_ESTILO_PAR       = "xp_linha_par"
+_ESTILO_IMPAR     = "xp_linha_impar"
+_AMOSTRA_LARGURA  = 197   # linhas de dados consideradas na auto-largura (linhas 3–199)
+
+def _registrar_estilos(wb):
+    borda = Border(bottom=Side(style="thin", color="FFFFFF"), right=Side(style="thin", color="FFFFFF"))
+    for estilo in (
+        NamedStyle(_ESTILO_TITULO,
+                   font=Font(name="Segoe UI", size=12, bold=True, color="FFFFFF"),
+                   fill=PatternFill("solid", fgColor="1A5276"),
+                   alignment=Alignment(horizontal="center", vertical="center")),
+        NamedStyle(_ESTILO_CABECALHO,
+                   font=Font(name="Segoe UI", size=9, bold=True, color="FFFFFF"),
+                   fill=PatternFill("solid", fgColor="1F618D"),
+                   alignment=Alignment(horizontal="center", vertical="center", wrap_text=True),
+                   border=borda),
+        NamedStyle(_ESTILO_PAR,
+                   font=Font(name="Segoe UI", size=9),
+                   fill=PatternFill("solid", fgColor="EAF2FB"),
+                   alignment=Alignment(vertical="center")),
+        NamedStyle(_ESTILO_IMPAR,
+                   font=Font(name="Segoe UI", size=9),
+                   fill=PatternFill("solid", fgColor="FFFFFF"),
+                   alignment=Alignment(vertical="center")),
+    ):
+        wb.add_named_style(estilo)
+
+def _larguras(df):
+    """Auto-largura (máx 50) pelo maior texto do cabeçalho + primeiras linhas."""
+    amostra = df.head(_AMOSTRA_LARGURA).fillna("").astype(str)
+    maximos = pd.Series(0, index=df.columns)
+    if not amostra.empty:
+        maximos = amostra.apply(lambda s: s.str.len().max()).reindex(df.columns, fill_value=0)
+    cab = pd.Series([len(str(c)) for c in df.columns], index=df.columns)
+    return [min(max(int(n) + 2, 10), 50) for n in pd.concat([maximos, cab], axis=1).max(axis=1)]
+
+def _linhas_celulas(ws, n_colunas, valores):
+    """Células de dados com faixa alternada. As células de cada faixa são
+    reaproveitadas linha a linha — o write-only serializa a linha no append."""
+    faixas = {par: [WriteOnlyCell(ws) for _ in range(n_colunas)] for par in (True, False)}
+    for celulas, estilo in ((faixas[True], _ESTILO_PAR), (faixas[False], _ESTILO_IMPAR)):
+        for c in celulas:
+            c.style = estilo
+    for row_idx, linha in enumerate(valores, 3):
+        celulas = faixas[row_idx % 2 == 0]
+        for c, v in zip(celulas, linha):
+            c.value = None if v != v or v == "" else v   # NaN / vazio → célula só com estilo
+        yield celulas
 
 def _df_para_excel(df, caminho, sheet_name, titulo):
-    with pd.ExcelWriter(caminho, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    _aplicar_formatacao_excel(caminho, sheet_name, titulo)
-
-def _csv_para_df(caminho, cabecalho):
-    for enc in ("utf-8", "utf-8-sig", "latin-1"):
+    """Grava o Excel formatado numa única passada (openpyxl write-only):
+    título mesclado, cabeçalho colorido, linhas alternadas, auto-largura e
+    painel congelado abaixo do cabeçalho."""
+    wb = Workbook(write_only=True)
+    _registrar_estilos(wb)
+    ws = wb.create_sheet(sheet_name)
+    n  = len(df.columns)
+
+    for col_idx, largura in enumerate(_larguras(df), 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = largura
+    ws.row_dimensions[1].height = 28
+    ws.row_dimensions[2].height = 32
+    ws.merged_cells.add(f"A1:{get_column_letter(max(n, 1))}1")
+    ws.freeze_panes = "A3"
+
+    cel = WriteOnlyCell(ws, titulo); cel.style = _ESTILO_TITULO
+    ws.append([cel])
+    cabecalho = []
+    for col in df.columns:
+        cel = WriteOnlyCell(ws, col); cel.style = _ESTILO_CABECALHO
+        cabecalho.append(cel)
+    ws.append(cabecalho)
+    for celulas in _linhas_celulas(ws, n, df.itertuples(index=False, name=None)):
+        ws.append(celulas)
+    wb.save(caminho)
+
+def _csv_para_df(caminho, cabecalho, periodo=None, colunas=None, categorias=False):
+    """Histórico/CSV → DataFrame. periodo = (inicio, fim) em texto ISO
+    ("AAAA-MM" ou "AAAA-MM-DD", inclusivo): só as partições desses meses são
+    abertas e só as linhas com Data_Emissao no período voltam.
+    colunas = projeção (só elas são lidas); categorias = UF/CFOP/CST/Formato
+    como category (ver load/leitura.py)."""
+    cols = list(colunas or cabecalho)
+    if tabela_de(caminho):
+        df = banco.ler_df(caminho, cols, periodo)
+        return leitura.categorizar(df) if categorias else df
+    composto = segmentos.composto(caminho)
+    chave = ["Chave_NFSe","Numero_NFSe"] if "Chave_NFSe" in cabecalho else ["Chave_NFe","Item","cProd"]
+    # colunas que só servem para deduplicar/filtrar entram na leitura e saem no fim
+    precisa = (chave if composto else []) + (["Data_Emissao"] if periodo else [])
+    lidas = cols + [c for c in dict.fromkeys(precisa) if c not in cols]
+    if composto:
+        # partições do período + segmentos; duplicata de sincronizações
+        # simultâneas ainda não compactadas fica só com a primeira ocorrência
+        partes = [leitura.ler(c, cabecalho, lidas)
+                  for c in segmentos.arquivos(caminho, periodo=periodo)]
+        # período fora de todas as partições (e sem segmentos): nada a ler
+        df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=lidas)
+        df = df.drop_duplicates(subset=chave, ignore_index=True)
+        if categorias:
+            leitura.categorizar(df)
+    else:
+        df = leitura.ler(caminho, cabecalho, lidas, categorias)
+    df = _filtrar_periodo(df, periodo)
+    return df if len(lidas) == len(cols) else df[cols]
+
+def _filtrar_periodo(df, periodo):
+    if periodo is None or df.empty:
+        return df
+    dentro = df["Data_Emissao"].map(lambda d: segmentos.data_no_periodo(d, periodo))
+    return df[dentro].reset_index(drop=True)
+
+# ── Cubo do dashboard ──────────────────────────────────────────────────────────
+
+def _assinatura(caminho):
+    """Estado do histórico/CSV com que o cubo (core/cubo.py) é conferido."""
+    if tabela_de(caminho):
+        return ["banco", *banco.versao(caminho)]
+    if segmentos.composto(caminho):
+        return ["segmentos", *segmentos.assinatura(caminho)]
+    return cubo.assinatura_csv(caminho)
+
+def _cubo_em_dia(caminho):
+    """True se o cubo gravado ainda corresponde ao histórico."""
+    meta = cubo.ler_meta(caminho)
+    return bool(meta) and meta.get("assinatura") == _assinatura(caminho)
+
+def _remontar_cubo(caminho, cabecalho):
+    """Lê do histórico só as colunas do cubo, agrega e grava."""
+    assinatura = _assinatura(caminho)
+    df = agregar(_csv_para_df(caminho, cabecalho, colunas=cubo.colunas_origem(cabecalho)), cabecalho)
+    c = cubo.Cubo(cabecalho)
+    n = len(c.dimensoes)
+    c.celulas = {tuple(r[:n]): list(r[n:]) for r in df.itertuples(index=False, name=None)}
+    c.gravar(caminho, assinatura)
+    return df
+
+def _herdar_cubo(origem, destino, cabecalho):
+    """Temp montado a partir do histórico: herda o cubo dele se o conteúdo é o mesmo."""
+    try:
+        if not _cubo_em_dia(origem):
+            return
+        c, _ = cubo.Cubo.carregar(origem, cabecalho)
+        if c is not None and total_registros(destino) == sum(v[-1] for v in c.celulas.values()):
+            c.gravar(destino, _assinatura(destino))
+    except Exception as e:
+        print(f"Aviso cubo ({os.path.basename(destino)}): {e}")
+
+def _cubo_para_sincronizar(csv_principal, cabecalho, substituir):
+    """Cubo do histórico a que as linhas publicadas vão ser somadas — vazio
+    na substituição; None se o atual não está em dia (remontado depois)."""
+    if substituir or total_registros(csv_principal) == 0:
+        return cubo.Cubo(cabecalho)
+    c, assinatura = cubo.Cubo.carregar(csv_principal, cabecalho)
+    return c if c is not None and assinatura == _assinatura(csv_principal) else None
+
+def _somando(c, linhas):
+    """Repassa as linhas somando cada uma ao cubo (se houver)."""
+    for row in linhas:
+        if c is not None:
+            c.adicionar((row,))
+        yield row
+
+def carregar_cubo(caminho, cabecalho, periodo=None):
+    """Cubo do dashboard (DataFrame de agregar) — do arquivo .cubo quando em
+    dia, senão remontado do histórico uma vez. O período filtra os meses do
+    cubo; com ponta em dia ("AAAA-MM-DD") agrega as linhas desse período."""
+    if periodo is not None and any(p and len(str(p)) > 7 for p in periodo):
+        return agregar(_csv_para_df(caminho, cabecalho, periodo, cubo.colunas_origem(cabecalho)), cabecalho)
+    try:
+        if _cubo_em_dia(caminho):
+            df = ler_cubo(cubo.caminho_cubo(caminho), cabecalho)
+        else:
+            df = _remontar_cubo(caminho, cabecalho)
+    except Exception as e:
+        print(f"Aviso cubo ({os.path.basename(caminho)}): {e}")
+        df = agregar(_csv_para_df(caminho, cabecalho, colunas=cubo.colunas_origem(cabecalho)), cabecalho)
+    if periodo is not None:
+        df = df[df["Mes"].map(lambda m: segmentos.mes_no_periodo(segmentos.mes_de(m), periodo))]
+    return df.reset_index(drop=True)
+
+def _exportar_excel_sessao(caminho_csv, caminho_xlsx, cabecalho, sheet_name, titulo):
+    """Excel da sessão: anexa só as linhas que entraram no CSV desde a última
+    exportação; refaz o arquivo inteiro quando os metadados não batem.
+    Retorna o nº de registros da planilha."""
+    meta = excel_sessao.ler_meta(caminho_xlsx)
+    # Com menos linhas que a amostra da auto-largura, refaz (larguras idênticas)
+    if excel_sessao.meta_valida(meta, caminho_xlsx, caminho_csv, cabecalho) \
+            and meta["linhas"] >= _AMOSTRA_LARGURA:
         try:
-            df = pd.read_csv(caminho, dtype=str, encoding=enc, on_bad_lines="skip")
-            return df.reindex(columns=cabecalho, fill_value="")
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            break
-    return pd.DataFrame(columns=cabecalho)
+            linhas, fim = excel_sessao.ler_linhas_novas(caminho_csv, meta["csv_bytes"], cabecalho)
+            if linhas:
+                excel_sessao.anexar_linhas(caminho_xlsx, linhas, meta["linhas"] + 3, meta["estilos"])
+            total = meta["linhas"] + len(linhas)
+            excel_sessao.gravar_meta(caminho_xlsx, caminho_csv, fim, total, cabecalho, meta["estilos"])
+            return total
+        except Exception as e:
+            print(f"Aviso Excel incremental ({os.path.basename(caminho_xlsx)}): {e} — refazendo")
+
+    csv_bytes = os.path.getsize(caminho_csv)
+    df = _csv_para_df(caminho_csv, cabecalho)
+    _df_para_excel(df, caminho_xlsx, sheet_name, titulo)
+    excel_sessao.gravar_meta(caminho_xlsx, caminho_csv, csv_bytes, len(df), cabecalho,
+                             excel_sessao.estilos_da_planilha(caminho_xlsx))
+    return len(df)
 
 def sincronizar_excel_temp():
     if not os.path.exists(CSV_TEMP): return False
     try:
-        df = _csv_para_df(CSV_TEMP, CABECALHO_CSV)
-        _df_para_excel(df, EXCEL_TEMP, "Produtos_NFe",
-                       "GCON/SIAN — NF-e — Produtos e Impostos")
+        _exportar_excel_sessao(CSV_TEMP, EXCEL_TEMP, CABECALHO_CSV, "Produtos_NFe",
+                               "GCON/SIAN — NF-e — Produtos e Impostos")
         return True
     except Exception as e:
         print(f"Erro sincronizar Excel NF-e: {e}")
@@ -250,32 +424,31 @@ def sincronizar_excel_temp():
 def sincronizar_excel_nfse_temp():
     if not os.path.exists(CSV_NFSE_TEMP): return False
     try:
-        df = _csv_para_df(CSV_NFSE_TEMP, CABECALHO_NFSE)
-        _df_para_excel(df, EXCEL_NFSE_TEMP, "Servicos_NFSe",
-                       "GCON/SIAN — NFS-e — Notas de Serviço")
+        _exportar_excel_sessao(CSV_NFSE_TEMP, EXCEL_NFSE_TEMP, CABECALHO_NFSE, "Servicos_NFSe",
+                               "GCON/SIAN — NFS-e — Notas de Serviço")
         return True
     except Exception as e:
         print(f"Erro sincronizar Excel NFS-e: {e}")
         return False
 
-def atualizar_excel_principal():
+def atualizar_excel_principal(periodo=PERIODO_HISTORICO):
     # Garante que o CSV principal existe antes de gerar Excel
-    if not os.path.exists(CSV_PRINCIPAL):
+    if not tabela_de(CSV_PRINCIPAL) and not segmentos.arquivos(CSV_PRINCIPAL):
         _criar_csv_vazio(CSV_PRINCIPAL, CABECALHO_CSV)
     try:
-        df = _csv_para_df(CSV_PRINCIPAL, CABECALHO_CSV)
+        df = _csv_para_df(CSV_PRINCIPAL, CABECALHO_CSV, periodo)
         _df_para_excel(df, EXCEL_PRINCIPAL, "Produtos_NFe",
                        "GCON/SIAN — NF-e — Produtos e Impostos")
         return True, f"Excel NF-e atualizado ({len(df)} registros)"
     except Exception as e:
         return False, f"Erro Excel NF-e: {e}"
 
-def atualizar_excel_nfse_principal():
+def atualizar_excel_nfse_principal(periodo=PERIODO_HISTORICO):
     # Garante que o CSV principal existe antes de gerar Excel
-    if not os.path.exists(CSV_NFSE_PRINCIPAL):
+    if not tabela_de(CSV_NFSE_PRINCIPAL) and not segmentos.arquivos(CSV_NFSE_PRINCIPAL):
         _criar_csv_vazio(CSV_NFSE_PRINCIPAL, CABECALHO_NFSE)
     try:
-        df = _csv_para_df(CSV_NFSE_PRINCIPAL, CABECALHO_NFSE)
+        df = _csv_para_df(CSV_NFSE_PRINCIPAL, CABECALHO_NFSE, periodo)
         _df_para_excel(df, EXCEL_NFSE_PRINCIPAL, "Servicos_NFSe",
                        "GCON/SIAN — NFS-e — Notas de Serviço")
         return True, f"Excel NFS-e atualizado ({len(df)} registros)"
@@ -283,9 +456,10 @@ def atualizar_excel_nfse_principal():
         return False, f"Erro Excel NFS-e: {e}"
 
 def salvar_excel_sessao():
-    """Após importar XMLs: gera Excel a partir do temp (sessão atual). Não toca no principal."""
-    ok3, m3 = sincronizar_excel_temp()
-    ok4, m4 = sincronizar_excel_nfse_temp()
+    """Após importar XMLs: atualiza o Excel do temp (sessão atual) só com as linhas novas.
+    Não toca no CSV principal."""
+    sincronizar_excel_temp()
+    sincronizar_excel_nfse_temp()
     # Copia os Excels temporários para o local do principal (sobrescreve visualmente)
     resultados = {}
     for excel_temp, excel_principal, label in [
@@ -295,7 +469,7 @@ def salvar_excel_sessao():
         try:
             if os.path.exists(excel_temp):
                 shutil.copy2(excel_temp, excel_principal)
-                n = len(__import__('pandas').read_excel(excel_principal))
+                n = (excel_sessao.ler_meta(excel_temp) or {}).get("linhas", 0)
                 resultados[label] = (True, f"Excel atualizado ({n} registros — sessão atual)")
             else:
                 resultados[label] = (True, "Sem dados para gerar Excel")
@@ -319,83 +493,93 @@ def salvar_tudo():
 # ── Sincronização temp → principal ─────────────────────────────────────────────
 
 def _sincronizar_csv(csv_temp, csv_principal, cabecalho, chave_fn):
+    """Temp → principal: as linhas da sessão viram um segmento novo do
+    histórico (load/segmentos.py) — nada do que já existe é reescrito."""
     try:
         if not os.path.exists(csv_temp):
             return True, "Nenhum dado temporário"
-
-        novas = []
-        for enc in ("utf-8","utf-8-sig","latin-1"):
-            try:
-                with open(csv_temp,"r",encoding=enc) as f:
-                    novas = list(csv.DictReader(f))
-                break
-            except UnicodeDecodeError:
-                continue
-        if not novas:
+        if manifesto.registros(csv_temp) == 0:
             return True, "Nenhum dado novo"
 
-        # Backup do principal antes de qualquer escrita
-        if os.path.exists(csv_principal):
-            nome_backup = os.path.basename(csv_principal).replace(".csv", f"_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-            backup = os.path.join(TEMP_DIR, nome_backup)
-            try: shutil.copy2(csv_principal, backup)
-            except Exception: pass
-
-        if MODO_SESSAO == "substituir":
-            # Sobrescreve o principal com exatamente o que veio desta sessão
-            with open(csv_principal,"w",newline="",encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
-                writer.writeheader()
-                for row in novas:
-                    writer.writerow({c: row.get(c,"") for c in cabecalho})
-            return True, f"{len(novas)} registro(s) salvos (substituição total)"
-
+        enc = detectar_encoding(csv_temp)
+        def _linhas():
+            with open(csv_temp,"r",encoding=enc,newline="") as f:
+                yield from csv.DictReader(f)
+
+        # 1º ponto de backup: o histórico como estava antes desta sincronização
+        if not backup.pontos(csv_principal):
+            _backup(csv_principal, cabecalho, chave_fn)
+
+        # Cubo do dashboard: as linhas publicadas são somadas a ele no caminho.
+        # No SQLite acumulando, o INSERT OR IGNORE não diz quais entraram —
+        # o cubo fica velho e é remontado na próxima leitura.
+        substituir = MODO_SESSAO == "substituir"
+        c = None if tabela_de(csv_principal) and not substituir else \
+            _cubo_para_sincronizar(csv_principal, cabecalho, substituir)
+
+        if tabela_de(csv_principal):
+            ok, msg = _sincronizar_banco(csv_principal, _somando(c, _linhas()))
+            if c is not None:
+                c.gravar(csv_principal, _assinatura(csv_principal))
+            _backup(csv_principal, cabecalho, chave_fn)
+            return ok, msg
+
+        if substituir:
+            # Segmento _substituir: o histórico passa a ser exatamente esta sessão
+            n = segmentos.publicar(csv_principal, _somando(c, _linhas()), cabecalho, chave_fn, substituir=True)
+            msg = f"{n} registro(s) salvos (substituição total)"
         else:
-            # Modo acumular — append deduplicado
-            if not os.path.exists(csv_principal):
-                _criar_csv_vazio(csv_principal, cabecalho)
-            _migrar_csv(csv_principal, cabecalho)
-
-            chaves = set()
-            for enc in ("utf-8","utf-8-sig","latin-1"):
-                try:
-                    with open(csv_principal,"r",encoding=enc) as f:
-                        for row in csv.DictReader(f):
-                            chaves.add(chave_fn(row))
-                    break
-                except UnicodeDecodeError:
-                    continue
-
-            add = 0
-            with open(csv_principal,"a",newline="",encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
-                for row in novas:
+            # Modo acumular — só o que ainda não está no histórico
+            chaves = segmentos.carregar_chaves(csv_principal, chave_fn)
+            def _novas():
+                for row in _linhas():
                     k = chave_fn(row)
                     if k not in chaves:
-                        writer.writerow({c: row.get(c,"") for c in cabecalho})
                         chaves.add(k)
-                        add += 1
-            return True, f"{add} registro(s) sincronizados"
+                        yield row
+            n = segmentos.publicar(csv_principal, _somando(c, _novas()), cabecalho, chave_fn)
+            msg = f"{n} registro(s) sincronizados"
+        if c is not None:
+            c.gravar(csv_principal, _assinatura(csv_principal))
+
+        _backup(csv_principal, cabecalho, chave_fn)
+        segmentos.compactar_em_segundo_plano(csv_principal, cabecalho, chave_fn)
+        return True, msg
 
     except Exception as e:
         return False, f"Erro: {e}"
 
+def _backup(csv_principal, cabecalho, chave_fn):
+    """Ponto de backup incremental (load/backup.py); falha não impede a sincronização."""
+    try:
+        backup.registrar(csv_principal, cabecalho, chave_fn)
+    except Exception as e:
+        print(f"Aviso backup ({os.path.basename(csv_principal)}): {e}")
+
+def _sincronizar_banco(csv_principal, novas):
+    """Mesma sincronização, com o histórico no SQLite: uma transação
+    (DELETE + INSERT no substituir, INSERT OR IGNORE no acumular).
+    novas pode ser um gerador — o executemany consome em streaming."""
+    if MODO_SESSAO == "substituir":
+        n = banco.substituir(csv_principal, novas)
+        return True, f"{n} registro(s) salvos (substituição total)"
+    return True, f"{banco.inserir(csv_principal, novas)} registro(s) sincronizados"
+
 def sincronizar_com_principal():
-    return _sincronizar_csv(
-        CSV_TEMP, CSV_PRINCIPAL, CABECALHO_CSV,
-        lambda r: f"{r.get('Chave_NFe','')}_{r.get('Item','')}_{r.get('cProd','')}",
-    )
+    return _sincronizar_csv(CSV_TEMP, CSV_PRINCIPAL, CABECALHO_CSV, chave_produto)
 
 def sincronizar_nfse_com_principal():
-    return _sincronizar_csv(
-        CSV_NFSE_TEMP, CSV_NFSE_PRINCIPAL, CABECALHO_NFSE,
-        lambda r: f"{r.get('Chave_NFSe','')}_{r.get('Numero_NFSe','')}",
-    )
+    return _sincronizar_csv(CSV_NFSE_TEMP, CSV_NFSE_PRINCIPAL, CABECALHO_NFSE, chave_nfse)
 
 # ── Limpeza ────────────────────────────────────────────────────────────────────
 
 def limpar_temporarios():
-    for c in [CSV_TEMP, EXCEL_TEMP, LOG_TEMP, LOCK_FILE, CSV_NFSE_TEMP, EXCEL_NFSE_TEMP]:
+    for c in [CSV_TEMP, EXCEL_TEMP, LOG_TEMP, LOCK_FILE, CSV_NFSE_TEMP, EXCEL_NFSE_TEMP,
+              caminho_indice(CSV_TEMP), caminho_indice(CSV_NFSE_TEMP),
+              manifesto.caminho_manifesto(CSV_TEMP), manifesto.caminho_manifesto(CSV_NFSE_TEMP),
+              posicoes.caminho_posicoes(CSV_TEMP), posicoes.caminho_posicoes(CSV_NFSE_TEMP),
+              cubo.caminho_cubo(CSV_TEMP), cubo.caminho_cubo(CSV_NFSE_TEMP),
+              excel_sessao.caminho_meta(EXCEL_TEMP), excel_sessao.caminho_meta(EXCEL_NFSE_TEMP)]:
         try:
             if os.path.exists(c): os.remove(c)
         except Exception:
@@ -403,9 +587,10 @@ def limpar_temporarios():
     try:
         agora = time.time()
         for n in os.listdir(TEMP_DIR):
-            # Limpa temporários expirados e backups com mais de 7 dias
+            # Limpa temporários expirados e cópias completas antigas (formato
+            # anterior aos backups incrementais) com mais de 7 dias
             eh_temp   = any(n.startswith(p) for p in ("temp_","lock_"))
-            eh_backup = "_backup_" in n and n.endswith(".csv")
+            eh_backup = "_backup_" in n and n.endswith((".csv", ".db"))
             c = os.path.join(TEMP_DIR, n)
             if not os.path.isfile(c): continue
             idade = agora - os.path.getmtime(c)
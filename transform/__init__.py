@@ -1 +1,5 @@
-﻿from .validator import normalizar_produto, filtrar_novos, carregar_chaves_existentes, chave_produto
+﻿from .validator import (
+    normalizar_produto, filtrar_novos, carregar_chaves_existentes, carregar_chaves,
+    chave_produto, chave_nfse, chave_para, ChavesCompactas,
+)
+from .indice import carregar_indice, registrar_chaves, estado_csv, indexar
@@ -0,0 +1,97 @@
+"""
+transform/agregados.py
+Agregações do dashboard, vetorizadas: cada coluna de valor vira número uma
+única vez (pd.to_numeric, com vírgula decimal normalizada) e o mês sai de
+um fatiamento de texto — nada de apply/lambda por linha.
+
+agregar() reduz as linhas ao cubo (mês × CNPJ × dimensões fiscais, ver
+core/cubo.py); resumo_nfse / resumo_nfe tiram do cubo tudo o que as abas do
+JanelaDashboard desenham (totais, contagens, séries por prestador/mês...).
+O cubo gravado ao lado do CSV tem as mesmas colunas, então o dashboard
+resume direto dele, sem ler o histórico.
+"""
+
+import pandas as pd
+
+from core.cubo import QTD, SEM_MES, esquema
+
+RETENCAO = {"1": "ISS Próprio", "2": "Retido Tomador", "": "Não informado"}
+
+def _texto(serie):
+    return serie.astype("string").fillna("").str.strip()
+
+def numerico(serie):
+    """Texto → float (vazio/inválido = 0). Aceita "1234.56", "1,234.56",
+    "1.234,56" e "1234,56": o separador mais à direita é o decimal."""
+    s = _texto(serie)
+    virgula = s.str.contains(",", regex=False)
+    if virgula.any():
+        decimal = virgula & (s.str.rfind(",") > s.str.rfind("."))
+        s = s.mask(decimal, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+        s = s.mask(virgula & ~decimal, s.str.replace(",", "", regex=False))
+    return pd.to_numeric(s, errors="coerce").fillna(0.0).astype(float)
+
+def mes(serie):
+    """Data ISO → "AAAA-MM" (SEM_MES quando vazia)."""
+    s = _texto(serie)
+    return s.str.slice(0, 7).mask(s.isin(["", "nan"]), SEM_MES)
+
+def agregar(df, cabecalho):
+    """Linhas do CSV → cubo (DataFrame: dimensões, medidas somadas, _qtd)."""
+    dims, meds = esquema(cabecalho)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=list(dims + meds + (QTD,)))
+    base = pd.DataFrame({"Mes": mes(df["Data_Emissao"]).to_numpy(dtype=object)})
+    for d in dims[1:]:
+        base[d] = _texto(df[d]).to_numpy(dtype=object)
+    for m in meds:
+        base[m] = numerico(df[m]).to_numpy()
+    base[QTD] = 1
+    return base.groupby(list(dims), sort=False, as_index=False).sum()
+
+def ler_cubo(caminho, cabecalho):
+    """Cubo gravado por core/cubo.py como DataFrame (mesmas colunas de agregar)."""
+    dims, _ = esquema(cabecalho)
+    return pd.read_csv(caminho, skiprows=1, dtype={d: str for d in dims},
+                       keep_default_na=False, encoding="utf-8")
+
+def _por(cubo, chave, coluna=QTD):
+    """Soma de `coluna` por `chave` (sem as chaves vazias), do maior para o menor."""
+    c = cubo[cubo[chave] != ""]
+    return c.groupby(chave, sort=False)[coluna].sum().sort_values(ascending=False, kind="stable")
+
+def _por_mes(cubo, coluna=QTD):
+    return cubo.groupby("Mes", sort=True)[coluna].sum()
+
+def resumo_nfse(cubo):
+    """Agregados das NFS-e a partir do cubo — None se não há notas."""
+    if cubo is None or cubo.empty:
+        return None
+    _, meds = esquema(cubo.columns)
+    ret = cubo.assign(_ret=cubo["tpRetISSQN"].map(RETENCAO).fillna("Outro"))
+    uf  = cubo.assign(_uf=cubo["UF_Prestador"].replace("", "N/D"))
+    return {
+        "qtd":         int(cubo[QTD].sum()),
+        "totais":      {m: float(cubo[m].sum()) for m in meds},
+        "prestadores": int(cubo.loc[cubo["CNPJ_Prestador"] != "", "CNPJ_Prestador"].nunique()),
+        "retencao":    _por(ret, "_ret"),
+        "formato":     _por(cubo, "Formato").loc[lambda s: s > 0],
+        "uf":          _por(uf, "_uf"),
+        "qtd_prest":   _por(cubo, "Nome_Prestador"),
+        "valor_prest": _por(cubo, "Nome_Prestador", "Valor_Bruto"),
+        "iss_prest":   _por(cubo, "Nome_Prestador", "Valor_ISS"),
+        "valor_cod":   _por(cubo, "cTribNac", "Valor_Bruto"),
+        "mes_valor":   _por_mes(cubo, "Valor_Bruto"),
+        "mes_iss":     _por_mes(cubo, "Valor_ISS"),
+        "mes_qtd":     _por_mes(cubo),
+    }
+
+def resumo_nfe(cubo):
+    """Agregados dos itens de NF-e a partir do cubo — None se não há itens."""
+    if cubo is None or cubo.empty:
+        return None
+    return {
+        "qtd":     int(cubo[QTD].sum()),
+        "valor":   float(cubo["vProd"].sum()),
+        "mes_qtd": _por_mes(cubo),
+    }
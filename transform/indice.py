@@ -0,0 +1,174 @@
+"""
+transform/indice.py
+Índice persistente de chaves de deduplicação, gravado ao lado de cada CSV
+(<arquivo>.csv.chaves). Append-only, atualizado na mesma escrita que o CSV.
+
+Formato: cabeçalho de 32 bytes (magic, tamanho e mtime do CSV indexado,
+nº de chaves) + um digest de 8 bytes (blake2b-64) por chave. Se o CSV mudou
+por fora (tamanho/mtime diferentes do cabeçalho), o índice é reconstruído.
+Colisão de digest com 5M chaves: probabilidade ~1e-6.
+"""
+
+import codecs, csv, gzip, lzma, os, struct
+from array import array
+from hashlib import blake2b
+
+_MAGIC     = b"XPIDX1\0\0"
+_CABECALHO = struct.Struct("<8sQQQ")   # magic, csv_bytes, csv_mtime_ns, n_chaves
+
+def digest(chave):
+    return int.from_bytes(blake2b(chave.encode("utf-8"), digest_size=8).digest(), "little")
+
+def caminho_indice(caminho_csv):
+    return caminho_csv + ".chaves"
+
+def estado_csv(caminho_csv):
+    """(tamanho, mtime_ns) do CSV — ou None se não existe."""
+    try:
+        st = os.stat(caminho_csv)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+# CSV comprimido: a extensão decide (.csv.gz / .csv.xz)
+_COMPRESSORES = {
+    ".gz": lambda c, modo, **kw: gzip.open(c, modo, compresslevel=6, **kw),
+    ".xz": lzma.open,
+}
+
+def abrir(caminho, modo="rb", como=None, **kw):
+    """open() que comprime/descomprime .gz e .xz em streaming, pela extensão
+    de `como` (padrão: o próprio caminho — `como` serve para o .tmp de uma
+    escrita). Use modos explícitos: "rt"/"wt"/"rb"/"wb"."""
+    ext = os.path.splitext(como or caminho)[1]
+    return _COMPRESSORES.get(ext, open)(caminho, modo, **kw)
+
+def comprimido(caminho):
+    return os.path.splitext(caminho)[1] in _COMPRESSORES
+
+def detectar_encoding(caminho):
+    """Primeiro encoding que decodifica o arquivo inteiro — lido em blocos,
+    sem carregar o conteúdo."""
+    for enc in ("utf-8","utf-8-sig","latin-1"):
+        dec = codecs.getincrementaldecoder(enc)()
+        try:
+            with abrir(caminho,"rb") as f:
+                for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                    dec.decode(bloco)
+            dec.decode(b"", final=True)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+def _ler_cabecalho(f):
+    bruto = f.read(_CABECALHO.size)
+    if len(bruto) < _CABECALHO.size:
+        return None
+    magic, tam, mtime, n = _CABECALHO.unpack(bruto)
+    return (tam, mtime, n) if magic == _MAGIC else None
+
+def _gravar(caminho_csv, digests):
+    """Reescreve o índice inteiro (temp + rename) carimbado com o estado atual do CSV."""
+    est = estado_csv(caminho_csv) or (0, 0)
+    a   = digests if isinstance(digests, array) else array("Q", digests)
+    tmp = caminho_indice(caminho_csv) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_CABECALHO.pack(_MAGIC, est[0], est[1], len(a)))
+        f.write(a.tobytes())
+    os.replace(tmp, caminho_indice(caminho_csv))
+    return a
+
+def _digests_do_csv(caminho_csv, chave_fn):
+    for enc in ("utf-8", "utf-8-sig", "latin-1"):
+        try:
+            with abrir(caminho_csv, "rt", encoding=enc) as f:
+                return array("Q", (digest(chave_fn(row)) for row in csv.DictReader(f)))
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            break
+    return array("Q")
+
+def reconstruir_indice(caminho_csv, chave_fn):
+    """Relê o CSV inteiro e regrava o índice. Retorna os digests."""
+    if not os.path.exists(caminho_csv):
+        return array("Q")
+    digests = _digests_do_csv(caminho_csv, chave_fn)
+    try:
+        return _gravar(caminho_csv, digests)
+    except OSError:
+        return digests
+
+def _ler_digests(caminho_csv):
+    """Digests do índice se ele estiver em dia com o CSV; senão None."""
+    est = estado_csv(caminho_csv)
+    try:
+        with open(caminho_indice(caminho_csv), "rb") as f:
+            cab = _ler_cabecalho(f)
+            if cab is None or est is None or cab[:2] != est:
+                return None
+            a = array("Q")
+            a.frombytes(f.read(cab[2] * a.itemsize))
+            return a if len(a) == cab[2] else None
+    except OSError:
+        return None
+
+def contar_chaves(caminho_csv):
+    """Nº de chaves no índice, se ele estiver em dia com o CSV; senão None."""
+    est = estado_csv(caminho_csv)
+    try:
+        with open(caminho_indice(caminho_csv), "rb") as f:
+            cab = _ler_cabecalho(f)
+        return cab[2] if cab is not None and est is not None and cab[:2] == est else None
+    except OSError:
+        return None
+
+def carregar_indice(caminho_csv, chave_fn):
+    """Digests das chaves do CSV: lê o índice (rápido) ou reconstrói se estiver velho."""
+    if not os.path.exists(caminho_csv):
+        return array("Q")
+    digests = _ler_digests(caminho_csv)
+    if digests is None:
+        digests = reconstruir_indice(caminho_csv, chave_fn)
+    return digests
+
+def registrar_chaves(caminho_csv, linhas, chave_fn, antes):
+    """Acrescenta as chaves de `linhas` ao índice logo após o append no CSV.
+    antes = estado_csv() tirado antes do append; se o índice não correspondia
+    a ele, o CSV foi alterado por fora e o índice é reconstruído."""
+    try:
+        with open(caminho_indice(caminho_csv), "r+b") as f:
+            cab = _ler_cabecalho(f)
+            if cab is not None and antes is not None and cab[:2] == antes:
+                novos = array("Q", (digest(chave_fn(r)) for r in linhas))
+                f.seek(_CABECALHO.size + cab[2] * novos.itemsize)
+                f.write(novos.tobytes())
+                f.truncate()
+                est = estado_csv(caminho_csv)
+                f.seek(0)
+                f.write(_CABECALHO.pack(_MAGIC, est[0], est[1], cab[2] + len(novos)))
+                return
+    except OSError:
+        pass
+    reconstruir_indice(caminho_csv, chave_fn)
+
+def indexar(caminho_csv, linhas=(), chave_fn=None):
+    """Índice novo para um CSV recém-(re)escrito com exatamente essas linhas."""
+    try:
+        _gravar(caminho_csv, (digest(chave_fn(r)) for r in linhas))
+    except OSError:
+        pass
+
+def gravar_indice(caminho_csv, digests):
+    """Índice para um CSV recém-escrito cujos digests (na ordem das linhas) já se conhece."""
+    try:
+        _gravar(caminho_csv, digests)
+    except OSError:
+        pass
+
+def remover_indice(caminho_csv):
+    try:
+        os.remove(caminho_indice(caminho_csv))
+    except OSError:
+        pass
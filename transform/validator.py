@@ -1,25 +1,165 @@
-﻿import csv
-import os
+﻿from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np      # vem com o pandas; sem ele a montagem é em Python puro
+except ImportError:
+    np = None
+
 from config.settings import CABECALHO_CSV
+from .indice import carregar_indice, digest
 
 def chave_produto(produto):
     return f"{produto.get('Chave_NFe','')}" f"_{produto.get('Item','')}" f"_{produto.get('cProd','')}"
 
+def chave_nfse(registro):
+    return f"{registro.get('Chave_NFSe','')}_{registro.get('Numero_NFSe','')}"
+
+def chave_para(cabecalho):
+    """Função de chave de deduplicação do CSV com esse cabeçalho."""
+    return chave_nfse if "Chave_NFSe" in cabecalho else chave_produto
+
 def normalizar_produto(produto):
     return {col: produto.get(col, "") for col in CABECALHO_CSV}
 
-def carregar_chaves_existentes(caminho_csv):
-    chaves = set()
-    if not os.path.exists(caminho_csv):
-        return chaves
+# ── Conjunto compacto de chaves ───────────────────────────────────────────────
+# Cada chave vira o digest de 8 bytes do índice (transform/indice.py). As chaves
+# já gravadas ficam num array ordenado (8 bytes/chave) com um filtro de Bloom
+# na frente (~10 bits/chave, 3 sondas): chave nova quase sempre é descartada
+# pelo Bloom sem chegar à busca binária. 5M chaves ≈ 46 MB, contra alguns GB
+# de um set de strings. As chaves adicionadas na execução ficam num set local.
+
+_BITS_POR_CHAVE = 10
+_SONDAS         = 3
+
+def _anexar_shm(nome):
+    """Abre o bloco criado por outro processo (quem cria é quem remove)."""
     try:
-        with open(caminho_csv, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for linha in reader:
-                chaves.add(chave_produto(linha))
-    except Exception:
-        pass
-    return chaves
+        return shared_memory.SharedMemory(name=nome, track=False)   # Python 3.13+
+    except TypeError:
+        # < 3.13: os filhos usam o mesmo resource_tracker do pai, então o
+        # registro repetido não gera remoção extra
+        return shared_memory.SharedMemory(name=nome)
+
+
+class ChavesCompactas:
+    """Conjunto de chaves de deduplicação: `chave in c`, `c.add(chave)`, `len(c)`.
+    compartilhar() move os dados para memória compartilhada — os processos
+    filhos recebem só o nome do bloco e leem a mesma cópia."""
+
+    def __init__(self, digests=()):
+        if np is not None:
+            ordenadas = np.unique(np.frombuffer(array("Q", digests), dtype=np.uint64))
+        else:
+            ordenadas = sorted(set(digests))
+        self._n = len(ordenadas)
+        self._m = max(64, (self._n * _BITS_POR_CHAVE + 7) // 8 * 8)
+        if np is not None:
+            self._bloom     = self._bloom_np(ordenadas)
+            self._ordenadas = array("Q", ordenadas.tobytes())
+        else:
+            self._bloom = bytearray(self._m // 8)
+            for d in ordenadas:
+                for p in self._sondas(d):
+                    self._bloom[p >> 3] |= 1 << (p & 7)
+            self._ordenadas = array("Q", ordenadas)
+        self._novas = set()
+        self._shm   = None
+        self._dono  = False
+
+    def _bloom_np(self, ordenadas):
+        """Mesmas sondas de _sondas(), vetorizadas."""
+        bits = np.zeros(self._m, dtype=bool)
+        h1 = ordenadas & np.uint64(0xFFFFFFFF)
+        h2 = (ordenadas >> np.uint64(32)) | np.uint64(1)
+        for i in range(_SONDAS):
+            bits[(h1 + np.uint64(i) * h2) % np.uint64(self._m)] = True
+        return bytearray(np.packbits(bits, bitorder="little").tobytes())
+
+    def __del__(self):
+        self.liberar()
+
+    def _sondas(self, d):
+        h1, h2 = d & 0xFFFFFFFF, (d >> 32) | 1
+        return [(h1 + i * h2) % self._m for i in range(_SONDAS)]
+
+    def _contem(self, d):
+        if d in self._novas:
+            return True
+        bloom = self._bloom
+        for p in self._sondas(d):
+            if not bloom[p >> 3] & (1 << (p & 7)):
+                return False
+        i = bisect_left(self._ordenadas, d)
+        return i < self._n and self._ordenadas[i] == d
+
+    def __contains__(self, chave):
+        return self._contem(digest(chave))
+
+    def add(self, chave):
+        d = digest(chave)
+        if not self._contem(d):
+            self._novas.add(d)
+
+    def __len__(self):
+        return self._n + len(self._novas)
+
+    # ── Memória compartilhada ─────────────────────────────────────────────────
+
+    def _mapear(self):
+        buf = self._shm.buf
+        self._ordenadas = buf[:self._n * 8].cast("Q")
+        self._bloom     = buf[self._n * 8:self._n * 8 + self._m // 8]
+
+    def compartilhar(self):
+        """Copia array + Bloom para um bloco de memória compartilhada.
+        Quem chamou é o dono: deve chamar liberar() no fim."""
+        if self._shm is not None:
+            return self
+        tam = self._n * 8 + self._m // 8
+        shm = shared_memory.SharedMemory(create=True, size=max(1, tam))
+        shm.buf[:self._n * 8] = self._ordenadas.tobytes()
+        shm.buf[self._n * 8:tam] = self._bloom
+        self._shm, self._dono = shm, True
+        self._mapear()
+        return self
+
+    def __getstate__(self):
+        if self._shm is None:
+            return self.__dict__
+        return {"nome": self._shm.name, "n": self._n, "m": self._m, "novas": self._novas}
+
+    def __setstate__(self, estado):
+        if "nome" not in estado:
+            self.__dict__.update(estado)
+            return
+        self._n, self._m, self._novas = estado["n"], estado["m"], estado["novas"]
+        self._shm, self._dono = _anexar_shm(estado["nome"]), False
+        self._mapear()
+
+    def liberar(self):
+        """Solta o bloco compartilhado (e o remove, se este processo o criou)."""
+        if getattr(self, "_shm", None) is None:
+            return
+        self._ordenadas.release(); self._bloom.release()
+        self._ordenadas, self._bloom = array("Q"), bytearray(8)
+        self._n, self._m = 0, 64
+        try:
+            self._shm.close()
+            if self._dono:
+                self._shm.unlink()
+        except Exception:
+            pass
+        self._shm = None
+
+
+def carregar_chaves(caminho_csv, chave_fn=chave_produto):
+    """ChavesCompactas do CSV pelo índice .chaves ao lado dele (reconstruído se velho)."""
+    return ChavesCompactas(carregar_indice(caminho_csv, chave_fn))
+
+def carregar_chaves_existentes(caminho_csv):
+    return carregar_chaves(caminho_csv, chave_produto)
 
 def filtrar_novos(produtos, chaves_existentes):
     novos = []
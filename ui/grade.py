@@ -0,0 +1,237 @@
+"""
+ui/grade.py
+Grade virtual sobre ttk.Treeview para históricos de milhões de linhas.
+
+O Treeview só tem os itens da janela visível (uma dúzia de linhas
+reaproveitadas) e só as colunas que cabem na largura: rolar troca os valores
+desses itens, buscando a página na fonte (load/paginas.py). Ordenar (clique
+no cabeçalho) e filtrar são feitos pela fonte, não pelo Treeview.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+_ALTURA_CAB = 26   # cabeçalho do Treeview, em pixels (aproximado)
+
+class GradeVirtual(tk.Frame):
+
+    def __init__(self, parent, fonte, larguras=None, estilo=None, numerar=True,
+                 largura_padrao=90, bg="#ffffff", **kw):
+        super().__init__(parent, bg=bg, **kw)
+        self.fonte     = fonte
+        self._larguras = larguras or {}
+        self._padrao   = largura_padrao
+        self._estilo   = f"{estilo}.Treeview" if estilo else "Treeview"
+        self._linha0   = 0            # primeira linha visível (posição na fonte)
+        self._col0     = 0            # primeira coluna visível
+        self._n        = 1            # linhas que cabem na altura
+        self._slots    = []           # colunas visíveis (nomes da fonte)
+        self._itens    = []           # iids reaproveitados, um por linha visível
+        self._ordem    = (None, False)
+        self._marcadas = set()        # linhas selecionadas (posição na fonte)
+        self._pintando = False
+
+        # Filtro
+        barra = tk.Frame(self, bg=bg); barra.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0,4))
+        tk.Label(barra, text="Filtrar:", bg=bg).pack(side="left")
+        self._texto = tk.StringVar()
+        ent = ttk.Entry(barra, textvariable=self._texto, width=32); ent.pack(side="left", padx=4)
+        ent.bind("<Return>", lambda e: self.filtrar())
+        self._coluna = ttk.Combobox(barra, state="readonly", width=22,
+                                    values=["(todas as colunas)"] + list(fonte.colunas))
+        self._coluna.current(0); self._coluna.pack(side="left", padx=4)
+        ttk.Button(barra, text="Filtrar", command=self.filtrar).pack(side="left", padx=2)
+        ttk.Button(barra, text="Limpar",  command=self.limpar_filtro).pack(side="left", padx=2)
+        self._status = tk.Label(barra, text="", bg=bg, fg="#5d6d7e")
+        self._status.pack(side="right", padx=6)
+
+        # Treeview + barras de rolagem próprias (a posição é nossa, não do Treeview)
+        self.tree = ttk.Treeview(self, show="tree headings" if numerar else "headings",
+                                 style=self._estilo, selectmode="extended")
+        if numerar:
+            self.tree.heading("#0", text="#")
+            self.tree.column("#0", width=70, minwidth=50, stretch=False, anchor=tk.E)
+        self.tree.tag_configure("par",   background="#eaf2fb")
+        self.tree.tag_configure("impar", background="#ffffff")
+        self._sb_y = ttk.Scrollbar(self, orient="vertical",   command=self._rolar_y)
+        self._sb_x = ttk.Scrollbar(self, orient="horizontal", command=self._rolar_x)
+        self.grid_rowconfigure(1, weight=1); self.grid_columnconfigure(0, weight=1)
+        self.tree.grid(row=1, column=0, sticky="nsew")
+        self._sb_y.grid(row=1, column=1, sticky="ns")
+        self._sb_x.grid(row=2, column=0, sticky="ew")
+
+        self.tree.bind("<Configure>",        lambda e: self._pintar())
+        self.tree.bind("<MouseWheel>",       self._roda)
+        self.tree.bind("<Shift-MouseWheel>", lambda e: self._rolar_x("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>",         lambda e: self._rolar_y("scroll", -3, "units"))
+        self.tree.bind("<Button-5>",         lambda e: self._rolar_y("scroll",  3, "units"))
+        self.tree.bind("<<TreeviewSelect>>", self._selecionou)
+        self.tree.bind("<Control-c>",        lambda e: self.copiar())
+        for tecla, passo in (("<Prior>", "-p"), ("<Next>", "+p"), ("<Up>", "-1"), ("<Down>", "+1"),
+                             ("<Home>", "ini"), ("<End>", "fim")):
+            self.tree.bind(tecla, lambda e, p=passo: self._tecla(p))
+
+    # ── Geometria ─────────────────────────────────────────────────────────────
+
+    def _altura_linha(self):
+        try:
+            return int(ttk.Style().lookup(self._estilo, "rowheight") or 20)
+        except (tk.TclError, ValueError):
+            return 20
+
+    def _largura(self, coluna):
+        return self._larguras.get(coluna, self._padrao)
+
+    def _colunas_visiveis(self):
+        """Colunas a partir de _col0 que cabem na largura atual (+1 parcial)."""
+        disponivel = max(self.tree.winfo_width(), 200) - (70 if "tree" in str(self.tree["show"]) else 0)
+        cols, usado = [], 0
+        for c in self.fonte.colunas[self._col0:]:
+            cols.append(c); usado += self._largura(c)
+            if usado >= disponivel:
+                break
+        return cols
+
+    # ── Desenho ───────────────────────────────────────────────────────────────
+
+    def _pintar(self):
+        """Ajusta itens/colunas à janela e preenche com a página atual."""
+        if self._pintando:
+            return
+        self._pintando = True
+        try:
+            total = len(self.fonte)
+            self._n = max(1, (self.tree.winfo_height() - _ALTURA_CAB) // self._altura_linha())
+            self._linha0 = max(0, min(self._linha0, total - self._n))
+            self._col0   = max(0, min(self._col0, len(self.fonte.colunas) - 1))
+
+            slots = self._colunas_visiveis()
+            if slots != self._slots:
+                ids = [f"c{k}" for k in range(len(slots))]
+                if list(self.tree["columns"]) != ids:
+                    self.tree["columns"] = ids
+                for k, c in enumerate(slots):
+                    self.tree.column(f"c{k}", width=self._largura(c), minwidth=30,
+                                     stretch=False, anchor=tk.W)
+                self._slots = slots
+            for k, c in enumerate(self._slots):
+                seta = (" ▼" if self._ordem[1] else " ▲") if c == self._ordem[0] else ""
+                self.tree.heading(f"c{k}", text=c + seta, command=lambda c=c: self.ordenar(c))
+
+            valores = self.fonte.valores(self._linha0, self._linha0 + self._n, self._slots)
+            while len(self._itens) < len(valores):
+                self._itens.append(self.tree.insert("", tk.END))
+            while len(self._itens) > len(valores):
+                self.tree.delete(self._itens.pop())
+            visiveis = []
+            for k, (iid, vals) in enumerate(zip(self._itens, valores)):
+                linha = self._linha0 + k
+                self.tree.item(iid, text=f"{linha + 1:,}".replace(",", "."), values=vals,
+                               tags=("par" if linha % 2 == 0 else "impar",))
+                if linha in self._marcadas:
+                    visiveis.append(iid)
+            self.tree.selection_set(visiveis)
+
+            n_cols = max(1, len(self.fonte.colunas))
+            self._sb_y.set(*self._fracao(self._linha0, len(valores), total))
+            self._sb_x.set(*self._fracao(self._col0, len(self._slots), n_cols))
+            fim = self._linha0 + len(valores)
+            self._status.configure(text=f"Linhas {self._linha0 + 1 if total else 0:,}–{fim:,} de {total:,}"
+                                   .replace(",", "."))
+        finally:
+            self._pintando = False
+
+    @staticmethod
+    def _fracao(inicio, n, total):
+        if total <= 0:
+            return 0.0, 1.0
+        return inicio / total, min(1.0, (inicio + n) / total)
+
+    def atualizar(self):
+        self._pintar()
+
+    # ── Rolagem ───────────────────────────────────────────────────────────────
+
+    def _rolar_y(self, acao, qtd, unidade=None):
+        total = len(self.fonte)
+        if acao == "moveto":
+            self._linha0 = int(float(qtd) * total)
+        else:
+            passo = self._n if unidade == "pages" else 1
+            self._linha0 += int(qtd) * passo
+        self._pintar()
+
+    def _rolar_x(self, acao, qtd, unidade=None):
+        if acao == "moveto":
+            self._col0 = int(float(qtd) * len(self.fonte.colunas))
+        else:
+            passo = max(1, len(self._slots) - 1) if unidade == "pages" else 1
+            self._col0 += int(qtd) * passo
+        self._pintar()
+
+    def _roda(self, evento):
+        self._rolar_y("scroll", -3 if evento.delta > 0 else 3, "units")
+        return "break"
+
+    def _tecla(self, passo):
+        if passo == "ini":   self._linha0 = 0
+        elif passo == "fim": self._linha0 = len(self.fonte)
+        elif passo == "-p":  self._linha0 -= self._n
+        elif passo == "+p":  self._linha0 += self._n
+        elif passo == "-1":  self._linha0 -= 1
+        elif passo == "+1":  self._linha0 += 1
+        self._pintar()
+        return "break"
+
+    # ── Seleção ───────────────────────────────────────────────────────────────
+
+    def _selecionou(self, _evento=None):
+        if self._pintando:
+            return
+        na_tela = {self._linha0 + k for k in range(len(self._itens))}
+        escolhidas = {self._linha0 + self._itens.index(i) for i in self.tree.selection()
+                      if i in self._itens}
+        self._marcadas = (self._marcadas - na_tela) | escolhidas
+
+    def linhas_selecionadas(self):
+        """Valores completos (todas as colunas da fonte) das linhas selecionadas."""
+        return [v for linha in sorted(self._marcadas)
+                for v in self.fonte.valores(linha, linha + 1)]
+
+    def copiar(self):
+        linhas = self.linhas_selecionadas()
+        if linhas:
+            self.clipboard_clear()
+            self.clipboard_append("\n".join("\t".join(str(v) for v in l) for l in linhas))
+        return "break"
+
+    # ── Ordenação / filtro (feitos pela fonte) ────────────────────────────────
+
+    def _ocupado(self, acao):
+        self.configure(cursor="watch"); self.update_idletasks()
+        try:
+            acao()
+        finally:
+            self.configure(cursor="")
+        self._linha0, self._marcadas = 0, set()
+        self._pintar()
+
+    def ordenar(self, coluna):
+        decrescente = self._ordem[0] == coluna and not self._ordem[1]
+        self._ordem = (coluna, decrescente)
+        self._ocupado(lambda: self.fonte.ordenar(coluna, decrescente))
+
+    def filtrar(self):
+        coluna = self._coluna.get()
+        coluna = None if coluna.startswith("(") else coluna
+        self._ocupado(lambda: self.fonte.filtrar(self._texto.get().strip(), coluna))
+
+    def limpar_filtro(self):
+        self._texto.set("")
+        self._ocupado(lambda: self.fonte.filtrar(""))
+
+    def destroy(self):
+        try:
+            self.fonte.fechar()
+        finally:
+            super().destroy()
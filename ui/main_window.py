@@ -13,11 +13,12 @@ import multiprocessing as mp
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 from datetime import datetime
 import customtkinter as ctk
-import pandas as pd
 
 import config.settings as cfg
+from core.pipeline import INTERVALO_EVENTOS, iniciar_processamento
 from extract import extrair_produtos, extrair_servicos
 from transform import filtrar_novos, carregar_chaves_existentes
+from transform.agregados import resumo_nfse, resumo_nfe
 from load import (
     inicializar_sessao, verificar_locks_ativos,
     salvar_produtos_csv, salvar_nfse_csv,
@@ -25,9 +26,11 @@ from load import (
     sincronizar_com_principal, sincronizar_nfse_com_principal,
     atualizar_excel_principal, atualizar_excel_nfse_principal,
     limpar_temporarios, total_registros, carregar_chaves_nfse,
-    salvar_tudo, salvar_excel_sessao,
+    salvar_tudo, salvar_excel_sessao, carregar_cubo, tabela_de, composto, paginar,
 )
 from config.settings import CABECALHO_CSV, CABECALHO_NFSE
+from ui.grade import GradeVirtual
+from ui.registro import RegistroLog
 
 # ─── Paleta ───────────────────────────────────────────────────────────────────
 C_PRIM  = "#1a5276"; C_SEC   = "#2980b9"; C_ACENT = "#e67e22"
@@ -38,85 +41,6 @@ C_ERR   = "#c0392b"; C_INFO  = "#2471a3"
 PALETA  = ["#2980b9","#e67e22","#27ae60","#8e44ad",
            "#c0392b","#16a085","#d35400","#1a5276","#7d6608","#117a65"]
 FONTE_LOG = ("Consolas", 10)
-LOTE_MAX  = 500
-
-# ─── Worker de processamento (fora da classe — obrigatório para multiprocessing) ─
-
-def _worker_processar(arquivos, csv_temp, csv_nfse_temp, cabecalho_csv, cabecalho_nfse,
-                      chaves_nfe, chaves_nfse, fila):
-    """Roda em processo separado. Envia eventos para a fila para a UI consumir."""
-    import os, csv as csvmod
-    from extract import extrair_produtos, extrair_servicos
-    from transform import filtrar_novos
-
-    def _tipo(caminho):
-        try:
-            with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
-                t = f.read(600)
-            return "nfse" if any(x in t for x in ["CompNFe","<NFSe","infNFSe","nNFSe"]) else "nfe"
-        except Exception:
-            return "nfe"
-
-    def _salvar(regs, caminho, cabecalho):
-        if not regs: return
-        existe = os.path.exists(caminho) and os.path.getsize(caminho) > 0
-        with open(caminho, "a", newline="", encoding="utf-8") as f:
-            w = csvmod.DictWriter(f, fieldnames=cabecalho, extrasaction="ignore")
-            if not existe: w.writeheader()
-            for r in regs:
-                w.writerow({k: r.get(k, "") for k in cabecalho})
-
-    total = len(arquivos)
-    lote_nfe = []; lote_nfse = []
-    cnt_nfe = cnt_nfse = add_nfe = add_nfse = err_nfe = err_nfse = 0
-
-    def _chave_nfse(r):
-        cnpj_raiz = (r.get('CNPJ_Prestador','') or '').replace('.','').replace('/','').replace('-','')[:8].zfill(8)
-        return f"{r.get('Numero_NFSe','')}_{cnpj_raiz}"
-
-    for i, arq in enumerate(arquivos, 1):
-        nome = os.path.basename(arq)
-        tipo = _tipo(arq)
-
-        if tipo == "nfse":
-            cnt_nfse += 1
-            regs, msg = extrair_servicos(arq)
-            if msg.startswith("ERRO"):
-                err_nfse += 1
-                fila.put(("log", "err", f"  [{i:>4}/{total}] [NFS-e] ⚠  {nome[:48]}  →  {msg[:50]}"))
-            else:
-                novos = [r for r in regs if _chave_nfse(r) not in chaves_nfse]
-                for r in novos:
-                    chaves_nfse.add(_chave_nfse(r))
-                lote_nfse.extend(novos); add_nfse += len(novos)
-                fila.put(("log", "nfse", f"  [{i:>4}/{total}] [NFS-e] {nome[:48]:<50}  {len(novos):>3} novo(s)  [{msg[:30]}]"))
-        else:
-            cnt_nfe += 1
-            regs, msg = extrair_produtos(arq)
-            if msg.startswith("ERRO"):
-                err_nfe += 1
-                fila.put(("log", "err", f"  [{i:>4}/{total}] [NF-e]  ⚠  {nome[:48]}  →  {msg[:50]}"))
-            else:
-                novos, _ = filtrar_novos(regs, chaves_nfe)
-                for r in novos:
-                    chaves_nfe.add(f"{r.get('Chave_NFe','')}_{r.get('Item','')}_{r.get('cProd','')}")
-                lote_nfe.extend(novos); add_nfe += len(novos)
-                fila.put(("log", "nfe", f"  [{i:>4}/{total}] [NF-e]  {nome[:48]:<50}  {len(novos):>3} novo(s)  {len(regs)} itens"))
-
-        # Salva lotes
-        if len(lote_nfe)  >= LOTE_MAX:
-            _salvar(lote_nfe, csv_temp, cabecalho_csv); lote_nfe = []
-        if len(lote_nfse) >= LOTE_MAX:
-            _salvar(lote_nfse, csv_nfse_temp, cabecalho_nfse); lote_nfse = []
-
-        fila.put(("progresso", i, total, cnt_nfe, cnt_nfse))
-
-    # Salva restos
-    _salvar(lote_nfe,  csv_temp,      cabecalho_csv)
-    _salvar(lote_nfse, csv_nfse_temp, cabecalho_nfse)
-    fila.put(("fim", cnt_nfe, cnt_nfse, add_nfe, add_nfse, err_nfe, err_nfse))
-
-
 
 def _detectar_tipo(caminho):
     try:
@@ -149,27 +73,14 @@ def _btn(parent, texto, cmd, bg, hv, **kw):
                      padx=12, pady=5, cursor="hand2",
                      activebackground=hv, activeforeground="white", bd=0, **kw)
 
-def _ler_csv(caminho, cabecalho):
-    """Lê CSV → DataFrame com colunas garantidas.
-    Robusto a cabeçalho antigo: preserva colunas existentes e preenche
-    colunas novas com ''. Retorna None se vazio/inexistente/inválido."""
-    if not os.path.exists(caminho):
-        return None
-    df = None
-    for enc in ("utf-8", "utf-8-sig", "latin-1"):
-        try:
-            df = pd.read_csv(caminho, dtype=str, encoding=enc, on_bad_lines="skip")
-            break
-        except UnicodeDecodeError:
-            continue
-        except Exception:
-            return None
-    if df is None or df.empty:
-        return None
-    # Precisa ter pelo menos uma coluna reconhecida (CSV válido para este tipo)
-    if not (set(df.columns) & set(cabecalho)):
+def _ler_cubo(caminho, cabecalho, periodo=None):
+    """Cubo de agregados do dashboard (load/storage.carregar_cubo) — None se
+    o histórico está vazio/inexistente. periodo = (inicio, fim) de Data_Emissao."""
+    # histórico no SQLite (ARMAZENAMENTO = "sqlite"), partições + segmentos ou CSV comum
+    if not (tabela_de(caminho) or composto(caminho) or os.path.exists(caminho)):
         return None
-    return df.reindex(columns=cabecalho, fill_value="")
+    c = carregar_cubo(caminho, cabecalho, periodo)
+    return None if c.empty else c
 
 # ─── Widgets: Treeview ────────────────────────────────────────────────────────
 
@@ -183,25 +94,16 @@ def _estilo_tree(nome, cor_hdr=None):
     s.map(f"{nome}.Treeview",
           background=[("selected","#d6eaf8")], foreground=[("selected",C_PRIM)])
 
-def _make_tree(parent, colunas, larguras, estilo):
-    """Cria Treeview + scrollbars dentro de parent (usa grid internamente)."""
+def _make_tree(parent, fonte, larguras, estilo):
+    """Cria a grade virtual (Treeview paginado + filtro) dentro de parent
+    (usa grid internamente). fonte = load.paginar(...): só a janela visível
+    de linhas e colunas vai para o Treeview."""
     _estilo_tree(estilo)
-    tree = ttk.Treeview(parent, columns=colunas, show="headings",
-                        style=f"{estilo}.Treeview")
-    for c in colunas:
-        tree.heading(c, text=c)
-        tree.column(c, width=larguras.get(c, 90), anchor=tk.W, minwidth=30)
-    tree.tag_configure("par",   background="#eaf2fb")
-    tree.tag_configure("impar", background=C_F2)
-    sb_y = ttk.Scrollbar(parent, orient="vertical",   command=tree.yview)
-    sb_x = ttk.Scrollbar(parent, orient="horizontal", command=tree.xview)
-    tree.configure(yscrollcommand=sb_y.set, xscrollcommand=sb_x.set)
+    grade = GradeVirtual(parent, fonte, larguras, estilo, bg=C_F2)
     parent.grid_rowconfigure(0, weight=1)
     parent.grid_columnconfigure(0, weight=1)
-    tree.grid(row=0, column=0, sticky="nsew")
-    sb_y.grid(row=0, column=1, sticky="ns")
-    sb_x.grid(row=1, column=0, sticky="ew")
-    return tree
+    grade.grid(row=0, column=0, sticky="nsew")
+    return grade
 
 # ─── Widgets: Gráficos (Canvas puro — sem matplotlib) ─────────────────────────
 
@@ -317,8 +219,11 @@ class PieChart(tk.Frame):
 # ═══════════════════════════════════════════════════════════════════════════════
 
 class JanelaDashboard(tk.Toplevel):
+    """Abre vazia ("Carregando…"); os resumos chegam de uma thread
+    (AplicacaoLeitorXML._carregar_dashboard) e cada aba é desenhada assim
+    que os dados dela ficam prontos."""
 
-    def __init__(self, master, df_nfse, df_nfe=None):
+    def __init__(self, master):
         super().__init__(master)
         self.title("GCON/SIAN — Dashboard Geral")
         self.geometry("1280x880"); self.resizable(True, True)
@@ -328,20 +233,52 @@ class JanelaDashboard(tk.Toplevel):
         top = tk.Frame(self, bg=C_PRIM, height=48); top.pack(fill="x"); top.pack_propagate(False)
         tk.Label(top, text="  DASHBOARD  —  NF-e / NFS-e", bg=C_PRIM,
                  fg="white", font=("Segoe UI",13,"bold")).pack(side="left", padx=14, pady=12)
-        tk.Label(top, text=datetime.now().strftime("Atualizado em %d/%m/%Y %H:%M"),
-                 bg=C_PRIM, fg="#aed6f1", font=("Segoe UI",9)).pack(side="right", padx=14)
+        self._status = tk.Label(top, text="", bg=C_PRIM, fg="#aed6f1", font=("Segoe UI",9))
+        self._status.pack(side="right", padx=14)
         tk.Frame(self, bg=C_ACENT, height=3).pack(fill="x")
 
-        # Notebook de abas (pack)
+        # Notebook de abas (pack); o conteúdo de cada aba é um frame trocado a cada carga
         nb = ttk.Notebook(self); nb.pack(fill="both", expand=True, padx=6, pady=6)
+        self._abas = {}
+        for nome, titulo in (("geral", "  Visão Geral  "), ("nfse", "  NFS-e  "),
+                             ("mensal", "  Evolução Mensal  ")):
+            aba = tk.Frame(nb, bg=C_FUNDO); nb.add(aba, text=titulo)
+            self._abas[nome] = aba
+        self.carregando()
+
+    # ── Estados de carga ──────────────────────────────────────────────────────
+
+    def _conteudo(self, nome):
+        """Esvazia a aba e devolve um frame novo para o conteúdo dela."""
+        aba = self._abas[nome]
+        for w in aba.winfo_children():
+            w.destroy()
+        f = tk.Frame(aba, bg=C_FUNDO); f.pack(fill="both", expand=True)
+        return f
+
+    def carregando(self):
+        self._status.configure(text="Carregando…")
+        for nome in self._abas:
+            tk.Label(self._conteudo(nome), text="Carregando…", bg=C_FUNDO, fg=C_TEX2,
+                     font=("Segoe UI",12)).pack(expand=True)
+
+    def mostrar_nfse(self, nfse):
+        self._aba_nfse(self._conteudo("nfse"), nfse)
+
+    def mostrar_geral(self, nfse, nfe):
+        self._aba_geral(self._conteudo("geral"), nfse, nfe)
 
-        a1 = tk.Frame(nb, bg=C_FUNDO); nb.add(a1, text="  Visão Geral  ")
-        a2 = tk.Frame(nb, bg=C_FUNDO); nb.add(a2, text="  NFS-e  ")
-        a3 = tk.Frame(nb, bg=C_FUNDO); nb.add(a3, text="  Evolução Mensal  ")
+    def mostrar_mensal(self, nfse, nfe):
+        self._aba_mensal(self._conteudo("mensal"), nfse, nfe)
 
-        self._aba_geral(a1, df_nfse, df_nfe)
-        self._aba_nfse(a2, df_nfse)
-        self._aba_mensal(a3, df_nfse, df_nfe)
+    def concluido(self):
+        self._status.configure(text=datetime.now().strftime("Atualizado em %d/%m/%Y %H:%M"))
+
+    def falhou(self, erro):
+        self._status.configure(text="Erro ao carregar")
+        for nome in self._abas:
+            tk.Label(self._conteudo(nome), text=f"Erro ao carregar o dashboard:\n{erro}",
+                     bg=C_FUNDO, fg=C_ERR, font=("Segoe UI",11)).pack(expand=True)
 
     # ── helpers internos ──────────────────────────────────────────────────────
 
@@ -366,17 +303,17 @@ class JanelaDashboard(tk.Toplevel):
 
     # ── Aba Visão Geral ───────────────────────────────────────────────────────
 
-    def _aba_geral(self, parent, df_nfse, df_nfe):
+    def _aba_geral(self, parent, nfse, nfe):
         for c in range(3): parent.grid_columnconfigure(c, weight=1)
         for r in range(3): parent.grid_rowconfigure(r + 1, weight=1)
 
         # Métricas
-        qtd_nfse   = len(df_nfse) if df_nfse is not None else 0
-        qtd_nfe    = len(df_nfe)  if df_nfe  is not None else 0
-        val_nfse   = df_nfse["Valor_Bruto"].apply(_f).sum() if df_nfse is not None else 0
-        val_nfe    = df_nfe["vProd"].apply(_f).sum()        if df_nfe  is not None else 0
-        total_iss  = df_nfse["Valor_ISS"].apply(_f).sum()   if df_nfse is not None else 0
-        qtd_prest  = df_nfse["CNPJ_Prestador"].nunique()    if df_nfse is not None else 0
+        qtd_nfse   = nfse["qtd"] if nfse else 0
+        qtd_nfe    = nfe["qtd"]  if nfe  else 0
+        val_nfse   = nfse["totais"]["Valor_Bruto"] if nfse else 0
+        val_nfe    = nfe["valor"]                  if nfe  else 0
+        total_iss  = nfse["totais"]["Valor_ISS"]   if nfse else 0
+        qtd_prest  = nfse["prestadores"]           if nfse else 0
 
         self._kpi(parent, 0, 0, "TOTAL DOCUMENTOS",    str(qtd_nfse + qtd_nfe), C_PRIM,
                   f"NFS-e: {qtd_nfse}  |  NF-e itens: {qtd_nfe}")
@@ -393,52 +330,31 @@ class JanelaDashboard(tk.Toplevel):
         PieChart(f1, dados_doc, "Documentos por Tipo (Qtd)").grid(sticky="nsew")
 
         # Pizza: ISS retido x não
-        if df_nfse is not None and len(df_nfse):
-            mapa = {"1": "ISS Próprio", "2": "Retido Tomador", "": "Não informado"}
-            cnt  = df_nfse["tpRetISSQN"].fillna("").apply(
-                lambda x: mapa.get(str(x).strip(), "Outro")).value_counts()
-            dados_ret = [(k, int(v)) for k, v in cnt.items()]
-        else:
-            dados_ret = []
+        dados_ret = [(k, int(v)) for k, v in nfse["retencao"].items()] if nfse else []
         f2 = self._grafico_frame(parent, 1, 1)
         PieChart(f2, dados_ret, "ISS — Tipo Retenção (NFS-e)").grid(sticky="nsew")
 
         # Pizza: por formato NFS-e
-        if df_nfse is not None and len(df_nfse):
-            cnt2 = df_nfse["Formato"].value_counts()
-            dados_fmt = [(k, int(v)) for k, v in cnt2.items()]
-        else:
-            dados_fmt = []
+        dados_fmt = [(k, int(v)) for k, v in nfse["formato"].items()] if nfse else []
         f3 = self._grafico_frame(parent, 1, 2)
         PieChart(f3, dados_fmt, "NFS-e por Formato").grid(sticky="nsew")
 
         # Barras: top prestadores por QUANTIDADE
-        if df_nfse is not None and len(df_nfse):
-            top_q = (df_nfse.groupby("Nome_Prestador")
-                     .size().sort_values(ascending=False).head(10))
-            dados_q = [(str(k)[:18], int(v)) for k, v in top_q.items()]
-        else:
-            dados_q = []
+        dados_q = [(str(k)[:18], int(v)) for k, v in nfse["qtd_prest"].head(10).items()] if nfse else []
         f4 = self._grafico_frame(parent, 2, 0, cspan=2)
         BarChart(f4, dados_q, "Top Prestadores — Quantidade de Notas",
                  fmt=lambda v: str(int(v)), cor=C_SEC).grid(sticky="nsew", padx=4, pady=4)
 
         # Barras: top prestadores por VALOR
-        if df_nfse is not None and len(df_nfse):
-            top_v = (df_nfse.groupby("Nome_Prestador")["Valor_Bruto"]
-                     .apply(lambda x: x.apply(_f).sum())
-                     .sort_values(ascending=False).head(10))
-            dados_v = [(str(k)[:18], v) for k, v in top_v.items()]
-        else:
-            dados_v = []
+        dados_v = [(str(k)[:18], v) for k, v in nfse["valor_prest"].head(10).items()] if nfse else []
         f5 = self._grafico_frame(parent, 2, 2)
         BarChart(f5, dados_v, "Top Prestadores — Valor",
                  fmt=lambda v: f"R${v/1000:.0f}k", cor=C_PRIM).grid(sticky="nsew", padx=4, pady=4)
 
     # ── Aba NFS-e ─────────────────────────────────────────────────────────────
 
-    def _aba_nfse(self, parent, df):
-        if df is None or df.empty:
+    def _aba_nfse(self, parent, nfse):
+        if not nfse:
             tk.Label(parent, text="Sem dados NFS-e", bg=C_FUNDO,
                      font=("Segoe UI",12)).pack(expand=True); return
 
@@ -446,96 +362,66 @@ class JanelaDashboard(tk.Toplevel):
         for r in range(3): parent.grid_rowconfigure(r, weight=1)
 
         # Barra de totais
-        bruto = df["Valor_Bruto"].apply(_f).sum()
-        liq   = df["Valor_Liquido"].apply(_f).sum()
-        iss   = df["Valor_ISS"].apply(_f).sum()
-        pis   = df["Valor_PIS"].apply(_f).sum()
-        cof   = df["Valor_COFINS"].apply(_f).sum()
-        irrf  = df["Valor_IRRF"].apply(_f).sum()
-        inss  = df["Valor_INSS"].apply(_f).sum()
-
+        t = nfse["totais"]
         barra = tk.Frame(parent, bg=C_PRIM)
         barra.grid(row=0, column=0, columnspan=2, sticky="ew", padx=4, pady=(4,2))
-        resumo = (f"  Notas: {len(df)}  |  Bruto: R$ {bruto:,.2f}  |  "
-                  f"Líquido: R$ {liq:,.2f}  |  ISS: R$ {iss:,.2f}  |  "
-                  f"PIS: R$ {pis:,.2f}  |  COFINS: R$ {cof:,.2f}  |  "
-                  f"IRRF: R$ {irrf:,.2f}  |  INSS: R$ {inss:,.2f}")
+        resumo = (f"  Notas: {nfse['qtd']}  |  Bruto: R$ {t['Valor_Bruto']:,.2f}  |  "
+                  f"Líquido: R$ {t['Valor_Liquido']:,.2f}  |  ISS: R$ {t['Valor_ISS']:,.2f}  |  "
+                  f"PIS: R$ {t['Valor_PIS']:,.2f}  |  COFINS: R$ {t['Valor_COFINS']:,.2f}  |  "
+                  f"IRRF: R$ {t['Valor_IRRF']:,.2f}  |  INSS: R$ {t['Valor_INSS']:,.2f}")
         tk.Label(barra, text=resumo, bg=C_PRIM, fg="white",
                  font=("Segoe UI",8,"bold"), pady=5).pack(anchor="w")
 
         # Barras: ISS por prestador
-        top_iss = (df.groupby("Nome_Prestador")["Valor_ISS"]
-                   .apply(lambda x: x.apply(_f).sum())
-                   .sort_values(ascending=False).head(8))
-        dados_iss = [(str(k)[:16], v) for k, v in top_iss.items() if v > 0]
+        dados_iss = [(str(k)[:16], v) for k, v in nfse["iss_prest"].head(8).items() if v > 0]
         f1 = self._grafico_frame(parent, 1, 0)
         BarChart(f1, dados_iss, "ISS por Prestador",
                  fmt=lambda v: f"R${v:.0f}", cor=C_ERR).grid(sticky="nsew", padx=4, pady=4)
 
         # Barras: notas por prestador (quantidade)
-        top_qtd = df.groupby("Nome_Prestador").size().sort_values(ascending=False).head(8)
-        dados_qtd = [(str(k)[:16], int(v)) for k, v in top_qtd.items()]
+        dados_qtd = [(str(k)[:16], int(v)) for k, v in nfse["qtd_prest"].head(8).items()]
         f2 = self._grafico_frame(parent, 1, 1)
         BarChart(f2, dados_qtd, "Notas por Prestador (Qtd)",
                  fmt=lambda v: str(int(v)), cor=C_INFO).grid(sticky="nsew", padx=4, pady=4)
 
         # Barras: por código de serviço
-        top_cod = (df.groupby("cTribNac")["Valor_Bruto"]
-                   .apply(lambda x: x.apply(_f).sum())
-                   .sort_values(ascending=False).head(8))
-        dados_cod = [(str(k), v) for k, v in top_cod.items()]
+        dados_cod = [(str(k), v) for k, v in nfse["valor_cod"].head(8).items()]
         f3 = self._grafico_frame(parent, 2, 0)
         BarChart(f3, dados_cod, "Valor por Código de Serviço",
                  fmt=lambda v: f"R${v/1000:.0f}k", cor=C_ACENT).grid(sticky="nsew", padx=4, pady=4)
 
         # Pizza: UF dos prestadores
-        uf_cnt = df["UF_Prestador"].fillna("").replace("","N/D").value_counts().head(6)
-        dados_uf = [(k, int(v)) for k, v in uf_cnt.items()]
+        dados_uf = [(k, int(v)) for k, v in nfse["uf"].head(6).items()]
         f4 = self._grafico_frame(parent, 2, 1)
         PieChart(f4, dados_uf, "Prestadores por UF").grid(sticky="nsew")
 
     # ── Aba Mensal ────────────────────────────────────────────────────────────
 
-    def _aba_mensal(self, parent, df_nfse, df_nfe):
+    def _aba_mensal(self, parent, nfse, nfe):
         for c in range(2): parent.grid_columnconfigure(c, weight=1)
         for r in range(2): parent.grid_rowconfigure(r, weight=1)
 
-        def mes_col(df, col_data, col_val):
-            if df is None or df.empty: return []
-            df2 = df.copy()
-            df2["_m"] = df2[col_data].apply(lambda x: str(x)[:7]
-                                            if x and str(x) not in ("nan","") else "????-??")
-            g = (df2.groupby("_m")[col_val]
-                 .apply(lambda x: x.apply(_f).sum()).sort_index())
-            return [(k, v) for k, v in g.items()]
-
-        def mes_qtd(df, col_data):
-            if df is None or df.empty: return []
-            df2 = df.copy()
-            df2["_m"] = df2[col_data].apply(lambda x: str(x)[:7]
-                                            if x and str(x) not in ("nan","") else "????-??")
-            g = df2.groupby("_m").size().sort_index()
-            return [(k, int(v)) for k, v in g.items()]
+        def serie(resumo, chave, conv=float):
+            return [(k, conv(v)) for k, v in resumo[chave].items()] if resumo else []
 
         f1 = self._grafico_frame(parent, 0, 0)
-        BarChart(f1, mes_col(df_nfse, "Data_Emissao", "Valor_Bruto"),
+        BarChart(f1, serie(nfse, "mes_valor"),
                  "Valor NFS-e por Mês",
                  fmt=lambda v: f"R${v/1000:.0f}k", cor=C_OK).grid(sticky="nsew", padx=4, pady=4)
 
         f2 = self._grafico_frame(parent, 0, 1)
-        BarChart(f2, mes_qtd(df_nfse, "Data_Emissao"),
+        BarChart(f2, serie(nfse, "mes_qtd", int),
                  "Qtd NFS-e por Mês",
                  fmt=lambda v: str(int(v)), cor=C_ACENT).grid(sticky="nsew", padx=4, pady=4)
 
         f3 = self._grafico_frame(parent, 1, 0)
-        BarChart(f3, mes_col(df_nfse, "Data_Emissao", "Valor_ISS"),
+        BarChart(f3, serie(nfse, "mes_iss"),
                  "ISS por Mês",
                  fmt=lambda v: f"R${v:.0f}", cor=C_ERR).grid(sticky="nsew", padx=4, pady=4)
 
         # NF-e por mês (se tiver)
-        dados_nfe_mes = mes_qtd(df_nfe, "Data_Emissao") if df_nfe is not None else []
         f4 = self._grafico_frame(parent, 1, 1)
-        BarChart(f4, dados_nfe_mes,
+        BarChart(f4, serie(nfe, "mes_qtd", int),
                  "Qtd Itens NF-e por Mês",
                  fmt=lambda v: str(int(v)), cor=C_SEC).grid(sticky="nsew", padx=4, pady=4)
 
@@ -559,6 +445,7 @@ class AplicacaoLeitorXML:
         self.cancelar     = False
         self.arquivos     = []
         self._win_dash    = None   # referência ao dashboard aberto
+        self._dash_cancelar = None # Event da carga do dashboard em andamento
 
         locks = verificar_locks_ativos()
         if locks and not messagebox.askyesno("Sessões Ativas",
@@ -567,9 +454,11 @@ class AplicacaoLeitorXML:
         if not inicializar_sessao():
             messagebox.showerror("Erro", "Não foi possível inicializar sessão!"); return
 
+        self._registro = RegistroLog(cfg.LOG_TEMP, cfg.LOG_LINHAS_TELA)
         self._build_sidebar()
         self._build_area_principal()
         self._log_inicial()
+        self._descarregar_log()
         self._iniciar_watcher()
 
     # ─── Sidebar ──────────────────────────────────────────────────────────────
@@ -615,6 +504,8 @@ class AplicacaoLeitorXML:
         tk.Frame(sb, bg=C_SIDE2, height=1).pack(fill="x", padx=16, pady=3)
         sec("VISUALIZAR")
         sbtn("Dashboard Geral",       "◉",  self._ver_dashboard)
+        sbtn("Dados NF-e",            "☰",  lambda: self._ver_dados("nfe"))
+        sbtn("Dados NFS-e",           "☷",  lambda: self._ver_dados("nfse"))
         sbtn("Abrir Excel NF-e",      "⊞",  self._excel_nfe)
         sbtn("Abrir Excel NFS-e",     "⊡",  self._excel_nfse)
         tk.Frame(sb, bg=C_SIDE2, height=1).pack(fill="x", padx=16, pady=3)
@@ -623,7 +514,7 @@ class AplicacaoLeitorXML:
         sbtn("Limpar Sessão",    "⌫", self._limpar_sessao)
         tk.Frame(sb, bg=C_SIDE2, height=1).pack(fill="x", padx=16, pady=3)
         sec("LOG")
-        sbtn("Limpar Log", "✕", lambda: [self.txt_log.delete(1.0, tk.END), self.log("Log limpo.", "info")])
+        sbtn("Limpar Log", "✕", lambda: [self._registro.limpar(self.txt_log), self.log("Log limpo.", "info")])
         sbtn("Salvar Log",  "↓", self._salvar_log)
 
         tk.Frame(sb, bg=C_SIDE).pack(fill="both", expand=True)
@@ -724,20 +615,25 @@ class AplicacaoLeitorXML:
 
     # ─── Log ──────────────────────────────────────────────────────────────────
 
+    # Qualquer thread pode logar: as linhas vão para o RegistroLog (ui/registro.py)
+    # e chegam ao widget em lotes, pelo timer de _descarregar_log.
+
     def log(self, msg, tag="info"):
-        self.txt_log.insert(tk.END, f"[{datetime.now().strftime('%H:%M:%S')}] ", "ts")
-        self.txt_log.insert(tk.END, f"{msg}\n", tag)
-        self.txt_log.see(tk.END); self.janela.update_idletasks()
+        self._registro.linha((f"[{datetime.now().strftime('%H:%M:%S')}] ", "ts"), (msg, tag))
 
     def _div(self, c="─"):
-        self.txt_log.insert(tk.END, f"{c*98}\n", "brd"); self.txt_log.see(tk.END)
+        self._registro.linha((c*98, "brd"))
 
     def _ctr(self, msg, tag="info"):
         p = max(0, (96 - len(msg)) // 2)
-        self.txt_log.insert(tk.END, f"{' '*p}{msg}\n", tag); self.txt_log.see(tk.END)
+        self._registro.linha((f"{' '*p}{msg}", tag))
+
+    def _descarregar_log(self):
+        self._registro.descarregar(self.txt_log)
+        self.janela.after(cfg.LOG_INTERVALO_MS, self._descarregar_log)
 
     def _log_inicial(self):
-        self.txt_log.delete(1.0, tk.END)
+        self._registro.limpar(self.txt_log)
         self._div("="); self._ctr("GCON/SIAN  —  NF-e / NFS-e  —  MULTIUSUÁRIO")
         self._ctr(f"Sessão: {cfg.SESSAO_ID}  |  Usuário: {cfg.USUARIO_ID}")
         self._ctr(datetime.now().strftime("%d/%m/%Y  %H:%M:%S")); self._div("=")
@@ -783,9 +679,11 @@ class AplicacaoLeitorXML:
         if not messagebox.askyesno("Parar", "Parar imediatamente e descartar tudo da sessão atual?"):
             return
         self.cancelar = True
-        if hasattr(self, "_proc") and self._proc and self._proc.is_alive():
-            self._proc.terminate()
-            self._proc.join(timeout=2)
+        for p in [getattr(self, "_proc", None)] + getattr(self, "_extratores", []):
+            if p and p.is_alive():
+                p.terminate()
+                p.join(timeout=2)
+        self._liberar_chaves()
         # Zera o temp
         from load.storage import _criar_csv_vazio
         _criar_csv_vazio(cfg.CSV_TEMP,      cfg.CABECALHO_CSV)
@@ -798,11 +696,38 @@ class AplicacaoLeitorXML:
         self._pv.set(0); self._c_prog.configure(text="0%"); self._c_arqs.configure(text="0")
         self.log("⏹ Processo encerrado. Sessão zerada — pronto para nova importação.", "warn")
 
+    def _liberar_chaves(self):
+        for c in getattr(self, "_chaves", ()):
+            c.liberar()
+        self._chaves = ()
+
+    def _bombear_progresso(self):
+        """Thread do Tk: aplica o último resumo de progresso recebido (um
+        redesenho por tique, não um por arquivo) enquanto há processamento."""
+        estado = self._progresso
+        if estado is not None and estado != self._progresso_mostrado:
+            i, tot, cnt_nfe, cnt_nfse = estado
+            p = i / tot if tot else 0
+            self._pv.set(p); self._c_prog.configure(text=f"{p*100:.0f}%")
+            self._c_proc.configure(text=str(i))
+            self._badge_nfe.configure(text=f"  NF-e: {cnt_nfe}  ")
+            self._badge_nfse.configure(text=f"  NFS-e: {cnt_nfse}  ")
+            self._progresso_mostrado = estado
+        if self.processando:
+            self.janela.after(int(INTERVALO_EVENTOS * 1000), self._bombear_progresso)
+
     def _processar(self):
+        """Roda numa thread: acompanha o pipeline e grava o Excel. Widgets só
+        são tocados via after() — progresso pelo _bombear_progresso, log pelo
+        RegistroLog, o fim por _concluir."""
         self.processando = True
         self.cancelar    = False
-        self.janela.after(0, self._btn_parar.grid)
-        self._c_status.configure(text="PROCESSANDO...", fg=C_WARN)
+        self._progresso  = self._progresso_mostrado = None
+        def _inicio():
+            self._btn_parar.grid()
+            self._c_status.configure(text="PROCESSANDO...", fg=C_WARN)
+            self._bombear_progresso()
+        self.janela.after(0, _inicio)
         total = len(self.arquivos)
 
         self.log(""); self._div("="); self._ctr("INÍCIO DO PROCESSAMENTO"); self._div("=")
@@ -811,18 +736,18 @@ class AplicacaoLeitorXML:
         self.log(f"CSV NFS-e temp      : {os.path.basename(cfg.CSV_NFSE_TEMP)}", "info")
         self.log("")
 
-        chaves_nfe  = carregar_chaves_existentes(cfg.CSV_TEMP)
-        chaves_nfse = carregar_chaves_nfse()
+        # Chaves em memória compartilhada: os processos recebem só o nome do bloco
+        chaves_nfe  = carregar_chaves_existentes(cfg.CSV_TEMP).compartilhar()
+        chaves_nfse = carregar_chaves_nfse().compartilhar()
+        self._chaves = (chaves_nfe, chaves_nfse)
 
         fila = mp.Queue()
-        self._proc = mp.Process(
-            target=_worker_processar,
-            args=(self.arquivos, cfg.CSV_TEMP, cfg.CSV_NFSE_TEMP,
-                  cfg.CABECALHO_CSV, cfg.CABECALHO_NFSE,
-                  chaves_nfe, chaves_nfse, fila),
-            daemon=True
+        self._proc, self._extratores = iniciar_processamento(
+            self.arquivos, cfg.CSV_TEMP, cfg.CSV_NFSE_TEMP,
+            cfg.CABECALHO_CSV, cfg.CABECALHO_NFSE,
+            chaves_nfe, chaves_nfse, fila,
         )
-        self._proc.start()
+        self.log(f"Extratores paralelos: {len(self._extratores)}", "info")
 
         cnt_nfe = cnt_nfse = add_nfe = add_nfse = err_nfe = err_nfse = 0
 
@@ -838,18 +763,12 @@ class AplicacaoLeitorXML:
                 continue
 
             tipo = evento[0]
-            if tipo == "log":
-                _, nivel, msg = evento
-                self.log(msg, nivel)
-            elif tipo == "progresso":
-                _, i, tot, cnfe, cnfse = evento
-                cnt_nfe = cnfe; cnt_nfse = cnfse
-                p = i / tot
-                self._pv.set(p); self._c_prog.configure(text=f"{p*100:.0f}%")
-                self._c_proc.configure(text=str(i))
-                self._badge_nfe.configure(text=f"  NF-e: {cnt_nfe}  ")
-                self._badge_nfse.configure(text=f"  NFS-e: {cnt_nfse}  ")
-                self.janela.update_idletasks()
+            if tipo == "resumo":
+                # linhas de log e progresso acumulados pelo merge (~INTERVALO_EVENTOS)
+                _, linhas, i, tot, cnt_nfe, cnt_nfse = evento
+                for nivel, msg in linhas:
+                    self.log(msg, nivel)
+                self._progresso = (i, tot, cnt_nfe, cnt_nfse)
             elif tipo == "fim":
                 _, cnt_nfe, cnt_nfse, add_nfe, add_nfse, err_nfe, err_nfse = evento
                 break
@@ -858,17 +777,17 @@ class AplicacaoLeitorXML:
             return  # _parar_processamento já fez a limpeza
 
         self._proc.join()
+        for p in self._extratores:
+            p.join()
+        self._liberar_chaves()
 
         # Excel da sessão
         resultado = salvar_excel_sessao()
         for chave, (ok, msg) in resultado.items():
             self.log(f"{chave:12} : {msg}", "ok" if ok else "warn")
 
-        # Atualiza cards
         nfe_total  = total_registros(cfg.CSV_TEMP)
         nfse_total = total_registros(cfg.CSV_NFSE_TEMP)
-        self._c_nfe.configure(text=str(nfe_total))
-        self._c_nfse.configure(text=str(nfse_total))
 
         # Resumo
         self.log(""); self._div("="); self._ctr("RESUMO FINAL"); self._div("=")
@@ -879,43 +798,23 @@ class AplicacaoLeitorXML:
         self.log(f"NFS-e adicionadas : {add_nfse} notas    (total sessão: {nfse_total})", "nfse")
         self._div("=")
 
-        self._c_status.configure(text="CONCLUÍDO", fg=C_OK)
-        messagebox.showinfo("Concluído",
-                            f"NF-e : {cnt_nfe} arqs  →  {add_nfe} produtos novos\n"
-                            f"NFS-e: {cnt_nfse} arqs  →  {add_nfse} notas novas\n"
-                            + (f"Erros: {err_nfe+err_nfse}" if err_nfe+err_nfse else "Sem erros!"))
-        if self._win_dash and self._win_dash.winfo_exists():
-            self.log("Atualizando Dashboard…", "info"); self._ver_dashboard()
+        aviso = (f"NF-e : {cnt_nfe} arqs  →  {add_nfe} produtos novos\n"
+                 f"NFS-e: {cnt_nfse} arqs  →  {add_nfse} notas novas\n"
+                 + (f"Erros: {err_nfe+err_nfse}" if err_nfe+err_nfse else "Sem erros!"))
+        self.janela.after(0, lambda: self._concluir(nfe_total, nfse_total, aviso))
 
+    def _concluir(self, nfe_total, nfse_total, aviso):
+        """Thread do Tk: fim do processamento (cards, aviso, dashboard)."""
+        self._c_nfe.configure(text=str(nfe_total))
+        self._c_nfse.configure(text=str(nfse_total))
+        self._c_status.configure(text="CONCLUÍDO", fg=C_OK)
         self.processando = False; self.arquivos = []; self.cancelar = False
-        self.janela.after(0, self._btn_parar.grid_remove)
+        self._btn_parar.grid_remove()
         self._btn_parar.configure(text="⏹ Parar", state="normal")
         self._c_arqs.configure(text="0"); self._pv.set(0); self._c_prog.configure(text="0%")
-        """Se já houver dados na sessão, pergunta se quer substituir ou adicionar.
-        Retorna True para continuar, False para cancelar."""
-        nfe  = total_registros(cfg.CSV_TEMP)
-        nfse = total_registros(cfg.CSV_NFSE_TEMP)
-        if nfe == 0 and nfse == 0:
-            return True  # sessão vazia — pode importar direto
-        resp = messagebox.askyesnocancel(
-            "Sessão com dados",
-            f"A sessão atual já tem dados:\n\n"
-            f"  NF-e : {nfe} registro(s)\n"
-            f"  NFS-e: {nfse} registro(s)\n\n"
-            f"Sim    → Substituir (zera a sessão e importa os novos)\n"
-            f"Não    → Adicionar (mantém os existentes e acrescenta)\n"
-            f"Cancelar → Voltar"
-        )
-        if resp is None:
-            return False  # Cancelar
-        if resp:  # Sim → zera o temp antes de importar
-            from load.storage import _criar_csv_vazio
-            _criar_csv_vazio(cfg.CSV_TEMP,      cfg.CABECALHO_CSV)
-            _criar_csv_vazio(cfg.CSV_NFSE_TEMP, cfg.CABECALHO_NFSE)
-            self._c_nfe.configure(text="0")
-            self._c_nfse.configure(text="0")
-            self.log("Sessão substituída — dados anteriores removidos.", "warn")
-        return True  # Não → adiciona normalmente
+        messagebox.showinfo("Concluído", aviso)
+        if self._win_dash and self._win_dash.winfo_exists():
+            self.log("Atualizando Dashboard…", "info"); self._ver_dashboard()
 
     def _confirmar_sessao(self):
         """Se já houver dados na sessão, pergunta se quer substituir ou adicionar.
@@ -966,58 +865,78 @@ class AplicacaoLeitorXML:
 
 
     def _csv_nfse(self):
-        """Retorna o melhor CSV NFS-e disponível: temp (se tiver dados) > principal."""
-        for caminho in (cfg.CSV_NFSE_TEMP, cfg.CSV_NFSE_PRINCIPAL):
-            if not os.path.exists(caminho) or os.path.getsize(caminho) < 50:
-                continue
-            # Verificar se tem ao menos 2 linhas (cabeçalho + 1 dado)
-            try:
-                with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
-                    linhas = sum(1 for _ in f)
-                if linhas >= 2:
-                    return caminho
-            except Exception:
-                continue
-        return None
-
-
-
-    def _csv_nfse(self):
-        """Retorna o melhor CSV NFS-e disponível: temp > principal."""
+        """Retorna o melhor histórico NFS-e disponível: temp > principal (CSV ou SQLite)."""
         for caminho in (cfg.CSV_NFSE_TEMP, cfg.CSV_NFSE_PRINCIPAL):
-            if not os.path.exists(caminho) or os.path.getsize(caminho) < 50:
-                continue
-            try:
-                with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
-                    if sum(1 for _ in f) >= 2:
-                        return caminho
-            except Exception:
-                continue
+            if total_registros(caminho) >= 1:
+                return caminho
         return None
 
     def _csv_nfe(self):
-        """Retorna o melhor CSV NF-e disponível: temp > principal."""
+        """Retorna o melhor histórico NF-e disponível: temp > principal (CSV ou SQLite)."""
         for caminho in (cfg.CSV_TEMP, cfg.CSV_PRINCIPAL):
-            if not os.path.exists(caminho) or os.path.getsize(caminho) < 50:
-                continue
-            try:
-                with open(caminho, "r", encoding="utf-8", errors="ignore") as f:
-                    if sum(1 for _ in f) >= 2:
-                        return caminho
-            except Exception:
-                continue
+            if total_registros(caminho) >= 1:
+                return caminho
         return None
 
+    @staticmethod
+    def _periodo(caminho):
+        """PERIODO_HISTORICO vale só para o histórico principal; a sessão é mostrada inteira."""
+        return cfg.PERIODO_HISTORICO if caminho in (cfg.CSV_PRINCIPAL, cfg.CSV_NFSE_PRINCIPAL) else None
+
+    def _cancelar_dashboard(self):
+        if self._dash_cancelar:
+            self._dash_cancelar.set()
+
     def _ver_dashboard(self):
-        if self._win_dash and self._win_dash.winfo_exists():
-            self._win_dash.destroy()
+        """Abre (ou reaproveita) o dashboard em "Carregando…" e lê os cubos
+        numa thread. Um pedido novo cancela a carga anterior."""
         csv_nfse = self._csv_nfse()
         csv_nfe  = self._csv_nfe()
         if csv_nfse is None and csv_nfe is None:
             messagebox.showwarning("Aviso", "Sem dados para exibir.\nImporte XMLs primeiro."); return
-        df_nfse = _ler_csv(csv_nfse, CABECALHO_NFSE) if csv_nfse else None
-        df_nfe  = _ler_csv(csv_nfe,  CABECALHO_CSV)  if csv_nfe  else None
-        self._win_dash = JanelaDashboard(self.janela, df_nfse, df_nfe)
+        self._cancelar_dashboard()
+        cancelar = self._dash_cancelar = threading.Event()
+        if self._win_dash and self._win_dash.winfo_exists():
+            self._win_dash.carregando(); self._win_dash.lift()
+        else:
+            self._win_dash = JanelaDashboard(self.janela)
+        threading.Thread(target=self._carregar_dashboard, daemon=True,
+                         args=(self._win_dash, csv_nfse, csv_nfe, cancelar)).start()
+
+    def _carregar_dashboard(self, win, csv_nfse, csv_nfe, cancelar):
+        """Thread: cubo → resumo de cada tipo; cada aba vai para a tela (via
+        after) assim que tem o que precisa. Cancelada, nada mais é entregue."""
+        def entregar(acao, *args):
+            def _na_tela():
+                if not cancelar.is_set() and win.winfo_exists():
+                    acao(*args)
+            if not cancelar.is_set():
+                self.janela.after(0, _na_tela)
+        try:
+            nfse = resumo_nfse(_ler_cubo(csv_nfse, CABECALHO_NFSE, self._periodo(csv_nfse))) if csv_nfse else None
+            if cancelar.is_set(): return
+            entregar(win.mostrar_nfse, nfse)
+            nfe = resumo_nfe(_ler_cubo(csv_nfe, CABECALHO_CSV, self._periodo(csv_nfe))) if csv_nfe else None
+            if cancelar.is_set(): return
+            entregar(win.mostrar_geral, nfse, nfe)
+            entregar(win.mostrar_mensal, nfse, nfe)
+            entregar(win.concluido)
+        except Exception as e:
+            entregar(win.falhou, str(e))
+
+    def _ver_dados(self, tipo):
+        csv, cab = (self._csv_nfe(), CABECALHO_CSV) if tipo == "nfe" else (self._csv_nfse(), CABECALHO_NFSE)
+        if csv is None:
+            messagebox.showwarning("Aviso", "Sem dados para exibir.\nImporte XMLs primeiro."); return
+        fonte = paginar(csv, cab, self._periodo(csv))
+        win = tk.Toplevel(self.janela)
+        win.title(f"GCON/SIAN — Dados {'NF-e' if tipo == 'nfe' else 'NFS-e'} — {len(fonte):,} registros")
+        win.geometry("1280x760"); win.configure(bg=C_FUNDO)
+        corpo = tk.Frame(win, bg=C_F2); corpo.pack(fill="both", expand=True, padx=8, pady=8)
+        larguras = {"Chave_NFe": 330, "Chave_NFSe": 330, "xProd": 260, "Discriminacao": 300,
+                    "Nome_Emitente": 220, "Nome_Destinatario": 220, "Nome_Prestador": 220,
+                    "Nome_Tomador": 220, "Data_Emissao": 170, "Arquivo_Origem": 220}
+        _make_tree(corpo, fonte, larguras, "Dados")
 
     def _excel_nfe(self):
         csv = self._csv_nfe()
@@ -1025,7 +944,7 @@ class AplicacaoLeitorXML:
             messagebox.showwarning("Aviso", "Sem dados NF-e. Importe XMLs primeiro."); return
         # Gera Excel a partir do melhor CSV disponível
         from load.storage import _csv_para_df, _df_para_excel
-        df = _csv_para_df(csv, CABECALHO_CSV)
+        df = _csv_para_df(csv, CABECALHO_CSV, self._periodo(csv))
         _df_para_excel(df, cfg.EXCEL_TEMP, "Produtos_NFe", "GCON/SIAN — NF-e — Produtos e Impostos")
         self.log(f"Excel NF-e gerado: {len(df)} registros", "ok")
         os.startfile(cfg.EXCEL_TEMP)
@@ -1035,7 +954,7 @@ class AplicacaoLeitorXML:
         if csv is None:
             messagebox.showwarning("Aviso", "Sem dados NFS-e. Importe XMLs primeiro."); return
         from load.storage import _csv_para_df, _df_para_excel
-        df = _csv_para_df(csv, CABECALHO_NFSE)
+        df = _csv_para_df(csv, CABECALHO_NFSE, self._periodo(csv))
         _df_para_excel(df, cfg.EXCEL_NFSE_TEMP, "Servicos_NFSe", "GCON/SIAN — NFS-e — Notas de Serviço")
         self.log(f"Excel NFS-e gerado: {len(df)} registros", "ok")
         os.startfile(cfg.EXCEL_NFSE_TEMP)
@@ -1073,6 +992,7 @@ class AplicacaoLeitorXML:
         self._c_nfse.configure(text="0")
         self.log("Sessão limpa. NF-e e NFS-e zerados.", "warn")
         # Fecha janelas abertas pois os dados foram zerados
+        self._cancelar_dashboard()
         if self._win_dash and self._win_dash.winfo_exists(): self._win_dash.destroy()
 
     def _fechar(self):
@@ -1103,7 +1023,8 @@ class AplicacaoLeitorXML:
             defaultextension=".txt", filetypes=[("Texto","*.txt")],
             initialfile=f"log_{cfg.USUARIO_ID}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
         if arq:
-            with open(arq, "w", encoding="utf-8") as f: f.write(self.txt_log.get(1.0, tk.END))
+            # a tela só tem as últimas LOG_LINHAS_TELA linhas; o completo está em LOG_TEMP
+            self._registro.salvar_em(arq)
             self.log(f"Log salvo: {arq}", "ok")
 
     def _iniciar_watcher(self):
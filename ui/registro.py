@@ -0,0 +1,83 @@
+"""
+ui/registro.py
+Modelo do log de processamento: qualquer thread acrescenta linhas; a tela
+recebe em lotes (um insert por descarga, disparado por timer no Tk) e guarda
+só as últimas `limite` linhas. O log completo é gravado em arquivo por uma
+thread própria — nem o widget nem o disco seguram quem está logando.
+"""
+
+import queue, shutil, threading, tkinter as tk
+from collections import deque
+
+class RegistroLog:
+
+    def __init__(self, caminho, limite):
+        self.caminho  = caminho
+        self.limite   = max(1, limite)
+        self._novas   = deque(maxlen=self.limite)   # anel: o que ainda não foi para a tela
+        self._lock    = threading.Lock()
+        self._arquivo = queue.SimpleQueue()
+        self._gravado = threading.Condition()
+        self._enviadas = self._escritas = 0
+        threading.Thread(target=self._gravar, name="log", daemon=True).start()
+
+    def linha(self, *segmentos):
+        """segmentos = (texto, tag), ... — uma linha do log (sem o \\n)."""
+        with self._lock:
+            self._novas.append(segmentos)
+            self._enviadas += 1
+        self._arquivo.put("".join(t for t, _ in segmentos) + "\n")
+
+    # ── Arquivo ───────────────────────────────────────────────────────────────
+
+    def _gravar(self):
+        while True:
+            bloco = [self._arquivo.get()]
+            while len(bloco) < 5000:
+                try:
+                    bloco.append(self._arquivo.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.caminho, "a", encoding="utf-8") as f:
+                    f.writelines(bloco)
+            except OSError:
+                pass
+            with self._gravado:
+                self._escritas += len(bloco)
+                self._gravado.notify_all()
+
+    def salvar_em(self, destino, espera=10.0):
+        """Copia o log completo (espera a thread gravar o que já foi logado)."""
+        with self._lock:
+            alvo = self._enviadas
+        with self._gravado:
+            self._gravado.wait_for(lambda: self._escritas >= alvo, timeout=espera)
+        shutil.copyfile(self.caminho, destino)
+
+    # ── Tela ──────────────────────────────────────────────────────────────────
+
+    def descarregar(self, texto):
+        """Leva as linhas pendentes para o widget Text num único insert e
+        corta o começo para ficar em `limite` linhas. Só na thread do Tk."""
+        with self._lock:
+            novas = list(self._novas)
+            self._novas.clear()
+        if not novas:
+            return
+        args = []
+        for segmentos in novas:
+            for t, tag in segmentos[:-1]:
+                args += [t, tag]
+            t, tag = segmentos[-1]
+            args += [t + "\n", tag]
+        texto.insert(tk.END, *args)
+        excesso = int(texto.index("end-1c").split(".")[0]) - 1 - self.limite
+        if excesso > 0:
+            texto.delete("1.0", f"{excesso + 1}.0")
+        texto.see(tk.END)
+
+    def limpar(self, texto):
+        with self._lock:
+            self._novas.clear()
+        texto.delete("1.0", tk.END)